@@ -0,0 +1,33 @@
+import numpy as np
+
+from waveform_analysis.freq_estimation import (freq_from_autocorr,
+                                               freq_from_crossings,
+                                               freq_from_fft, freq_from_hps)
+
+from .common import FS, LENGTHS, test_signal
+
+
+class FrequencyEstimation:
+    params = [LENGTHS, ['float32', 'float64']]
+    param_names = ['samples', 'dtype']
+    timeout = 600
+
+    def setup(self, samples, dtype):
+        self.signal = test_signal(samples, dtype=dtype)
+        self.dtype = getattr(np, dtype)
+
+    def time_freq_from_crossings(self, samples, dtype):
+        freq_from_crossings(self.signal, FS, dtype=self.dtype)
+
+    def time_freq_from_fft(self, samples, dtype):
+        freq_from_fft(self.signal, FS, dtype=self.dtype)
+
+    def time_freq_from_autocorr(self, samples, dtype):
+        freq_from_autocorr(self.signal, FS, dtype=self.dtype)
+
+    def time_freq_from_autocorr_bounded(self, samples, dtype):
+        freq_from_autocorr(self.signal, FS, fmin=20, fmax=20000,
+                           dtype=self.dtype)
+
+    def time_freq_from_hps(self, samples, dtype):
+        freq_from_hps(self.signal, FS, dtype=self.dtype)
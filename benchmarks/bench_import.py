@@ -0,0 +1,36 @@
+"""
+Time to import the package, which every script and worker process pays
+
+Each is timed in a fresh interpreter, with asv's timeraw_ benchmarks.
+"""
+
+
+def timeraw_import_package():
+    return """
+    import waveform_analysis
+    """
+
+
+def timeraw_dB():
+    return """
+    from waveform_analysis import dB
+    dB(0.5)
+    """
+
+
+def timeraw_import_thd():
+    return """
+    from waveform_analysis import THD
+    """
+
+
+def timeraw_import_weighting():
+    return """
+    from waveform_analysis import A_weight
+    """
+
+
+def timeraw_choose_loader():
+    return """
+    from waveform_analysis._common import wav_loader
+    """
@@ -0,0 +1,49 @@
+import os
+import shutil
+import tempfile
+
+import numpy as np
+from scipy.io import wavfile
+
+from waveform_analysis._common import blocks, load
+
+from .common import FS, LENGTHS, test_signal
+
+# Full-scale values of integer sample formats
+_FULL_SCALE = {'int16': 2**15, 'int32': 2**31}
+
+
+class Load:
+    params = [LENGTHS, [1, 2], ['int16', 'int32', 'float32']]
+    param_names = ['samples', 'channels', 'dtype']
+    timeout = 600
+
+    def setup(self, samples, channels, dtype):
+        signal = test_signal(samples, channels, 'float32')
+        if dtype in _FULL_SCALE:
+            signal = np.round(signal * _FULL_SCALE[dtype]).astype(dtype)
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'test.wav')
+        wavfile.write(self.filename, FS, signal)
+
+    def teardown(self, samples, channels, dtype):
+        shutil.rmtree(self.directory)
+
+    def time_load(self, samples, channels, dtype):
+        load(self.filename)
+
+    def time_load_float32(self, samples, channels, dtype):
+        load(self.filename, dtype=np.float32)
+
+    def time_load_mmap(self, samples, channels, dtype):
+        np.asarray(load(self.filename, mmap=True)['signal'])
+
+    def time_load_channel(self, samples, channels, dtype):
+        load(self.filename, channels=0)
+
+    def time_blocks(self, samples, channels, dtype):
+        for block in blocks(self.filename, 2**16):
+            pass
+
+    def peakmem_load(self, samples, channels, dtype):
+        load(self.filename)
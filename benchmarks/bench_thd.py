@@ -0,0 +1,21 @@
+import numpy as np
+
+from waveform_analysis import THD, THDN
+
+from .common import FS, LENGTHS, test_signal
+
+
+class Distortion:
+    params = [LENGTHS, [1, 2], ['float32', 'float64']]
+    param_names = ['samples', 'channels', 'dtype']
+    timeout = 600
+
+    def setup(self, samples, channels, dtype):
+        self.signal = test_signal(samples, channels, dtype)
+        self.dtype = getattr(np, dtype)
+
+    def time_THD(self, samples, channels, dtype):
+        THD(self.signal, FS, axis=0, dtype=self.dtype)
+
+    def time_THDN(self, samples, channels, dtype):
+        THDN(self.signal, FS, axis=0, dtype=self.dtype)
@@ -0,0 +1,41 @@
+import importlib.util
+import os
+
+from waveform_analysis.results import levels
+
+from .common import FS, LENGTHS, test_signal
+
+# The scripts aren't installed with the package, so use the ones in this
+# checkout
+_path = os.path.join(os.path.dirname(__file__), os.pardir, 'scripts',
+                     'wave_analyzer.py')
+_spec = importlib.util.spec_from_file_location('wave_analyzer', _path)
+wave_analyzer = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(wave_analyzer)
+
+
+class Properties:
+    """
+    Measuring and formatting the properties of each channel, as
+    wave_analyzer.py does for a file
+    """
+    params = [LENGTHS, [1, 2]]
+    param_names = ['samples', 'channels']
+    timeout = 600
+
+    def setup(self, samples, channels):
+        self.signal = test_signal(samples, channels)
+
+    def time_properties(self, samples, channels):
+        self.properties()
+
+    def peakmem_properties(self, samples, channels):
+        self.properties()
+
+    def properties(self):
+        measurements = levels(self.signal, FS)
+        if self.signal.ndim == 1:
+            return wave_analyzer.properties(measurements)
+        return [wave_analyzer.properties(
+                    wave_analyzer.channel_levels(measurements, channel))
+                for channel in range(self.signal.shape[1])]
@@ -0,0 +1,32 @@
+import numpy as np
+
+from waveform_analysis import A_weight, ITU_R_468_weight, clear_filter_cache
+
+from .common import FS, LENGTHS, test_signal
+
+
+class Weighting:
+    params = [LENGTHS, [1, 2], ['float32', 'float64']]
+    param_names = ['samples', 'channels', 'dtype']
+    timeout = 600
+
+    def setup(self, samples, channels, dtype):
+        # Channels along the last axis, as the weighting functions expect
+        self.signal = test_signal(samples, channels, dtype).T
+        self.dtype = getattr(np, dtype)
+
+    def time_A_weight(self, samples, channels, dtype):
+        A_weight(self.signal, FS, self.dtype)
+
+    def time_ITU_R_468_weight(self, samples, channels, dtype):
+        ITU_R_468_weight(self.signal, FS, self.dtype)
+
+
+class FilterDesign:
+    def time_A_weight_uncached(self):
+        clear_filter_cache()
+        A_weight(test_signal(10), FS)
+
+    def time_ITU_R_468_weight_uncached(self):
+        clear_filter_cache()
+        ITU_R_468_weight(test_signal(10), FS)
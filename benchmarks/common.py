@@ -0,0 +1,33 @@
+"""
+Synthetic test signals for the benchmarks, generated locally and
+reproducibly, so no downloads are needed
+"""
+
+import numpy as np
+
+# Sampling rate of the test signals
+FS = 48000
+
+# Signal lengths in samples.  The longest take a while and need a few GB of
+# memory; choose with `asv run --bench`.
+LENGTHS = [10**3, 10**5, 10**7, 10**8]
+
+# Fundamental frequency of the test signals
+FREQUENCY = 997
+
+
+def test_signal(samples, channels=1, dtype='float64'):
+    """
+    A slightly distorted sine wave with noise, scaled to [-1, +1)
+
+    1-D for one channel, and of shape (samples, channels) otherwise, like
+    load().  Each channel has a different level of distortion.
+    """
+    rng = np.random.default_rng(0)
+    phase = 2 * np.pi * FREQUENCY / FS * np.arange(samples)
+    signal = np.empty((samples, channels), dtype)
+    for channel in range(channels):
+        signal[:, channel] = (0.5 * np.sin(phase) +
+                              0.001 * (channel + 1) * np.sin(3 * phase) +
+                              1e-4 * rng.standard_normal(samples))
+    return signal[:, 0] if channels == 1 else signal
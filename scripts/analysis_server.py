@@ -0,0 +1,28 @@
+#!/usr/bin/env python
+
+import argparse
+import asyncio
+
+from waveform_analysis.server import serve
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Serve analysis jobs from a pool of worker processes, "
+                    "which stay loaded between jobs")
+    address = parser.add_mutually_exclusive_group(required=True)
+    address.add_argument("--socket",
+                         help="Path of a Unix socket to listen on")
+    address.add_argument("--port", type=int,
+                         help="TCP port to listen on")
+    parser.add_argument("--host", default='127.0.0.1',
+                        help="Address to listen on with --port "
+                             "(default: 127.0.0.1)")
+    parser.add_argument("--workers", type=int,
+                        help="Number of worker processes (default: number "
+                             "of CPUs)")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(serve(args.socket, args.host, args.port, args.workers))
+    except KeyboardInterrupt:
+        pass
@@ -1,8 +1,10 @@
+import argparse
 import sys
 from time import time
 
 from waveform_analysis._common import analyze_channels
 from waveform_analysis.freq_estimation import freq_from_fft
+from waveform_analysis.profiling import profile_to
 
 
 def freq_wrapper(signal, fs):
@@ -11,18 +13,30 @@ def freq_wrapper(signal, fs):
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Measure frequency")
+    parser.add_argument("filenames", nargs='*',
+                        help="Path(s) to the sound file(s) to analyze")
+    parser.add_argument("--profile", action="store_true",
+                        help="Print the time taken by each stage of the "
+                             "analysis")
+    parser.add_argument("--profile-json", metavar='FILE',
+                        help="Save the time taken by each stage of the "
+                             "analysis to a JSON file")
+    args = parser.parse_args()
     try:
-        files = sys.argv[1:]
+        files = args.filenames
         if files:
-            for filename in files:
-                try:
-                    start_time = time()
-                    analyze_channels(filename, freq_wrapper)
-                    print(f'\nTime elapsed: {time() - start_time:.3f} s\n')
+            with profile_to(args.profile, args.profile_json):
+                for filename in files:
+                    try:
+                        start_time = time()
+                        analyze_channels(filename, freq_wrapper)
+                        print(f'\nTime elapsed: {time() - start_time:.3f} '
+                              's\n')
 
-                except IOError:
-                    print(f"Couldn't analyze \"{filename}\"\n")
-                print('')
+                    except IOError:
+                        print(f"Couldn't analyze \"{filename}\"\n")
+                    print('')
         else:
             sys.exit("You must provide at least one file to analyze")
     except BaseException as e:
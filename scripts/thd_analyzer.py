@@ -1,7 +1,9 @@
+import argparse
 from math import log10
 from time import time
 
 from waveform_analysis._common import analyze_channels
+from waveform_analysis.profiling import profile_to
 from waveform_analysis.thd import THD, THDN
 
 
@@ -35,9 +37,19 @@ def thd_analyzer(files):
 
 if __name__ == '__main__':
     import sys
+    parser = argparse.ArgumentParser(description="Measure THD and THD+N")
+    parser.add_argument("filenames", nargs='*',
+                        help="Path(s) to the sound file(s) to analyze")
+    parser.add_argument("--profile", action="store_true",
+                        help="Print the time taken by each stage of the "
+                             "analysis")
+    parser.add_argument("--profile-json", metavar='FILE',
+                        help="Save the time taken by each stage of the "
+                             "analysis to a JSON file")
+    args = parser.parse_args()
     try:
-        files = sys.argv[1:]
-        thd_analyzer(files)
+        with profile_to(args.profile, args.profile_json):
+            thd_analyzer(args.filenames)
     except BaseException as e:
         print('Error:')
         print(e)
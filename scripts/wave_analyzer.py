@@ -5,10 +5,12 @@ import importlib.util
 import math
 import sys
 
-from numpy import absolute, array_equal, mean
-
-from waveform_analysis import A_weight, ITU_R_468_weight
-from waveform_analysis._common import dB, load, rms_flat, wav_loader
+from waveform_analysis._common import (blocks, channel_groups, dB, info,
+                                       load, wav_loader)
+from waveform_analysis.profiling import profile_to
+from waveform_analysis.realtime import (DeviceSource, FileSource,
+                                        LiveAnalyzer, StreamSource)
+from waveform_analysis.results import BLOCKSIZE, LevelMeter
 
 has_easygui = importlib.util.find_spec("easygui") is not None
 if has_easygui:
@@ -71,43 +73,27 @@ def histogram(signal):
         show()
 
 
-def properties(signal, sample_rate):
+def properties(measurements):
     """
-    Return a list of some wave properties for a given 1-D signal.
+    Return a list of some wave properties for one channel.
 
     Parameters:
     -----------
-    signal : np.ndarray
-        The input signal to analyze.
-    sample_rate : float
-        The sampling rate of the input signal.
+    measurements : dict
+        Levels of the channel, as returned by
+        waveform_analysis.results.levels().
 
     Returns:
     --------
     list
         A list of strings containing the analyzed properties of the input signal.
     """
-    # Measurements that include DC component
-    DC_offset = mean(signal)
-    # Maximum/minimum sample value
-    # Estimate of true bit rate
-
-    # Remove DC component
-    signal -= mean(signal)
-
-    # Measurements that don't include DC
-    # TODO: Account for intersample peaks and use dBTP
-    signal_level = rms_flat(signal)
-    peak_level = max(absolute(signal))
+    DC_offset = measurements['dc_offset']
+    signal_level = measurements['rms']
+    peak_level = measurements['peak']
     crest_factor = peak_level/signal_level
-
-    # Apply the A-weighting filter to the signal
-    Aweighted = A_weight(signal, sample_rate)
-    Aweighted_level = rms_flat(Aweighted)
-
-    # Apply the ITU-R 468 weighting filter to the signal
-    ITUweighted = ITU_R_468_weight(signal, sample_rate)
-    ITUweighted_level = rms_flat(ITUweighted)
+    Aweighted_level = measurements['rms_a']
+    ITUweighted_level = measurements['rms_468']
 
     # TODO: rjust instead of tabs
 
@@ -126,9 +112,15 @@ def properties(signal, sample_rate):
     ]
 
 
+def channel_levels(measurements, ch_no):
+    """
+    Select the levels of one channel from multi-channel measurements.
+    """
+    return {name: value[ch_no] for name, value in measurements.items()}
+
+
 def analyze(filename, gui):
-    soundfile = load(filename)
-    signal = soundfile['signal']
+    soundfile = info(filename)
     channels = soundfile['channels']
     sample_rate = soundfile['fs']
     samples = soundfile['samples']
@@ -152,33 +144,103 @@ def analyze(filename, gui):
         SEPARATOR,
     ]
 
+    # Measure all channels in a single pass over the file, grouping those
+    # that are identical, until they're all known to be different
+    meter = LevelMeter(sample_rate)
+
+    def metered_blocks():
+        for block in blocks(filename, BLOCKSIZE):
+            meter.process(block)
+            yield block
+
+    file_blocks = metered_blocks()
+    groups = channel_groups(file_blocks, channels)
+    for block in file_blocks:
+        pass  # Finish measuring the rest of the file
+    measurements = meter.results()
+
     if channels == 1:
         # Monaural
-        results += properties(signal, sample_rate)
-    elif channels == 2:
-        # Stereo
-        if array_equal(signal[:, 0], signal[:, 1]):
-            results += ['Left and Right channels are identical:']
-            results += properties(signal[:, 0], sample_rate)
-        else:
-            results += ['Left channel:']
-            results += properties(signal[:, 0], sample_rate)
-            results += ['Right channel:']
-            results += properties(signal[:, 1], sample_rate)
+        results += properties(measurements)
     else:
-        # Multi-channel
-        for ch_no, channel in enumerate(signal.transpose()):
-            results += [f'Channel {ch_no + 1}:']
-            results += properties(channel, sample_rate)
+        # Identical channels are only shown once
+        for group in groups:
+            if len(group) > 1:
+                if channels == 2:
+                    results += ['Left and Right channels are identical:']
+                else:
+                    names = ', '.join(str(ch_no + 1) for ch_no in group)
+                    results += [f'Channels {names} are identical:']
+            elif channels == 2:
+                # Stereo
+                results += [f'{("Left", "Right")[group[0]]} channel:']
+            else:
+                # Multi-channel
+                results += [f'Channel {group[0] + 1}:']
+            results += properties(channel_levels(measurements, group[0]))
 
     display(header, results, gui)
 
     plot_histogram = False
     if plot_histogram:
-        histogram(signal)
+        histogram(load(filename)['signal'])
+
+
+def live_line(seconds, ch_no, measurements):
+    """
+    Return one line of live measurements of one channel.
+    """
+    rms = measurements['rms']
+    return (f'{seconds:8.2f} s  Channel {ch_no + 1}:  '
+            f'DC {measurements["dc_offset"] * 100:+.3f}%  '
+            f'Peak {dB(measurements["peak"]):.2f} dBFS  '
+            f'RMS {dB(rms * rt2):.2f} dBFS  '
+            f'A {dB(measurements["rms_a"] * rt2):.2f} dBFS(A)  '
+            f'468 {dB(measurements["rms_468"] * rt2):.2f} dBFS(468)  '
+            f'{measurements["frequency"]:.3f} Hz  '
+            f'THD {measurements["thd"] * 100:.4f}%')
+
+
+def live_analyzer(source):
+    """
+    Display measurements of live input as each block arrives.
+
+    Runs until the input ends, or until interrupted with Ctrl+C.
+
+    Parameters
+    ----------
+    source : iterable
+        Source of blocks of samples, from waveform_analysis.realtime.
+
+    Returns
+    -------
+    None
+    """
+    analyzer = LiveAnalyzer(source.fs, source.channels)
+    print('RMS dBFS values are relative to a full-scale sine wave (AES17)')
+    print(SEPARATOR)
+    print('Live input')
+    print(f'Channels:\t{source.channels}')
+    print(f'Sampling rate:\t{source.fs} Hz')
+    print(SEPARATOR)
+
+    samples = 0
+    try:
+        for block in source:
+            readings = analyzer.process(block)
+            samples += len(block)
+            for ch_no in range(source.channels):
+                print(live_line(samples / source.fs, ch_no,
+                                channel_levels(readings, ch_no)), flush=True)
+    except KeyboardInterrupt:
+        pass
+
+    print(SEPARATOR)
+    print(f'{analyzer.blocks} blocks, {analyzer.overruns} processed slower '
+          'than real time')
 
 
-def wave_analyzer(files, gui):
+def wave_analyzer(files, gui, source=None):
     """
     Analyze one or more audio files and display their properties.
 
@@ -188,6 +250,9 @@ def wave_analyzer(files, gui):
         List of file paths to analyze.
     gui : bool
         If True, attempt to use GUI for output display.
+    source : iterable, optional
+        If no files are given, source of live input to analyze instead, from
+        waveform_analysis.realtime.
 
     Returns
     -------
@@ -209,8 +274,9 @@ def wave_analyzer(files, gui):
                 raise SystemExit('Unexpected error analyzing '
                                  f'"{filename}": {str(e)}')
             print('')
+    elif source is not None:
+        live_analyzer(source)
     else:
-        # TODO: realtime analyzer goes here
         raise SystemExit(
             "You must provide at least one file to analyze:\n"
             "python wave_analyzer.py filename.wav [filename2.wav ...]")
@@ -218,10 +284,61 @@ def wave_analyzer(files, gui):
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Analyze waveform properties")
-    parser.add_argument("filenames", nargs='+',
+    parser.add_argument("filenames", nargs='*',
                         help="Path(s) to the wave file(s) to analyze")
     parser.add_argument("--gui", action="store_true",
                         help="Use GUI for output if available")
+    parser.add_argument("--profile", action="store_true",
+                        help="Print the time taken by each stage of the "
+                             "analysis")
+    parser.add_argument("--profile-json", metavar='FILE',
+                        help="Save the time taken by each stage of the "
+                             "analysis to a JSON file")
+    live = parser.add_argument_group(
+        "live input",
+        "Analyze live input from a sound device, or with --stdin, raw PCM "
+        "from standard input.  With a filename, replay it as live input.")
+    live.add_argument("--live", action="store_true",
+                      help="Analyze live input instead of files")
+    live.add_argument("--stdin", action="store_true",
+                      help="Read raw interleaved PCM from standard input")
+    live.add_argument("--rate", type=int, default=48000,
+                      help="Sampling rate in Hz (default: 48000)")
+    live.add_argument("--channels", type=int, default=1,
+                      help="Number of channels (default: 1)")
+    live.add_argument("--dtype", default='int16',
+                      help="Sample format of raw PCM, such as int16, int32 "
+                           "or float32 (default: int16)")
+    live.add_argument("--blocksize", type=int, default=4096,
+                      help="Number of samples per block (default: 4096)")
+    live.add_argument("--device",
+                      help="Sound device to record from (default: default "
+                           "input)")
     args = parser.parse_args()
 
-    wave_analyzer(args.filenames, gui=args.gui)
+    source = None
+    if args.live:
+        if len(args.filenames) > 1:
+            parser.error('--live can only replay one file')
+        try:
+            if args.stdin:
+                source = StreamSource(args.rate, args.channels, args.dtype,
+                                      args.blocksize)
+            elif args.filenames:
+                source = FileSource(args.filenames[0], args.blocksize)
+            else:
+                device = args.device
+                if device is not None and device.isdigit():
+                    device = int(device)  # Index rather than name
+                source = DeviceSource(args.rate, args.channels,
+                                      args.blocksize, device)
+        except FileNotFoundError:
+            raise SystemExit(f'File not found: "{args.filenames[0]}"')
+        except Exception as e:
+            raise SystemExit(f'Could not open live input: {str(e)}')
+        args.filenames = []
+    elif not args.filenames:
+        parser.error('the following arguments are required: filenames')
+
+    with profile_to(args.profile, args.profile_json):
+        wave_analyzer(args.filenames, gui=args.gui, source=source)
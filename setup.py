@@ -9,5 +9,5 @@ setup(name='waveform-analysis',
       url='https://github.com/endolith/waveform-analysis',
       author_email='endolith@gmail.com',
       license='MIT',
-      packages=find_packages(),
+      packages=find_packages(exclude=['benchmarks', 'tests']),
       zip_safe=False)
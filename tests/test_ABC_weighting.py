@@ -5,7 +5,9 @@ from scipy import signal
 from scipy.interpolate import interp1d
 
 # This package must first be installed with `pip install -e .` or similar
-from waveform_analysis import A_weight, A_weighting, ABC_weighting
+from waveform_analysis import (A_weight, A_weighting, ABC_weighting,
+                               AWeightFilter, ITU_R_468_weighting,
+                               clear_filter_cache, filter_cache_info)
 
 # It will plot things for sanity-checking if MPL is installed
 try:
@@ -160,12 +162,14 @@ class TestAWeighting:
 
 
 class TestAWeight:
-    def test_freq_resp(self):
+    @pytest.mark.parametrize('dtype', [np.float64, np.float32])
+    def test_freq_resp(self, dtype):
         # Test that frequency response meets tolerance from ANSI S1.4-1983
         N = 40000
         fs = 300000
         impulse = signal.unit_impulse(N)
-        out = A_weight(impulse, fs)
+        out = A_weight(impulse, fs, dtype)
+        assert out.dtype == dtype
         freq = np.fft.rfftfreq(N, 1/fs)
         levels = 20 * np.log10(abs(np.fft.rfft(out)))
 
@@ -182,5 +186,72 @@ class TestAWeight:
         assert all(np.greater_equal(levels, responses['A'] + lower_limits))
 
 
+class TestAWeightFilter:
+    def test_blocks(self):
+        # Filtering in blocks should match filtering all at once
+        fs = 48000
+        rng = np.random.default_rng(0)
+        noise = rng.standard_normal(10000)
+        expected = A_weight(noise, fs)
+
+        a_filter = AWeightFilter(fs)
+        out = np.concatenate([a_filter.process(block) for block in
+                              np.array_split(noise, [1, 1000, 1001, 7777])])
+        assert np.allclose(out, expected, rtol=0, atol=1e-12)
+
+        # Starting over gives the same output again
+        a_filter.reset()
+        assert np.allclose(a_filter.process(noise), expected,
+                           rtol=0, atol=1e-12)
+
+    def test_channels(self):
+        # 2-D blocks are (samples, channels), each filtered independently
+        fs = 44100
+        rng = np.random.default_rng(1)
+        noise = rng.standard_normal((5000, 3))
+
+        a_filter = AWeightFilter(fs)
+        out = np.concatenate([a_filter.process(noise[:2500]),
+                              a_filter.process(noise[2500:])])
+        assert out.shape == noise.shape
+        for channel in range(3):
+            expected = A_weight(noise[:, channel], fs)
+            assert np.allclose(out[:, channel], expected, rtol=0, atol=1e-12)
+
+
+class TestFilterCache:
+    def test_cache(self):
+        clear_filter_cache()
+        sos = A_weighting(44100, output='sos')
+        assert np.array_equal(A_weighting(44100, 'sos'), sos)
+        assert np.array_equal(A_weighting(fs=44100, output='sos'), sos)
+        assert not np.array_equal(A_weighting(48000, output='sos'), sos)
+        A_weighting(44100)
+        A_weighting(44100, 'ba')
+        ITU_R_468_weighting(44100, 'zpk')
+
+        info = filter_cache_info()
+        assert info['A_weighting'].hits == 3
+        assert info['A_weighting'].misses == 3
+        assert info['A_weighting'].currsize == 3
+        assert info['ITU_R_468_weighting'].misses == 1
+        # Analog prototype is only designed once for all sampling rates
+        assert info['ABC_weighting'].misses == 1
+
+        clear_filter_cache()
+        assert filter_cache_info()['A_weighting'].currsize == 0
+
+    def test_cache_not_modified(self):
+        # Modifying a returned design must not change later results
+        z, p, k = A_weighting(48000, 'zpk')
+        z_copy = z.copy()
+        z[:] = 0
+        assert np.array_equal(A_weighting(48000, 'zpk')[0], z_copy)
+
+        z, p, k = ABC_weighting('B')
+        z[:] = 1
+        assert not np.any(ABC_weighting('B')[0])
+
+
 if __name__ == '__main__':
     pytest.main([__file__])
@@ -5,8 +5,9 @@ from scipy import signal
 from scipy.interpolate import interp1d
 
 # This package must first be installed with `pip install -e .` or similar
-from waveform_analysis import (ITU_R_468_weight, ITU_R_468_weighting,
-                               ITU_R_468_weighting_analog)
+from waveform_analysis import (ITU_R_468_weight, ITU_R_468_WeightFilter,
+                               ITU_R_468_weighting,
+                               ITU_R_468_weighting_analog, QuasiPeakDetector)
 
 # It will plot things for sanity-checking if MPL is installed
 try:
@@ -41,6 +42,20 @@ lower_limits = np.array((
     -0.2, -0.4, -0.6, -0.8, -1.2, -1.4, -1.6, -2.0, -float('inf')
 ))
 
+# Rec. ITU-R BS.468-4 Table 2: reading of single 5 kHz tone bursts relative
+# to a steady tone of the same amplitude
+# (duration in s, reading in dB, tolerance in dB)
+bursts = (
+    (0.200, -0.6, 0.5),
+    (0.100, -1.2, 0.5),
+    (0.050, -1.8, 0.5),
+    (0.020, -3.6, 1.0),
+    (0.010, -6.0, 1.0),
+    (0.005, -9.0, 1.0),
+    (0.002, -13.3, 2.0),
+    (0.001, -17.0, 2.0),
+)
+
 
 class TestITU468WeightingAnalog:
     def test_invalid_params(self):
@@ -129,12 +144,14 @@ class TestITU468Weight:
         with pytest.raises(TypeError):
             ITU_R_468_weight('change this')
 
-    def test_freq_resp(self):
+    @pytest.mark.parametrize('dtype', [np.float64, np.float32])
+    def test_freq_resp(self, dtype):
         # Test that frequency response meets tolerance from ITU-R BS.468-4
         N = 12000
         fs = 300000
         impulse = signal.unit_impulse(N)
-        out = ITU_R_468_weight(impulse, fs)
+        out = ITU_R_468_weight(impulse, fs, dtype)
+        assert out.dtype == dtype
         freq = np.fft.rfftfreq(N, 1/fs)
         levels = 20 * np.log10(abs(np.fft.rfft(out)))
 
@@ -151,6 +168,70 @@ class TestITU468Weight:
         assert all(np.greater_equal(levels, responses + lower_limits))
 
 
+class TestITU468WeightFilter:
+    def test_blocks(self):
+        # Filtering in blocks should match filtering all at once
+        fs = 48000
+        rng = np.random.default_rng(0)
+        noise = rng.standard_normal((10000, 2))
+
+        weighting = ITU_R_468_WeightFilter(fs)
+        out = np.concatenate([weighting.process(block) for block in
+                              np.array_split(noise, [1, 1000, 1001, 7777])])
+        assert out.shape == noise.shape
+        for channel in range(2):
+            expected = ITU_R_468_weight(noise[:, channel], fs)
+            assert np.allclose(out[:, channel], expected, rtol=0, atol=1e-12)
+
+
+def tone_burst(duration, fs, f=5000, total=1.5):
+    """
+    Generate a sine wave burst of `duration` seconds, followed by silence
+    """
+    t = np.arange(int(total * fs)) / fs
+    return np.sin(2*pi * f * t) * (t < duration)
+
+
+class TestQuasiPeakDetector:
+    @pytest.mark.parametrize("fs", (44100, 48000, 96000))
+    def test_steady_sine(self, fs):
+        # A continuous sine wave reads its peak amplitude
+        for amplitude in (1, 0.01):
+            for f in (1000, 5000):
+                detector = QuasiPeakDetector(fs)
+                reading = detector.process(amplitude *
+                                           tone_burst(3, fs, f, total=3))
+                assert reading[-1] == pytest.approx(amplitude, rel=0.005)
+                assert detector.peak == pytest.approx(amplitude, rel=0.005)
+
+    def test_blocks(self):
+        fs = 44100
+        bursts = np.stack((tone_burst(0.05, fs, 1000),
+                           tone_burst(0.2, fs, 3000)), axis=1)
+
+        expected = QuasiPeakDetector(fs).process(bursts)
+        assert expected.shape == bursts.shape
+
+        detector = QuasiPeakDetector(fs)
+        out = np.concatenate([detector.process(block) for block in
+                              np.array_split(bursts, [1, 500, 501, 30000])])
+        assert np.allclose(out, expected)
+        assert np.array_equal(detector.peak, expected.max(axis=0))
+
+        detector.reset()
+        assert detector.peak is None
+
+    @pytest.mark.parametrize("fs", (44100, 48000, 96000))
+    @pytest.mark.parametrize("duration, level, tolerance", bursts)
+    def test_bursts(self, fs, duration, level, tolerance):
+        detector = QuasiPeakDetector(fs)
+        reading = detector.process(tone_burst(duration, fs))
+        assert 20*np.log10(detector.peak) == pytest.approx(level,
+                                                           abs=tolerance)
+        # and the reading decays afterwards
+        assert reading[-1] < detector.peak
+
+
 if __name__ == '__main__':
     # Without capture sys it doesn't work sometimes, I'm not sure why.
     pytest.main([__file__, "--capture=sys"])
@@ -0,0 +1,118 @@
+import os
+import time
+
+import numpy as np
+import pytest
+
+from waveform_analysis._common import load
+from waveform_analysis.batch import BatchResult, analyze_files
+from waveform_analysis.freq_estimation import freq_from_fft
+
+# Get the test files directory
+tests_dir = os.path.dirname(__file__)
+test_files_dir = os.path.join(tests_dir, 'test_files')
+
+
+def peak(signal, fs):
+    return np.max(np.abs(signal), axis=0)
+
+
+def slow(signal, fs):
+    time.sleep(10)
+
+
+def stubborn(signal, fs):
+    try:
+        time.sleep(10)
+    except Exception:
+        pass
+
+
+def crash(signal, fs):
+    # Kill the worker process, like a segfault, for the 48 kHz file only
+    if fs == 48000:
+        os._exit(1)
+    return peak(signal, fs)
+
+
+class TestAnalyzeFiles:
+    def test_per_channel(self):
+        files = [os.path.join(test_files_dir, filename) for filename in (
+            "1234 Hz -12.3 dB Ocenaudio 16-bit.wav",
+            "test-44100Hz-2ch-32bit-float-le.wav",
+            "test-44100Hz-le-1ch-4bytes.wav",
+        )]
+        results = analyze_files(files, freq_from_fft, per_channel=True,
+                                workers=2)
+        assert all(isinstance(result, BatchResult) for result in results)
+        assert [(result.filename, result.channel) for result in results] == [
+            (files[0], 0), (files[1], 0), (files[1], 1), (files[2], 0)]
+        assert all(result.error is None for result in results)
+
+        for result in results:
+            soundfile = load(result.filename)
+            signal = soundfile['signal']
+            if signal.ndim == 2:
+                signal = signal[:, result.channel]
+            assert result.value == freq_from_fft(signal, soundfile['fs'])
+
+    def test_whole_files(self):
+        files = [os.path.join(test_files_dir, filename) for filename in (
+            "test-8000Hz-le-4ch-9S-12bit.wav",
+            "test-8000Hz-le-2ch-1byteu.wav",
+        )]
+        results = analyze_files(files, peak, workers=1)
+        assert [result.channel for result in results] == [None, None]
+        for result in results:
+            assert np.array_equal(result.value,
+                                  peak(load(result.filename)['signal'], None))
+
+    def test_errors(self):
+        # Errors are captured, and don't disturb the other results
+        good = os.path.join(test_files_dir, "test-44100Hz-le-1ch-4bytes.wav")
+        bad = os.path.join(test_files_dir,
+                           "test-44100Hz-le-1ch-4bytes-incomplete-chunk.wav")
+        missing = os.path.join(test_files_dir, "nonexistent.wav")
+        for per_channel in (False, True):
+            results = analyze_files([bad, good, missing], peak,
+                                    per_channel=per_channel, workers=2)
+            assert [result.filename for result in results] == [
+                bad, good, missing]
+            assert results[0].error and results[2].error
+            assert results[0].value is None
+            assert results[1].error is None
+            assert results[1].value == pytest.approx(0.707, abs=0.01)
+
+    @pytest.mark.skipif(not hasattr(__import__('signal'), 'setitimer'),
+                        reason="Requires POSIX interval timers")
+    def test_timeout(self):
+        good = os.path.join(test_files_dir, "test-44100Hz-le-1ch-4bytes.wav")
+        start = time.time()
+        results = analyze_files([good, good], slow, workers=2, timeout=0.5)
+        assert time.time() - start < 5
+        assert all('Timed out' in result.error for result in results)
+
+        # Even if the function catches exceptions
+        results = analyze_files([good], stubborn, timeout=0.5)
+        assert 'Timed out' in results[0].error
+
+    def test_crash(self):
+        # A dead worker is reported for its own file, and doesn't stop the
+        # others
+        crashing = os.path.join(test_files_dir,
+                                "1234 Hz -12.3 dB Ocenaudio 16-bit.wav")
+        good = os.path.join(test_files_dir, "test-44100Hz-le-1ch-4bytes.wav")
+        files = [good, crashing, good, good, crashing, good]
+        results = analyze_files(files, crash, workers=2)
+        assert [result.filename for result in results] == files
+        for result in results:
+            if result.filename == crashing:
+                assert 'BrokenProcessPool' in result.error
+                assert result.value is None
+            else:
+                assert result.error is None
+                assert result.value == pytest.approx(0.707, abs=0.01)
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, "--capture=sys"])
@@ -1,10 +1,16 @@
 import os
+import subprocess
+import sys
 
 import numpy as np
 import pytest
 
-from waveform_analysis._common import (analyze_channels, dB, find, load,
-                                       parabolic, parabolic_polyfit, rms_flat)
+from waveform_analysis import _common
+from waveform_analysis._common import (MappedSignal, analyze_channels,
+                                       blocks, channel_groups, dB, find, info,
+                                       load, parabolic, parabolic_batch,
+                                       parabolic_polyfit, rms_flat,
+                                       wav_loader)
 
 # Get the test files directory
 tests_dir = os.path.dirname(__file__)
@@ -41,6 +47,105 @@ class TestLoad:
         else:
             assert soundfile['signal'].shape[1] == expected_channels
 
+    @pytest.mark.parametrize("filename", [
+        "1234 Hz -12.3 dB Ocenaudio 16-bit.wav",
+        "1234 Hz -12.3 dB Ocenaudio 24-bit.wav",  # Can't be memory-mapped
+        "test-44100Hz-2ch-32bit-float-be.wav",
+        "test-8000Hz-le-2ch-1byteu.wav",
+        "test-8000Hz-le-4ch-9S-12bit.wav",
+    ])
+    def test_load_mmap(self, filename):
+        """
+        Test that memory-mapped signals scale to the same values as normal
+        loading, whether read whole, by channel, or by time window
+        """
+        filepath = os.path.join(test_files_dir, filename)
+        mapped = load(filepath, mmap=True)
+        signal = mapped['signal']
+        assert isinstance(signal, MappedSignal)
+
+        expected = load(filepath)
+        if wav_loader == 'scipy.io.wavfile':
+            assert mapped['format'] == expected['format']
+            assert np.array_equal(signal, expected['signal'])
+        else:
+            # libsndfile scales some formats slightly differently
+            assert np.allclose(signal, expected['signal'], atol=1e-7)
+
+        assert signal.shape == expected['signal'].shape
+        assert len(signal) == mapped['samples'] == expected['samples']
+        assert mapped['channels'] == expected['channels']
+        assert mapped['fs'] == expected['fs']
+
+        whole = np.asarray(signal)
+        assert whole.dtype == signal.dtype
+        assert np.array_equal(signal[10:20], whole[10:20])
+        if signal.ndim == 2:
+            assert np.array_equal(signal[:, 1], whole[:, 1])
+
+    @pytest.mark.parametrize("filename", [
+        "1234 Hz -12.3 dB Ocenaudio 16-bit.wav",
+        "1234 Hz -12.3 dB Ocenaudio 24-bit.wav",
+        "test-44100Hz-2ch-32bit-float-be.wav",
+        "test-8000Hz-le-2ch-1byteu.wav",
+    ])
+    @pytest.mark.parametrize("mmap", [False, True])
+    def test_load_dtype(self, filename, mmap):
+        """
+        Test that signals can be loaded as float32, with the same values
+        """
+        filepath = os.path.join(test_files_dir, filename)
+        signal = load(filepath, mmap=mmap, dtype=np.float32)['signal']
+        assert signal.dtype == np.float32
+        whole = np.asarray(signal)
+        assert whole.dtype == np.float32
+
+        expected = load(filepath)['signal']
+        # Integers of 24 bits or less are exact in float32
+        assert np.allclose(whole, expected, rtol=1e-7, atol=0)
+
+        chunks = list(blocks(filepath, 1000, dtype=np.float32))
+        assert all(chunk.dtype == np.float32 for chunk in chunks)
+        assert np.array_equal(np.concatenate(chunks), whole)
+
+    @pytest.mark.parametrize("filename", [
+        "1234 Hz -12.3 dB Ocenaudio 16-bit.wav",
+        "test-8000Hz-le-2ch-1byteu.wav",
+        "test-8000Hz-le-3ch-5S-24bit.wav",  # Can't be memory-mapped
+        "test-8000Hz-le-4ch-9S-12bit.wav",
+        "test-44100Hz-2ch-32bit-float-be.wav",
+    ])
+    def test_load_channels(self, filename):
+        """
+        Test that selected channels are loaded into contiguous columns, with
+        the same values as loading them all
+        """
+        filepath = os.path.join(test_files_dir, filename)
+        expected = load(filepath)
+        signal = expected['signal']
+        if signal.ndim == 1:
+            signal = signal[:, np.newaxis]
+        last = expected['channels'] - 1
+
+        selected = [last, 0] if last else [0]
+        soundfile = load(filepath, channels=selected)
+        assert soundfile['channels'] == expected['channels']
+        assert soundfile['samples'] == expected['samples']
+        assert soundfile['signal'].flags.f_contiguous
+        assert soundfile['signal'].dtype == signal.dtype
+        assert np.array_equal(soundfile['signal'], signal[:, selected])
+
+        one = load(filepath, channels=-1, dtype=np.float32)['signal']
+        assert one.ndim == 1
+        assert one.flags.c_contiguous
+        assert one.dtype == np.float32
+        assert np.array_equal(one, signal[:, last].astype(np.float32))
+
+        with pytest.raises(IndexError):
+            load(filepath, channels=[0, last + 1])
+        with pytest.raises(ValueError, match='more than once'):
+            load(filepath, channels=[0, -expected['channels']])
+
     def test_load_handles_invalid_files(self):
         """
         Test that load() raises appropriate errors for invalid files
@@ -68,6 +173,88 @@ class TestLoad:
         # with "pragma: no cover"
 
 
+class TestBlocks:
+    @pytest.mark.parametrize("filename", [
+        "1234 Hz -12.3 dB Ocenaudio 16-bit.wav",
+        "1234 Hz -12.3 dB Ocenaudio 24-bit.wav",  # Can't be memory-mapped
+        "test-44100Hz-2ch-32bit-float-be.wav",
+        "test-8000Hz-le-2ch-1byteu.wav",
+        "test-8000Hz-le-4ch-9S-12bit.wav",
+    ])
+    def test_blocks_match_load(self, filename):
+        """
+        Test that concatenated blocks are the same as the loaded signal
+        """
+        filepath = os.path.join(test_files_dir, filename)
+        soundfile = load(filepath)
+        chunks = list(blocks(filepath, 4))
+        assert all(len(chunk) == 4 for chunk in chunks[:-1])
+        assert 0 < len(chunks[-1]) <= 4
+        assert all(chunk.ndim == soundfile['signal'].ndim
+                   for chunk in chunks)
+        assert np.array_equal(np.concatenate(chunks), soundfile['signal'])
+
+        properties = info(filepath)
+        assert 'signal' not in properties
+        assert properties == {key: value for key, value in soundfile.items()
+                              if key != 'signal'}
+
+    def test_overlap(self):
+        filepath = os.path.join(test_files_dir,
+                                "test-8000Hz-le-4ch-9S-12bit.wav")
+        signal = load(filepath)['signal']
+        chunks = list(blocks(filepath, 4, overlap=1))
+        # Blocks start every 3 samples: [0:4], [3:7], [6:9]
+        assert [len(chunk) for chunk in chunks] == [4, 4, 3]
+        for n, chunk in enumerate(chunks):
+            assert np.array_equal(chunk, signal[3*n:3*n + 4])
+
+        with pytest.raises(ValueError):
+            list(blocks(filepath, 4, overlap=4))
+
+    @pytest.mark.skipif(wav_loader != 'scipy.io.wavfile',
+                        reason="Only for the scipy.io.wavfile backend")
+    @pytest.mark.filterwarnings("ignore::scipy.io.wavfile.WavFileWarning")
+    @pytest.mark.parametrize("filename", [
+        "1234 Hz -12.3 dB Ocenaudio 24-bit.wav",
+        "test-1234Hz-le-1ch-10S-20bit-extra.wav",
+        "test-44100Hz-le-1ch-4bytes-early-eof.wav",
+        "test-8000Hz-be-3ch-5S-24bit.wav",
+        "test-8000Hz-le-3ch-5S-36bit.wav",
+        "test-8000Hz-le-3ch-5S-53bit.wav",
+    ])
+    def test_blocks_unmappable(self, filename, monkeypatch):
+        """
+        Test that files SciPy can't memory-map are streamed from the file,
+        without reading all of it into memory
+        """
+        from scipy.io import wavfile
+        filepath = os.path.join(test_files_dir, filename)
+        fs, raw = wavfile.read(filepath)
+
+        read = wavfile.read
+
+        def mmap_only(filename, mmap=False):
+            assert mmap, 'Whole file read into memory'
+            return read(filename, mmap=mmap)
+
+        monkeypatch.setattr(wavfile, 'read', mmap_only)
+        chunks = list(blocks(filepath, 3))
+        assert [len(chunk) for chunk in chunks[:-1]] == [3] * (len(chunks) - 1)
+        assert np.array_equal(np.concatenate(chunks), _common._scale(raw))
+
+        properties = info(filepath)
+        assert properties['fs'] == fs
+        assert properties['samples'] == len(raw)
+        assert properties['format'] == str(raw.dtype)
+
+        # Files that aren't valid still raise SciPy's error
+        filepath = os.path.join(
+            test_files_dir, "test-44100Hz-le-1ch-4bytes-incomplete-chunk.wav")
+        with pytest.raises(ValueError, match='Incomplete chunk'):
+            info(filepath)
+
+
 class TestAnalyzeChannels:
     def test_analyze_channels_processes_all_channels(self):
         """
@@ -119,6 +306,14 @@ class TestAnalyzeChannels:
         # Each channel should be 1D
         assert all(r[0].ndim == 1 for r in results)
 
+        # Same file, memory-mapped, gives the same channels
+        mapped = []
+        analyze_channels(quad_file, lambda signal, fs: mapped.append(signal),
+                         mmap=True)
+        assert len(mapped) == 4
+        for (signal, fs), mapped_signal in zip(results, mapped):
+            assert np.array_equal(signal, mapped_signal)
+
         # Test 5-channel file
         five_ch_file = os.path.join(
             test_files_dir, "test-8000Hz-le-5ch-9S-5bit.wav")
@@ -128,6 +323,184 @@ class TestAnalyzeChannels:
         # Each channel should be 1D
         assert all(r[0].ndim == 1 for r in results)
 
+    @pytest.mark.parametrize("blocksize", [None, 2])
+    def test_analyze_channels_selected(self, blocksize, capsys):
+        """
+        Test that only the selected channels are analyzed, in order
+        """
+        filepath = os.path.join(test_files_dir,
+                                "test-8000Hz-le-4ch-9S-12bit.wav")
+        signal = load(filepath)['signal']
+        results = []
+
+        def dummy_analyzer(signal, fs):
+            if blocksize is not None:
+                signal = np.concatenate(list(signal))
+            results.append(signal)
+
+        analyze_channels(filepath, dummy_analyzer, blocksize, channels=[2, 0])
+        assert len(results) == 2
+        assert np.array_equal(results[0], signal[:, 2])
+        assert np.array_equal(results[1], signal[:, 0])
+        output = capsys.readouterr().out
+        assert '-- Channel 3 --' in output
+        assert '-- Channel 2 --' not in output
+
+        # One channel of a stereo file is never "identical"
+        stereo = os.path.join(test_files_dir,
+                              "test-44100Hz-2ch-32bit-float-be.wav")
+        analyze_channels(stereo, dummy_analyzer, blocksize, channels=1)
+        assert '-- Right channel --' in capsys.readouterr().out
+
+        with pytest.raises(ValueError, match='more than once'):
+            analyze_channels(filepath, dummy_analyzer, blocksize,
+                             channels=[1, 1])
+
+    @pytest.mark.parametrize("blocksize, mmap", [
+        (None, False),
+        (None, True),
+        (1000, False),
+    ])
+    def test_analyze_channels_identical(self, tmp_path, blocksize, mmap,
+                                        capsys):
+        """
+        Test that groups of identical channels are only analyzed once
+        """
+        from scipy.io import wavfile
+        rng = np.random.default_rng(0)
+        a, b, c = rng.integers(-2**15, 2**15, (3, 5000), dtype=np.int16)
+        # Channels 1, 3, 4 are identical, and so are 2 and 5
+        filepath = str(tmp_path / 'copies.wav')
+        wavfile.write(filepath, 8000, np.stack((a, b, a, a, b, c), axis=1))
+        signal = load(filepath)['signal']
+
+        results = []
+
+        def dummy_analyzer(signal, fs):
+            if blocksize is not None:
+                signal = np.concatenate(list(signal))
+            results.append(signal)
+
+        analyze_channels(filepath, dummy_analyzer, blocksize, mmap)
+        assert len(results) == 3
+        for result, ch_no in zip(results, [0, 1, 5]):
+            assert np.array_equal(result, signal[:, ch_no])
+        output = capsys.readouterr().out
+        assert '-- Channels 1, 3, 4 are identical --' in output
+        assert '-- Channels 2, 5 are identical --' in output
+        assert '-- Channel 6 --' in output
+
+        # Only among the channels selected
+        results.clear()
+        analyze_channels(filepath, dummy_analyzer, blocksize, mmap,
+                         channels=[3, 1, 2])
+        assert len(results) == 2
+        assert np.array_equal(results[0], signal[:, 3])
+        assert np.array_equal(results[1], signal[:, 1])
+        assert '-- Channels 4, 3 are identical --' in capsys.readouterr().out
+
+    def test_channel_groups(self, monkeypatch):
+        """
+        Test that comparison stops at the first difference between channels
+        """
+        monkeypatch.setattr(_common, 'COMPARE_BLOCKSIZE', 10)
+        signal = np.zeros((100, 4))
+        signal[95:, 3] = 1  # Only differs at the end
+        signal[5, 1] = 1
+        read = []
+
+        def signal_blocks():
+            for start in range(0, 100, 20):
+                read.append(start)
+                yield signal[start:start + 20]
+
+        assert channel_groups(signal_blocks(), 4) == [[0, 2], [1], [3]]
+        assert read == [0, 20, 40, 60, 80]
+
+        signal[5, 2] = 2
+        signal[15, 3] = 3
+        read.clear()
+        assert channel_groups(signal_blocks(), 4) == [[0], [1], [2], [3]]
+        assert read == [0]  # All different by the end of the first block
+
+        assert channel_groups([signal], [3, 0]) == [[3], [0]]
+
+        # Nothing to compare for one channel
+        read.clear()
+        assert channel_groups(signal_blocks(), 1) == [[0]]
+        assert read == []
+
+    @pytest.mark.parametrize("filename, expected_channels", [
+        ("1234 Hz -12.3 dB Ocenaudio 16-bit.wav", 1),
+        ("test-44100Hz-2ch-32bit-float-be.wav", 1),  # Identical channels
+        ("test-8000Hz-le-2ch-1byteu.wav", 2),
+        ("test-8000Hz-le-4ch-9S-12bit.wav", 4),
+    ])
+    def test_analyze_channels_streaming(self, filename, expected_channels):
+        """
+        Test that with a blocksize, the analyzer function gets iterators of
+        blocks that add up to the same channels as without
+        """
+        filepath = os.path.join(test_files_dir, filename)
+        whole = []
+        analyze_channels(filepath, lambda signal, fs: whole.append(signal))
+
+        streamed = []
+
+        def dummy_analyzer(signal_blocks, fs):
+            streamed.append(np.concatenate(list(signal_blocks)))
+
+        analyze_channels(filepath, dummy_analyzer, blocksize=100)
+        assert len(streamed) == expected_channels
+        for a, b in zip(whole, streamed):
+            assert b.ndim == 1
+            assert np.array_equal(a, b)
+
+
+    def test_analyze_channels_single_pass(self, monkeypatch, capsys):
+        """
+        Test that streamed channels are all analyzed in one pass through the
+        file, with their output in order
+        """
+        filepath = os.path.join(test_files_dir,
+                                "test-8000Hz-le-4ch-9S-12bit.wav")
+        signal = load(filepath)['signal']
+        passes = []
+
+        def counted_blocks(*args, **kwargs):
+            passes.append(args)
+            return blocks(*args, **kwargs)
+
+        monkeypatch.setattr(_common, 'blocks', counted_blocks)
+
+        def dummy_analyzer(signal_blocks, fs):
+            signal_blocks = list(signal_blocks)
+            assert all(block.flags.c_contiguous for block in signal_blocks)
+            print(np.concatenate(signal_blocks).tolist())
+
+        analyze_channels(filepath, dummy_analyzer, blocksize=2)
+        # One to compare the channels, and one to analyze all of them
+        assert len(passes) == 2
+        lines = capsys.readouterr().out.splitlines()[1:]
+        assert lines == [line for ch_no in range(4) for line in (
+            f'-- Channel {ch_no + 1} --', str(signal[:, ch_no].tolist()))]
+
+        # Functions that stop early or fail don't hold up the others
+        first_blocks = []
+
+        def stop_early(signal_blocks, fs):
+            block = next(signal_blocks)
+            if np.array_equal(block, signal[:2, 1]):
+                raise RuntimeError('Channel 2 failed')
+            first_blocks.append(block)
+
+        with pytest.raises(RuntimeError, match='Channel 2 failed'):
+            analyze_channels(filepath, stop_early, blocksize=2)
+        assert len(first_blocks) == 3
+        output = capsys.readouterr().out
+        assert all(output.count(f'-- Channel {ch_no} --') == 1
+                   for ch_no in range(1, 5))
+
 
 class TestHelperFunctions:
     def test_rms_flat(self):
@@ -166,6 +539,21 @@ class TestHelperFunctions:
                            match="x must be an integer sample index"):
             parabolic(f, 3.5)
 
+    def test_parabolic_batch(self):
+        """Test vectorized parabolic interpolation matches parabolic()"""
+        f = np.array([[2, 3, 1, 6, 4, 2, 3, 1],
+                      [1, 5, 3, 2, 0, 2, 1, 1],
+                      [0, 1, 2, 3, 4, 5, 7, 6]], dtype=float)
+        x = np.argmax(f, axis=-1)
+        xv, yv = parabolic_batch(f, x)
+        assert xv.shape == yv.shape == (3,)
+        for row, peak, vx, vy in zip(f, x, xv, yv):
+            assert (vx, vy) == pytest.approx(parabolic(row, peak))
+
+        with pytest.raises(ValueError,
+                           match="x must be an integer sample index"):
+            parabolic_batch(f, x + 0.5)
+
     def test_parabolic_polyfit(self):
         """Test parabolic fitting using polyfit"""
         f = np.array([2, 3, 1, 6, 4, 2, 3, 1])
@@ -176,5 +564,44 @@ class TestHelperFunctions:
         assert xv >= x-1 and xv <= x+1  # Fitted x should be near peak
 
 
+class TestLazyImport:
+    def run(self, code):
+        return subprocess.run([sys.executable, '-c', code], check=True,
+                              capture_output=True, text=True).stdout
+
+    def test_light_import(self):
+        # Importing the package and using dB() doesn't import SciPy or a
+        # sound file backend
+        modules = self.run(
+            'import sys\n'
+            'from waveform_analysis import dB\n'
+            'dB(0.5)\n'
+            'print(*sys.modules)').split()
+        assert 'waveform_analysis.thd' not in modules
+        assert not [name for name in modules
+                    if name.split('.')[0] in {'scipy', 'soundfile'}]
+
+    def test_names(self):
+        output = self.run(
+            'import waveform_analysis\n'
+            'from waveform_analysis import *\n'
+            'import waveform_analysis.thd\n'
+            'print(THD is waveform_analysis.thd, callable(A_weight))')
+        assert output.split() == ['True', 'True']
+
+    def test_submodules(self):
+        # Submodules are still attributes of the package, except thd, which
+        # is the alias of THD()
+        output = self.run(
+            'import waveform_analysis\n'
+            'print(waveform_analysis.freq_estimation.__name__,\n'
+            '      waveform_analysis.weighting_filters.__name__,\n'
+            '      waveform_analysis._common.__name__,\n'
+            '      waveform_analysis.thd is waveform_analysis.THD)')
+        assert output.split() == ['waveform_analysis.freq_estimation',
+                                  'waveform_analysis.weighting_filters',
+                                  'waveform_analysis._common', 'True']
+
+
 if __name__ == '__main__':
     pytest.main([__file__, "-v"])
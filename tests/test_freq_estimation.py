@@ -4,9 +4,12 @@ from numpy import pi, sin
 from scipy.signal import sawtooth
 
 # This package must first be installed with `pip install -e .` or similar
+from waveform_analysis import freq_estimation
 from waveform_analysis.freq_estimation import (freq_from_autocorr,
                                                freq_from_crossings,
-                                               freq_from_fft, freq_from_hps)
+                                               freq_from_crossings_blocks,
+                                               freq_from_fft, freq_from_hps,
+                                               track_frequency)
 
 
 def sine_wave(f, fs):
@@ -54,6 +57,44 @@ class TestFreqFromCrossings:
         correct = pytest.approx(f)
         assert freq_from_crossings(signal, fs, interp=interp) == correct
 
+    def test_hysteresis(self):
+        fs = 48000  # Hz
+        f = 50  # Hz
+        rng = np.random.default_rng(0)
+        signal = sine_wave(f, fs) + 0.01 * rng.standard_normal(fs)
+        # Noise causes extra crossings at slow zero crossings
+        assert freq_from_crossings(signal, fs) > 1.1 * f
+        assert freq_from_crossings(signal, fs, hysteresis=0.05) == \
+            pytest.approx(f, rel=0.005)
+
+        # First crossing only counts if the signal dipped below -hysteresis
+        signal = [-0.5, 0.5, -0.1, 0.1, -0.5, 0.5, -0.5, 0.5]
+        assert freq_from_crossings(signal, 1, interp=None) == pytest.approx(1/2)
+        assert freq_from_crossings(signal, 1, interp=None,
+                                   hysteresis=0.2) == pytest.approx(1/3)
+
+
+class TestFreqFromCrossingsBlocks:
+    def test_invalid_params(self):
+        with pytest.raises(ValueError):
+            freq_from_crossings_blocks([np.array([1, 2])], fs=40,
+                                       interp='cubic')
+
+    @pytest.mark.parametrize("interp", ('none', 'linear'))
+    @pytest.mark.parametrize("hysteresis", (0, 0.05))
+    def test_blocks(self, interp, hysteresis):
+        # Same as the whole signal at once, with crossings on block edges
+        fs = 44100  # Hz
+        rng = np.random.default_rng(1)
+        signal = sine_wave(50, fs) + 0.01 * rng.standard_normal(fs)
+        expected = freq_from_crossings(signal, fs, interp, hysteresis)
+        blocks = np.array_split(signal, [1, 2, 100, 882, 883, 30000])
+        assert freq_from_crossings_blocks(blocks, fs, interp,
+                                          hysteresis) == pytest.approx(expected)
+
+    def test_no_crossings(self):
+        assert np.isnan(freq_from_crossings_blocks([np.ones(10)], 8))
+
 
 class TestFreqFromFFT:
     def test_invalid_params(self):
@@ -73,6 +114,19 @@ class TestFreqFromFFT:
         signal = sine_wave(f, fs)
         assert freq_from_fft(signal, fs) == pytest.approx(f)
 
+    @pytest.mark.parametrize("window", (('kaiser', 38), 'hann', 'blackman'))
+    def test_window(self, window):
+        fs = 48000  # Hz
+        f = 1234.56789  # Hz
+        signal = sine_wave(f, fs)
+        assert freq_from_fft(signal, fs, window) == pytest.approx(f, rel=1e-5)
+
+    def test_window_cache(self):
+        window = freq_estimation._window(('kaiser', 100), 1000)
+        assert freq_estimation._window(('kaiser', 100), 1000) is window
+        assert not window.flags.writeable
+        assert freq_estimation._window(('kaiser', 38), 1000) is not window
+
 
 class TestFreqFromAutocorr:
     def test_invalid_params(self):
@@ -85,6 +139,18 @@ class TestFreqFromAutocorr:
         signal = sine_wave(f, fs)
         assert freq_from_autocorr(signal, fs) == pytest.approx(f, rel=1e-4)
 
+    @pytest.mark.parametrize("f", (110, 1234.56789))  # Hz
+    def test_range(self, f):
+        fs = 48000  # Hz
+        signal = sawtooth_wave(f, fs)[:4800]
+        assert freq_from_autocorr(signal, fs, fmin=f/1.5, fmax=f*1.5) == \
+            pytest.approx(f, rel=5e-3)
+        assert freq_from_autocorr(signal, fs, fmin=f/1.5) == \
+            pytest.approx(f, rel=5e-3)
+        # Only looks for fundamentals in the range given
+        assert freq_from_autocorr(signal, fs, fmin=f/2.5,
+                                  fmax=f/1.5) == pytest.approx(f/2, rel=5e-3)
+
 
 class TestFreqFromHPS:
     def test_invalid_params(self):
@@ -97,6 +163,108 @@ class TestFreqFromHPS:
         signal = sawtooth_wave(f, fs)
         assert freq_from_hps(signal, fs) == pytest.approx(f, rel=1e-4)
 
+    def test_window(self):
+        fs = 48000  # Hz
+        f = 1234.56789  # Hz
+        signal = sawtooth_wave(f, fs)
+        assert freq_from_hps(signal, fs, ('kaiser', 38)) == \
+            pytest.approx(f, rel=1e-4)
+
+    def test_range(self):
+        fs = 48000  # Hz
+        f = 220  # Hz
+        signal = sawtooth_wave(f, fs)
+        assert freq_from_hps(signal, fs, fmin=100, fmax=500) == \
+            pytest.approx(f, rel=1e-4)
+        # Only looks for fundamentals in the range given
+        assert freq_from_hps(signal, fs, fmin=300, fmax=500) == \
+            pytest.approx(2*f, rel=1e-4)
+
+    def test_harmonics(self, monkeypatch):
+        # More harmonics are used for lower fmax, up to HPS_HARMONICS
+        X = np.zeros(1001)
+        X[1000] = 1  # 10th harmonic of 100 Hz is Nyquist
+        monkeypatch.setattr(freq_estimation, 'HPS_HARMONICS', 100)
+        hps, i_peak = freq_estimation._hps(X, 2000, 2000, fmax=100)
+        assert hps[100] == 1
+
+        X[:] = 0
+        monkeypatch.setattr(freq_estimation, 'HPS_HARMONICS', 5)
+        X[[50, 100, 150, 200, 250, 300]] = 1
+        hps, i_peak = freq_estimation._hps(X, 2000, 2000, fmax=100)
+        assert hps[50] == 5
+        assert i_peak == 50
+
+
+class TestFloat32:
+    @pytest.mark.parametrize("estimator", [
+        freq_from_crossings, freq_from_fft, freq_from_autocorr, freq_from_hps,
+    ])
+    def test_estimators(self, estimator):
+        fs = 48000  # Hz
+        signal = sawtooth_wave(1234.56789, fs)
+        expected = estimator(signal, fs)
+        result = estimator(signal.astype(np.float32), fs, dtype=np.float32)
+        assert result == pytest.approx(expected, rel=1e-5)
+
+
+class TestTrackFrequency:
+    def test_invalid_params(self):
+        with pytest.raises(ValueError):
+            track_frequency(np.zeros(100), 40, method='eggs')
+
+        # Too short for a single frame
+        times, freqs, confidence = track_frequency(np.zeros(100), 40,
+                                                   frame=200)
+        assert len(times) == len(freqs) == len(confidence) == 0
+
+    @pytest.mark.parametrize("method, estimator, kwargs", [
+        ('fft', freq_from_fft, {}),
+        ('autocorr', freq_from_autocorr, {}),
+        ('autocorr', freq_from_autocorr, {'fmin': 500, 'fmax': 5000}),
+        ('hps', freq_from_hps, {}),
+        ('crossings', freq_from_crossings, {}),
+    ])
+    def test_frames(self, method, estimator, kwargs, monkeypatch):
+        # Same as running the estimator on each frame
+        fs = 48000  # Hz
+        frame, hop = 2048, 700
+        t = np.arange(fs // 2) / fs
+        drift = 1000 * (1 + 0.01 * t)  # Hz
+        signal = sawtooth(2*pi * np.cumsum(drift) / fs)
+
+        # Several batches of frames
+        monkeypatch.setattr(freq_estimation, 'TRACK_BATCH_SIZE', 5 * frame)
+        times, freqs, confidence = track_frequency(signal, fs, method, frame,
+                                                   hop, **kwargs)
+
+        starts = range(0, len(signal) - frame + 1, hop)
+        assert len(freqs) == len(starts)
+        assert times == pytest.approx([(start + frame/2) / fs
+                                       for start in starts])
+        expected = [estimator(signal[start:start + frame], fs, **kwargs)
+                    for start in starts]
+        assert freqs == pytest.approx(expected)
+        assert np.all(confidence > 0.9)
+
+    def test_float32(self):
+        fs = 48000  # Hz
+        signal = sine_wave(1234.56789, fs).astype(np.float32)
+        times, freqs, confidence = track_frequency(signal, fs,
+                                                   dtype=np.float32)
+        assert freqs == pytest.approx(1234.56789, rel=1e-5)
+
+    def test_confidence(self):
+        fs = 44100  # Hz
+        rng = np.random.default_rng(0)
+        noise = rng.standard_normal(fs)
+        times, freqs, confidence = track_frequency(noise, fs, 'autocorr')
+        assert np.all(confidence < 0.3)
+
+        times, freqs, confidence = track_frequency(sine_wave(1000, fs), fs)
+        assert freqs == pytest.approx(1000)
+        assert confidence == pytest.approx(1, abs=0.01)
+
 
 if __name__ == '__main__':
     pytest.main([__file__, "--capture=sys"])
@@ -84,3 +84,13 @@ class TestMeasureFreq:
         assert len(freq_lines) == 2  # Two frequency measurements
 
         assert result.stdout.count("Time elapsed:") == 2  # Two timing reports
+
+    def test_profile(self, tmp_path):
+        """Test printing and saving the time taken by each stage"""
+        profile = tmp_path / 'profile.json'
+        result = run_measure_freq("1234 Hz -12.3 dB Ocenaudio 16-bit.wav",
+                                  ['--profile', '--profile-json',
+                                   str(profile)])
+        assert result.returncode == 0
+        assert 'freq_from_fft.rfft' in result.stderr
+        assert 'freq_from_fft.rfft' in profile.read_text()
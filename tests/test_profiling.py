@@ -0,0 +1,103 @@
+import json
+import tracemalloc
+
+import numpy as np
+import pytest
+
+from waveform_analysis import THD, THDN, A_weight
+from waveform_analysis.profiling import Profile, profile_to, stage
+from waveform_analysis.results import levels
+
+
+def sine(fs=48000, samples=48000):
+    t = np.arange(samples) / fs
+    return np.sin(2*np.pi * 1000 * t) + 0.01 * np.sin(2*np.pi * 3000 * t)
+
+
+class TestProfile:
+    def test_stages(self):
+        fs = 48000
+        signal = sine(fs)
+        with Profile() as profile:
+            THD(signal, fs)
+            THDN(signal, fs, weight='A')
+            THD(signal, fs)
+        assert list(profile.stages)[:4] == [
+            'thd.window', 'thd.rfft', 'thd.peak_search', 'thd.harmonics']
+        assert {'thdn.rfft', 'thdn.irfft', 'A_weight.filter'} <= set(
+            profile.stages)
+        assert profile.stages['thd.rfft']['calls'] == 2
+        assert profile.stages['thd.window']['bytes'] == 2 * signal.nbytes
+        assert all(record['time'] >= 0 and record['allocated'] is None
+                   for record in profile.stages.values())
+        assert 'thd.harmonics' in profile.report()
+
+    def test_disabled(self):
+        # Nothing is recorded outside of a Profile, and results don't change
+        fs = 48000
+        signal = sine(fs)
+        with Profile() as profile:
+            profiled = THDN(signal, fs)
+        assert THDN(signal, fs) == profiled
+        assert stage('thd.window', signal) is stage('other')
+        with pytest.raises(RuntimeError):
+            with profile, Profile():
+                pass
+
+    @pytest.mark.skipif(not hasattr(tracemalloc, 'reset_peak'),
+                        reason="Requires Python 3.9 or later")
+    def test_memory(self):
+        fs = 48000
+        signal = sine(fs, 10 * fs)
+        with Profile(memory=True) as profile:
+            with stage('outer', signal):
+                A_weight(signal, fs)
+                with stage('inner'):
+                    np.ones(100)
+        stages = profile.stages
+        # Filtering makes at least an output array as big as the input
+        assert stages['A_weight.filter']['allocated'] >= signal.nbytes
+        assert stages['inner']['allocated'] < signal.nbytes
+        # Peak from before the inner stage still counts in the outer one
+        assert stages['outer']['allocated'] >= signal.nbytes
+
+    def test_memory_unsupported(self, monkeypatch):
+        # As on Python 3.8 and earlier
+        monkeypatch.delattr(tracemalloc, 'reset_peak', raising=False)
+        with pytest.raises(NotImplementedError, match='Python 3.9'):
+            Profile(memory=True)
+        Profile()  # Still works without memory
+
+    def test_streaming(self):
+        fs = 48000
+        signal = sine(fs)
+        with Profile() as profile:
+            levels(signal, fs, blocksize=10000)
+        # Once per block, plus the filter's step response
+        record = profile.stages['AWeightFilter.process']
+        assert record['calls'] >= 5
+        assert record['bytes'] >= signal.nbytes
+
+
+class TestProfileTo:
+    def test_json(self, tmp_path, capsys):
+        path = tmp_path / 'profile.json'
+        with profile_to(filename=str(path)):
+            THD(sine(), 48000)
+        stages = json.loads(path.read_text())
+        assert stages['thd.rfft']['calls'] == 1
+        assert capsys.readouterr().err == ''
+
+    def test_report(self, capsys):
+        with profile_to(report=True) as profile:
+            THD(sine(), 48000)
+        assert capsys.readouterr().err.strip() == profile.report()
+
+    def test_off(self):
+        with profile_to() as profile:
+            THD(sine(), 48000)
+        assert profile is None
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, "--capture=sys"])
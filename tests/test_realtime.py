@@ -0,0 +1,119 @@
+import io
+import os
+
+import numpy as np
+import pytest
+
+from waveform_analysis._common import load
+from waveform_analysis.realtime import (DeviceSource, FileSource,
+                                        LiveAnalyzer, StreamSource)
+from waveform_analysis.results import levels
+
+# Get the test files directory
+tests_dir = os.path.dirname(__file__)
+test_files_dir = os.path.join(tests_dir, 'test_files')
+
+try:
+    import sounddevice  # noqa: F401
+    has_sounddevice = True
+except (ImportError, OSError):
+    has_sounddevice = False
+
+
+class TestSources:
+    @pytest.mark.parametrize("filename", [
+        "1234 Hz -12.3 dB Ocenaudio 16-bit.wav",
+        "test-44100Hz-2ch-32bit-float-le.wav",
+    ])
+    def test_file(self, filename):
+        filename = os.path.join(test_files_dir, filename)
+        signal = load(filename)['signal']
+        source = FileSource(filename, blocksize=1000)
+        replayed = np.concatenate(list(source))
+        assert replayed.ndim == 2
+        assert replayed.shape[1] == source.channels
+        assert np.array_equal(replayed, signal.reshape(len(signal), -1))
+
+    def test_stream(self):
+        samples = np.array([[0, -32768], [16384, 32767], [-16384, 1],
+                            [1, 2]], dtype='<i2')
+        # Incomplete frame at the end is ignored
+        stream = io.BytesIO(samples.tobytes() + b'\x00')
+        source = StreamSource(8000, channels=2, dtype='<i2', blocksize=3,
+                              stream=stream)
+        blocks = list(source)
+        assert [len(block) for block in blocks] == [3, 1]
+        assert np.array_equal(np.concatenate(blocks), samples / 2**15)
+
+    def test_stream_int8(self):
+        samples = np.array([-128, -64, 0, 127], dtype='i1')
+        source = StreamSource(8000, dtype='int8',
+                              stream=io.BytesIO(samples.tobytes()))
+        assert np.array_equal(np.concatenate(list(source))[:, 0],
+                              samples / 2**7)
+
+        for dtype in ('uint16', 'float16', 'complex64'):
+            with pytest.raises(ValueError, match='not supported'):
+                StreamSource(8000, dtype=dtype, stream=io.BytesIO())
+
+    @pytest.mark.skipif(has_sounddevice, reason="sounddevice is installed")
+    def test_device_missing(self):
+        with pytest.raises(ImportError):
+            DeviceSource(48000)
+
+
+class TestLiveAnalyzer:
+    def test_levels(self):
+        # Levels accumulate over everything so far
+        filename = os.path.join(test_files_dir,
+                                "test-44100Hz-2ch-32bit-float-le.wav")
+        source = FileSource(filename, blocksize=100)
+        analyzer = LiveAnalyzer(source.fs, source.channels)
+        for block in source:
+            readings = analyzer.process(block)
+        signal = load(filename)['signal']
+        expected = levels(signal, source.fs)
+        for name, value in expected.items():
+            assert readings[name] == pytest.approx(value)
+        assert analyzer.blocks == int(np.ceil(len(signal) / 100))
+
+    def test_frequency_thd(self):
+        fs = 48000
+        t = np.arange(2 * fs) / fs
+        sine = 0.5 * np.sin(2*np.pi * 997 * t)
+        distorted = sine + 0.005 * np.sin(2*np.pi * 3 * 997 * t)
+        signal = np.stack((sine, distorted), axis=1)
+
+        analyzer = LiveAnalyzer(fs, 2, window=8192)
+        for block in np.array_split(signal, 100):
+            readings = analyzer.process(block)
+        assert readings['frequency'] == pytest.approx(997, rel=1e-4)
+        assert readings['thd'][0] < 1e-4
+        assert readings['thd'][1] == pytest.approx(0.01, rel=0.01)
+        assert readings['rms'] == pytest.approx([0.5 / np.sqrt(2)] * 2,
+                                                rel=0.01)
+
+        analyzer.reset()
+        assert analyzer.blocks == 0
+        readings = analyzer.process(signal[:100])
+        assert readings['peak'] == pytest.approx(np.max(np.abs(
+            signal[:100] - signal[:100].mean(axis=0)), axis=0))
+
+    def test_short_history(self):
+        # Only levels until there are enough samples for frequency and THD
+        analyzer = LiveAnalyzer(48000, 1, window=64)
+        for n in range(15):
+            readings = analyzer.process(np.zeros((1, 1)))
+            assert np.isnan(readings['frequency']).all()
+            assert np.isnan(readings['thd']).all()
+            assert readings['peak'] == [0]
+
+        # Noise, with its highest peak at the edge of the spectrum
+        rng = np.random.default_rng(0)
+        for n in range(20):
+            readings = analyzer.process(rng.standard_normal((16, 1)))
+        assert analyzer.blocks == 35
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, "--capture=sys"])
@@ -0,0 +1,175 @@
+import functools
+import io
+import json
+import os
+
+import numpy as np
+import pytest
+
+from waveform_analysis import (THD, THDN, A_weight, ITU_R_468_weight,
+                               freq_from_fft, rms_flat)
+from waveform_analysis._common import load
+from waveform_analysis.batch import analyze_files
+from waveform_analysis.results import (ChannelResult, LevelMeter,
+                                       analyze_file, from_batch, levels,
+                                       measure, to_csv, to_jsonl, to_npz)
+
+# Get the test files directory
+tests_dir = os.path.dirname(__file__)
+test_files_dir = os.path.join(tests_dir, 'test_files')
+
+stereo_file = os.path.join(test_files_dir,
+                           "test-44100Hz-2ch-32bit-float-le.wav")
+mono_file = os.path.join(test_files_dir,
+                         "1234 Hz -12.3 dB Ocenaudio 16-bit.wav")
+
+
+class TestMeasure:
+    def test_measure(self):
+        soundfile = load(mono_file)
+        signal, fs = soundfile['signal'], soundfile['fs']
+        results = measure(signal, fs, ('frequency', 'thd', 'thdn', 'levels'))
+        assert results['fs'] == fs
+        assert results['samples'] == len(signal)
+        assert results['frequency'] == freq_from_fft(signal, fs)
+        assert results['thd'] == THD(signal, fs)
+        assert results['thdn'] == THDN(signal, fs)
+        assert results['peak'] == pytest.approx(10**(-12.3456/20), rel=0.01)
+        assert results['rms'] == pytest.approx(results['peak'] / np.sqrt(2),
+                                               rel=0.01)
+
+        with pytest.raises(ValueError):
+            measure(signal, fs, ('eggs',))
+
+    def test_levels(self):
+        fs = 48000
+        t = np.arange(fs) / fs
+        signal = 0.5 + np.sin(2*np.pi * 1000 * t)
+        results = levels(signal, fs)
+        assert signal[0] == 0.5  # Not modified
+        assert results['dc_offset'] == pytest.approx(0.5)
+        assert results['peak'] == pytest.approx(1)
+        assert results['rms'] == pytest.approx(1 / np.sqrt(2))
+        # Both weightings are 0 dB at 1 kHz
+        assert results['rms_a'] == pytest.approx(1 / np.sqrt(2), rel=0.01)
+        assert results['rms_468'] == pytest.approx(1 / np.sqrt(2), rel=0.01)
+
+
+class TestLevelMeter:
+    def test_blocks(self):
+        # Matches measuring the whole signal with the DC offset removed
+        fs = 44100
+        rng = np.random.default_rng(0)
+        signal = 0.3 + 0.01 * rng.standard_normal((30000, 2))
+        centered = signal - np.mean(signal, axis=0)
+
+        meter = LevelMeter(fs)
+        for block in np.array_split(signal, [1, 1000, 1001, 20000]):
+            meter.process(block)
+        results = meter.results()
+        for channel in range(2):
+            x = centered[:, channel]
+            expected = {
+                'dc_offset': np.mean(signal[:, channel]),
+                'peak': np.max(np.abs(x)),
+                'rms': rms_flat(x),
+                'rms_a': rms_flat(A_weight(x, fs)),
+                'rms_468': rms_flat(ITU_R_468_weight(x, fs)),
+            }
+            for name, value in expected.items():
+                assert results[name][channel] == pytest.approx(value,
+                                                               rel=1e-9)
+
+        meter.reset()
+        with pytest.raises(ValueError):
+            meter.results()
+
+    def test_levels_blocksize(self):
+        fs = 8000
+        signal = np.sin(2*np.pi * 100 * np.arange(20000) / fs) - 0.1
+        whole = levels(signal, fs, blocksize=len(signal))
+        for name, value in levels(signal, fs, blocksize=999).items():
+            assert np.ndim(value) == 0
+            assert value == pytest.approx(whole[name], rel=1e-12)
+
+
+class TestChannelResult:
+    def test_fields(self):
+        result = ChannelResult('a.wav', 1, thd=0.1)
+        assert result.thd == 0.1
+        assert result.thdn is None
+        assert not hasattr(result, '__dict__')
+        assert result == ChannelResult('a.wav', 1, thd=0.1)
+        assert result != ChannelResult('a.wav', 0, thd=0.1)
+        assert repr(result) == "ChannelResult(filename='a.wav', channel=1, " \
+                               "thd=0.1)"
+        with pytest.raises(TypeError):
+            ChannelResult('a.wav', 1, eggs=0.1)
+
+    def test_analyze_file(self):
+        results = analyze_file(stereo_file, ('frequency', 'levels'))
+        assert [result.channel for result in results] == [0, 1]
+        signal = load(stereo_file)['signal']
+        for result in results:
+            assert result.filename == stereo_file
+            assert result.fs == 44100
+            assert result.thd is None
+            assert result.frequency == freq_from_fft(
+                signal[:, result.channel], 44100)
+
+    def test_from_batch(self):
+        missing = os.path.join(test_files_dir, "nonexistent.wav")
+        results = from_batch(analyze_files(
+            [mono_file, missing], functools.partial(measure, metrics=['thd']),
+            per_channel=True, workers=1))
+        assert results[0] == analyze_file(mono_file, ['thd'])[0]
+        assert results[1].filename == missing
+        assert results[1].error
+        assert results[1].thd is None
+
+
+class TestExport:
+    results = [ChannelResult('a.wav', 0, fs=48000, samples=100,
+                             thd=np.float64(0.25), frequency=1000.5),
+               ChannelResult('b, "c".wav', 1, error='Broken')]
+
+    def test_jsonl(self, tmp_path):
+        path = tmp_path / 'results.jsonl'
+        to_jsonl(self.results, str(path))
+        lines = path.read_text().splitlines()
+        assert len(lines) == 2
+        records = [json.loads(line) for line in lines]
+        assert records[0]['thd'] == 0.25
+        assert records[0]['thdn'] is None
+        assert records[1]['filename'] == 'b, "c".wav'
+        assert records[1]['error'] == 'Broken'
+
+        f = io.StringIO()
+        to_jsonl(self.results, f)
+        assert f.getvalue() == path.read_text()
+
+    def test_csv(self, tmp_path):
+        import csv
+        path = tmp_path / 'results.csv'
+        to_csv(self.results, str(path))
+        with open(path, newline='') as f:
+            rows = list(csv.DictReader(f))
+        assert len(rows) == 2
+        assert float(rows[0]['thd']) == 0.25
+        assert rows[0]['thdn'] == ''
+        assert rows[1]['filename'] == 'b, "c".wav'
+
+    def test_npz(self, tmp_path):
+        path = tmp_path / 'results.npz'
+        to_npz(self.results, str(path))
+        with np.load(path) as columns:
+            assert list(columns['filename']) == ['a.wav', 'b, "c".wav']
+            assert list(columns['channel']) == [0, 1]
+            assert list(columns['fs']) == [48000, -1]
+            assert columns['thd'][0] == 0.25
+            assert np.isnan(columns['thd'][1])
+            assert list(columns['error']) == ['', 'Broken']
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, "--capture=sys"])
@@ -0,0 +1,183 @@
+import asyncio
+import json
+import multiprocessing
+import os
+import socket
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from waveform_analysis.results import analyze_file
+from waveform_analysis import server as server_module
+from waveform_analysis.server import start_server, submit, worker_pool
+
+# Get the test files directory
+tests_dir = os.path.dirname(__file__)
+test_files_dir = os.path.join(tests_dir, 'test_files')
+
+files = [os.path.join(test_files_dir, filename) for filename in (
+    "1234 Hz -12.3 dB Ocenaudio 16-bit.wav",
+    "test-44100Hz-2ch-32bit-float-le.wav",
+)]
+
+
+def crash_or_analyze(filename, metrics):
+    # Kill the worker process, like a segfault, for the "crash" file
+    if filename == 'crash':
+        os._exit(1)
+    return _analyze(filename, metrics)
+
+
+_analyze = server_module._analyze
+
+
+@pytest.fixture(scope='module')
+def pool():
+    with worker_pool(2) as pool:
+        yield pool
+
+
+@pytest.fixture
+def serving(pool):
+    """
+    Run servers on an event loop in another thread
+    """
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    servers = []
+
+    def start(pool=pool, **address):
+        server = asyncio.run_coroutine_threadsafe(
+            start_server(pool, **address), loop).result()
+        servers.append(server)
+        return server
+
+    yield start
+
+    async def shutdown():
+        for server in servers:
+            server.close()
+            await server.wait_closed()
+        # Let connection handlers finish closing
+        tasks = asyncio.all_tasks() - {asyncio.current_task()}
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    asyncio.run_coroutine_threadsafe(shutdown(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    loop.close()
+
+
+def key(result):
+    return result.filename, result.channel
+
+
+class TestServer:
+    def test_tcp(self, serving):
+        server = serving(port=0)
+        port = server.sockets[0].getsockname()[1]
+        metrics = ('frequency', 'thd', 'levels')
+        results = list(submit(files, metrics, port=port))
+        expected = [result for filename in files
+                    for result in analyze_file(filename, metrics)]
+        assert sorted(results, key=key) == expected
+
+    @pytest.mark.skipif(not hasattr(socket, 'AF_UNIX'),
+                        reason="Requires Unix sockets")
+    def test_unix_socket(self, serving, tmp_path):
+        path = str(tmp_path / 'server.sock')
+        serving(socket=path)
+        results = list(submit(files[:1], socket=path))
+        assert results == analyze_file(files[0])
+
+    def test_errors(self, serving):
+        server = serving(port=0)
+        port = server.sockets[0].getsockname()[1]
+
+        # Files that can't be analyzed don't disturb the others
+        missing = os.path.join(test_files_dir, "nonexistent.wav")
+        results = list(submit([missing, files[0]], port=port))
+        assert len(results) == 2
+        error = next(result for result in results
+                     if result.filename == missing)
+        # Depending on the backend
+        assert error.error.startswith(('FileNotFoundError', 'LibsndfileError'))
+        assert error.channel is None
+
+        # Invalid requests
+        with pytest.raises(ValueError, match='Metrics not understood'):
+            list(submit(files, ['crest_factor'], port=port))
+        with pytest.raises(ValueError, match='list of paths'):
+            list(submit([3], port=port))
+
+    def test_long_request(self, serving, monkeypatch):
+        # Longer than asyncio's default limit of 64 KiB
+        long_files = files[:1] * (2**16 // len(files[0]) + 1)
+        server = serving(port=0)
+        port = server.sockets[0].getsockname()[1]
+        with pytest.raises(ValueError, match='Metrics not understood'):
+            list(submit(long_files, ['crest_factor'], port=port))
+
+        # Longer than the server's limit
+        monkeypatch.setattr(server_module, 'LINE_LIMIT', 2**12)
+        server = serving(port=0)
+        port = server.sockets[0].getsockname()[1]
+        with pytest.raises(ValueError, match='longer than 4096 bytes'):
+            list(submit(long_files, port=port))
+
+    def test_concurrent_requests(self, serving):
+        # Several requests on one connection, without waiting for responses
+        server = serving(port=0)
+        port = server.sockets[0].getsockname()[1]
+        with socket.create_connection(('127.0.0.1', port)) as connection:
+            for n, filename in enumerate(files):
+                request = {'id': n, 'files': [filename],
+                           'metrics': ['frequency']}
+                connection.sendall(json.dumps(request).encode() + b'\n')
+            connection.sendall(b'not json\n')
+            connection.shutdown(socket.SHUT_WR)
+            with connection.makefile('rb') as stream:
+                responses = [json.loads(line) for line in stream]
+
+        done = [response['id'] for response in responses
+                if response.get('done')]
+        assert sorted(done, key=str) == [0, 1, None]
+        assert [response for response in responses
+                if response['id'] is None][0]['error']
+        for n, filename in enumerate(files):
+            channels = [response['channel'] for response in responses
+                        if response['id'] == n and not response.get('done')]
+            assert channels == list(range(len(analyze_file(filename))))
+
+    @pytest.mark.skipif('fork' not in multiprocessing.get_all_start_methods(),
+                        reason="Requires fork, to patch the workers")
+    def test_worker_crash(self, serving, monkeypatch):
+        # Forked workers see the patched function
+        monkeypatch.setattr(server_module, '_analyze', crash_or_analyze)
+        sizes = []
+
+        def recorded_pool(workers=None):
+            sizes.append(workers)
+            return worker_pool(workers)
+
+        monkeypatch.setattr(server_module, 'worker_pool', recorded_pool)
+        pool = ProcessPoolExecutor(
+            2, mp_context=multiprocessing.get_context('fork'))
+        server = serving(pool, port=0, workers=2)
+        port = server.sockets[0].getsockname()[1]
+
+        # The request gets an error, instead of hanging
+        with pytest.raises(ValueError, match='BrokenProcessPool'):
+            list(submit(['crash', files[0]], port=port))
+
+        # and later ones run on a new pool, of the same size
+        for n in range(2):
+            results = list(submit(files[:1], port=port))
+            assert results == analyze_file(files[0])
+        assert sizes == [2]
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, "--capture=sys"])
@@ -8,7 +8,7 @@ from scipy.io.wavfile import WavFileWarning, read
 from scipy.signal import sawtooth
 
 # This package must first be installed with `pip install -e .` or similar
-from waveform_analysis.thd import THD, THDN
+from waveform_analysis.thd import THD, THDN, _flattop, flattops
 
 
 def sine_wave(f, fs):
@@ -149,6 +149,119 @@ class TestTHDN:
         explicit_thd = THD(signal, fs, freq=f)
         assert explicit_thd == pytest.approx(auto_thd)
 
+    def test_estimate(self):
+        # Short capture with the fundamental between bins, so reading the
+        # bins at multiples of the fundamental's bin goes wrong
+        fs = 48000  # Hz
+        f = 1234.567  # Hz
+        t = np.arange(4800) / fs
+        signal = sum((1 if h == 1 else 0.01) * sin(2*pi * f * h * t + h)
+                     for h in range(1, 11))
+        expected = 0.01 * np.sqrt(9)
+
+        assert THD(signal, fs) != pytest.approx(expected, rel=0.1)
+        assert THD(signal, fs, estimate='parabolic') == pytest.approx(
+            expected, rel=0.005)
+        assert THD(signal, fs, estimate='sum') == pytest.approx(
+            expected, rel=1e-4)
+        assert THD(signal, fs, freq=f, estimate='sum') == pytest.approx(
+            expected, rel=1e-4)
+
+        signals = np.stack((signal, sine_wave(1000, fs)[:4800]))
+        assert THD(signals, fs, estimate='sum') == pytest.approx(
+            [expected, 0], rel=1e-4, abs=1e-6)
+
+        with pytest.raises(ValueError):
+            THD(signal, fs, estimate='Q')
+
+    @pytest.mark.parametrize("weight", [None, 'A', '468'])
+    def test_spectral(self, weight):
+        # Parseval: Same noise power as in the time domain, except for the
+        # weighting filter's transients
+        fs = 48000  # Hz
+        rng = np.random.default_rng(0)
+        signals = [
+            sine_wave(997, fs) + 0.1 * sine_wave(2*997, fs),
+            sine_wave(1234, fs) + 1e-3 * rng.standard_normal(fs),
+            sawtooth_wave(100, fs)[:12345],
+        ]
+        for signal in signals:
+            expected = THDN(signal, fs, weight=weight)
+            result = THDN(signal, fs, weight=weight, method='spectral')
+            rel = 1e-9 if weight is None else 1e-3
+            assert result == pytest.approx(expected, rel=rel)
+
+    def test_invalid_method(self):
+        with pytest.raises(ValueError):
+            THDN(sine_wave(100, 1000), 1000, method='Q')
+        with pytest.raises(ValueError):
+            THDN(sine_wave(100, 1000), 1000, weight='Q', method='spectral')
+
+    @pytest.mark.parametrize("window", sorted(flattops))
+    def test_window(self, window):
+        fs = 100000  # Hz
+        f = 1000  # Hz
+        signal = sine_wave(f, fs) + 0.75 * sine_wave(2*f, fs)
+        assert THDN(signal, fs, window=window) == pytest.approx(0.6, rel=0.01)
+        assert THD(signal, fs, window=window) == pytest.approx(0.75, rel=0.01)
+
+    def test_window_cache(self):
+        window = _flattop('HFT95', 1000)
+        assert _flattop('HFT95', 1000) is window
+        assert not window.flags.writeable
+        assert len(_flattop('HFT95', 1001)) == 1001
+
+        with pytest.raises(ValueError, match="not understood"):
+            THD(sine_wave(100, 1000), 1000, window='hann')
+        with pytest.raises(ValueError, match="not understood"):
+            THDN(sine_wave(100, 1000), 1000, window='hann')
+
+    @pytest.mark.parametrize("func, kwargs", [
+        (THD, {}),
+        (THDN, {}),
+        (THDN, {'weight': 'A'}),
+        (THDN, {'method': 'spectral', 'weight': '468'}),
+    ])
+    def test_float32(self, func, kwargs):
+        fs = 48000  # Hz
+        signal = sine_wave(997, fs) + 1e-4 * sine_wave(2*997, fs)
+        expected = func(signal, fs, **kwargs)
+        result = func(signal.astype(np.float32), fs, dtype=np.float32,
+                      **kwargs)
+        assert result == pytest.approx(expected, rel=1e-3)
+
+    def test_batch(self):
+        # Rows of a 2-D array are analyzed separately, like 1-D calls
+        fs = 48000  # Hz
+        signals = np.array([
+            sine_wave(997, fs) + 0.1 * sine_wave(2*997, fs),
+            sine_wave(1234, fs) + 0.3 * sine_wave(3*1234, fs),
+            sawtooth_wave(100, fs),
+            sine_wave(5000, fs),
+        ])
+        for func, kwargs in ((THD, {}), (THD, {'ref': 'r'}),
+                             (THDN, {}), (THDN, {'weight': 'A'})):
+            expected = [func(signal, fs, **kwargs) for signal in signals]
+            result = func(signals, fs, **kwargs)
+            assert result.shape == (4,)
+            assert result == pytest.approx(expected, rel=1e-9, abs=1e-12)
+
+            # Time along the first axis instead
+            result = func(signals.T, fs, axis=0, **kwargs)
+            assert result == pytest.approx(expected, rel=1e-9, abs=1e-12)
+
+        # One known frequency per signal
+        freqs = [997, 1234, 100, 5000]
+        expected = [THD(signal, fs, freq=f) for signal, f in
+                    zip(signals, freqs)]
+        assert THD(signals, fs, freq=freqs) == pytest.approx(expected)
+        expected = [THDN(signal, fs, freq=f) for signal, f in
+                    zip(signals, freqs)]
+        assert THDN(signals, fs, freq=freqs) == pytest.approx(expected)
+
+        # N-D arrays keep their other dimensions
+        assert THDN(signals.reshape(2, 2, -1), fs).shape == (2, 2)
+
 
 if __name__ == '__main__':
     pytest.main([__file__, "--capture=sys"])
@@ -3,6 +3,7 @@ import re
 import subprocess
 import sys
 
+import numpy as np
 import pytest
 
 from waveform_analysis._common import wav_loader
@@ -72,6 +73,25 @@ class TestWaveAnalyzer:
         assert f"Sampling rate:\t{expected_fs} Hz" in result.stdout
         assert f"Channels:\t{expected_ch}" in result.stdout
 
+    @pytest.mark.parametrize("filename, expected", [
+        ("test-44100Hz-2ch-32bit-float-le.wav",
+         ["Left and Right channels are identical:"]),
+        ("test-8000Hz-le-2ch-1byteu.wav", ["Left channel:", "Right channel:"]),
+        ("test-8000Hz-le-3ch-5S-24bit.wav",
+         ["Channel 1:", "Channel 2:", "Channel 3:"]),
+        pytest.param("test-8000Hz-le-3ch-5S-64bit.wav",
+                     ["Channels 1, 2 are identical:", "Channel 3:"],
+                     marks=pytest.mark.skipif(
+                         wav_loader != 'scipy.io.wavfile',
+                         reason="Requires scipy backend")),
+    ])
+    def test_identical_channels(self, filename, expected):
+        result = run_wave_analyzer(filename)
+        assert result.returncode == os.EX_OK
+        headings = re.findall(r"^(?:Left|Right|Channels?) .*:$",
+                              result.stdout, re.MULTILINE)
+        assert headings == expected
+
     @pytest.mark.parametrize("filename, expected_peak", [
         ("1234 Hz -12.3 dB Ocenaudio 16-bit.wav", -12.3456),
         ("1234 Hz -12.3 dB Ocenaudio 24-bit.wav", -12.3456),
@@ -194,6 +214,33 @@ class TestWaveAnalyzer:
         assert result.returncode != os.EX_OK
         assert "Unexpected error analyzing" in result.stderr
 
+    def test_live_replay(self):
+        result = run_wave_analyzer("1234 Hz -12.3 dB Ocenaudio 16-bit.wav",
+                                   ["--live", "--blocksize", "1024"])
+        assert result.returncode == os.EX_OK
+        assert "Sampling rate:\t48000 Hz" in result.stdout
+        lines = re.findall(r"Channel 1:.*Peak ([-\d.]+) dBFS.* ([\d.]+) Hz",
+                           result.stdout)
+        assert len(lines) > 1
+        peak_db, freq = map(float, lines[-1])
+        assert peak_db == pytest.approx(-12.3456, abs=0.1)
+        assert freq == pytest.approx(1234, abs=1)
+
+    def test_live_stdin(self):
+        fs = 8000
+        t = np.arange(fs) / fs
+        sine = (16384 * np.sin(2*np.pi * 1000 * t)).astype('<i2')
+        cmd = [sys.executable, script_path, "--live", "--stdin", "--rate",
+               str(fs), "--channels", "2", "--dtype", "<i2"]
+        result = subprocess.run(cmd, input=np.stack((sine, sine // 2),
+                                                    axis=1).tobytes(),
+                                capture_output=True)
+        assert result.returncode == os.EX_OK
+        stdout = result.stdout.decode()
+        assert "Channels:\t2" in stdout
+        assert "Channel 2:" in stdout
+        assert "1000.000 Hz" in stdout
+
     def test_no_arguments(self):
         result = run_wave_analyzer()
         assert result.returncode != os.EX_OK
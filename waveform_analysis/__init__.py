@@ -4,7 +4,55 @@ A collection of functions and scripts for analyzing waveforms, especially audio
 https://github.com/endolith/waveform-analysis
 """
 
-from ._common import dB, parabolic, rms_flat
-from .freq_estimation import freq_from_autocorr, freq_from_fft, freq_from_hps
-from .thd import THD, THDN, thd, thd_n
-from .weighting_filters import *
+import importlib
+import sys
+import types
+
+# Submodules are only imported when one of their functions is first used, so
+# importing the package (and then using dB(), for instance) doesn't have to
+# import SciPy
+_exports = {
+    '_common': ('dB', 'parabolic', 'rms_flat'),
+    'freq_estimation': ('freq_from_autocorr', 'freq_from_crossings_blocks',
+                        'freq_from_fft', 'freq_from_hps', 'track_frequency'),
+    'thd': ('THD', 'THDN', 'thd', 'thd_n'),
+    'weighting_filters': ('ABC_weighting', 'A_weighting', 'A_weight',
+                          'AWeightFilter', 'ITU_R_468_weighting_analog',
+                          'ITU_R_468_weighting', 'ITU_R_468_weight',
+                          'ITU_R_468_WeightFilter', 'QuasiPeakDetector',
+                          'clear_filter_cache', 'filter_cache_info'),
+}
+_modules = {name: module for module, names in _exports.items()
+            for name in names}
+
+__all__ = list(_modules)
+
+
+def __getattr__(name):
+    if name in _modules:
+        module = importlib.import_module(f'.{_modules[name]}', __name__)
+        value = getattr(module, name)
+        globals()[name] = value  # Only look it up once
+        return value
+    if name in _exports:
+        # Submodules, as when the package imported them all (except thd,
+        # which is found above, as the alias of THD)
+        return importlib.import_module(f'.{name}', __name__)
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
+
+
+class _Package(types.ModuleType):
+    def __setattr__(self, name, value):
+        # The thd submodule has the same name as the thd() alias of THD(),
+        # which is what the package attribute has always been, so don't let
+        # importing the submodule replace it
+        if name == 'thd' and isinstance(value, types.ModuleType):
+            return
+        super().__setattr__(name, value)
+
+
+sys.modules[__name__].__class__ = _Package
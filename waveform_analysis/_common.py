@@ -1,31 +1,376 @@
 #!/usr/bin/env python
 
+import contextlib
+import io
+import operator
+import os
+import queue
+import struct
+import threading
+import warnings
+
 import numpy as np
 
-try:
-    from soundfile import SoundFile
-    wav_loader = 'python-soundfile'
-except ModuleNotFoundError:
+from waveform_analysis.profiling import stage
+
+# Number of frames decoded at a time when loading only some channels with
+# SoundFile
+CHANNEL_BLOCKSIZE = 2**16
+
+# Number of samples compared at a time when looking for identical channels
+COMPARE_BLOCKSIZE = 2**14
+
+
+def _loader():
+    """
+    Choose the sound file loading package, the first time a file is opened
+
+    Importing SoundFile loads libsndfile, and importing SciPy is slow too, so
+    this is put off until it's needed, rather than done on import.  The
+    choice is then available as `wav_loader`.
+    """
+    global wav_loader, SoundFile, read
+    if 'wav_loader' not in globals():
+        try:
+            from soundfile import SoundFile
+            wav_loader = 'python-soundfile'
+        except ModuleNotFoundError:
+            try:
+                from scipy.io.wavfile import read
+                wav_loader = 'scipy.io.wavfile'
+            except ModuleNotFoundError:
+                raise ImportError('No sound file loading package installed '
+                                  '(SoundFile or SciPy)')
+    return wav_loader
+
+
+def __getattr__(name):
+    if name == 'wav_loader':
+        return _loader()
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+def _read_wav(filename):
+    """
+    Read a WAV file with scipy.io.wavfile, memory-mapped if possible
+
+    Formats that SciPy can't memory-map (such as 24-bit, or truncated files)
+    are read into memory instead.
+    """
+    from scipy.io import wavfile
     try:
-        from scipy.io.wavfile import read
-        wav_loader = 'scipy.io.wavfile'
-    except ModuleNotFoundError:
-        raise ImportError('No sound file loading package installed '
-                          '(SoundFile or SciPy)')
+        return wavfile.read(filename, mmap=True)
+    except ValueError:
+        return wavfile.read(filename)
+
+
+@contextlib.contextmanager
+def _open_wav(filename):
+    """
+    Open a WAV file with scipy.io.wavfile, without reading it into memory
+
+    Yields the sampling rate and the samples, memory-mapped if possible, or
+    otherwise as a _WavFile, which can be sliced the same way.
+    """
+    from scipy.io import wavfile
+    try:
+        fs, signal = wavfile.read(filename, mmap=True)
+    except ValueError as error:
+        try:
+            signal = _WavFile(filename)
+        except ValueError:
+            # Not a valid WAV file at all, so SciPy's error is more useful
+            raise error
+        fs = signal.fs
+    try:
+        yield fs, signal
+    finally:
+        if isinstance(signal, _WavFile):
+            signal.close()
+
+
+class _WavFile:
+    """
+    Read ranges of samples from a WAV file, without reading the whole thing
+
+    For files SciPy can't memory-map, such as 24-bit or truncated ones.  Only
+    the header is parsed on opening, and slicing reads just the frames in the
+    slice.  Samples are returned the same way as by scipy.io.wavfile.read():
+    1-D for mono files, and integers of 3, 5, 6 or 7 bytes left-justified in
+    the next larger integer type.
+    """
+
+    def __init__(self, filename):
+        self.file = open(filename, 'rb')
+        try:
+            self._parse_header()
+        except BaseException:
+            self.file.close()
+            raise
+
+    def _parse_header(self):
+        riff = self.file.read(4)
+        if riff == b'RIFF':
+            self.endian = '<'
+        elif riff == b'RIFX':
+            self.endian = '>'
+        else:
+            raise ValueError(f'File format {riff!r} not understood')
+        self.file.read(4)  # File size
+        if self.file.read(4) != b'WAVE':
+            raise ValueError('Not a WAV file')
+
+        fmt = None
+        while True:
+            header = self.file.read(8)
+            if len(header) < 8:
+                raise ValueError('Unexpected end of file, with no data '
+                                 'chunk')
+            chunk_id, size = struct.unpack(f'{self.endian}4sI', header)
+            if chunk_id == b'fmt ':
+                fmt = self.file.read(size)
+                if len(fmt) < 16:
+                    raise ValueError('Invalid fmt chunk')
+                self.file.seek(size % 2, io.SEEK_CUR)  # Padding
+            elif chunk_id == b'data':
+                break
+            else:
+                self.file.seek(size + size % 2, io.SEEK_CUR)
+        if fmt is None:
+            raise ValueError('No fmt chunk before the data chunk')
+
+        (format_tag, self.channels, self.fs, bytes_per_second, block_align,
+         _) = struct.unpack(f'{self.endian}HHIIHH', fmt[:16])
+        if format_tag == 0xFFFE and len(fmt) >= 28:  # WAVE_FORMAT_EXTENSIBLE
+            format_tag, = struct.unpack(f'{self.endian}I', fmt[24:28])
+        if (not self.channels or block_align % self.channels or
+                bytes_per_second != self.fs * block_align):
+            raise ValueError('Invalid fmt chunk')
+        self.width = block_align // self.channels
+        self.block_align = block_align
+
+        if format_tag == 1 and 1 <= self.width <= 8:  # PCM
+            if self.width == 1:
+                self.dtype = np.dtype('u1')
+            else:
+                itemsize = (2 if self.width == 2 else
+                            4 if self.width <= 4 else 8)
+                self.dtype = np.dtype(f'{self.endian}i{itemsize}')
+        elif format_tag == 3 and self.width in (4, 8):  # IEEE float
+            self.dtype = np.dtype(f'{self.endian}f{self.width}')
+        else:
+            raise ValueError(f'Unsupported WAV format: tag {format_tag}, '
+                             f'{self.width} bytes per sample')
+
+        self.offset = self.file.tell()
+        available = os.fstat(self.file.fileno()).st_size - self.offset
+        if available < size:
+            from scipy.io.wavfile import WavFileWarning
+            warnings.warn('Reached EOF prematurely; data chunk is '
+                          f'{available} bytes, expected {size} bytes from '
+                          'header.', WavFileWarning, stacklevel=2)
+        self.frames = min(size, available) // block_align
+
+    @property
+    def shape(self):
+        if self.channels == 1:
+            return (self.frames,)
+        return (self.frames, self.channels)
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    def __len__(self):
+        return self.frames
+
+    def __getitem__(self, key):
+        """
+        Read the samples of a range of frames, such as ``wav[start:stop]``
+        """
+        start, stop, step = key.indices(self.frames)
+        if step != 1:
+            raise ValueError('Only contiguous ranges of frames can be read')
+        count = max(stop - start, 0)
+        self.file.seek(self.offset + start * self.block_align)
+        data = self.file.read(count * self.block_align)
+        if self.width == self.dtype.itemsize:
+            samples = np.frombuffer(data, self.dtype).copy()
+        else:
+            # Left-justify each sample in the wider integer type
+            raw = np.frombuffer(data, np.uint8).reshape(-1, self.width)
+            padded = np.zeros((len(raw), self.dtype.itemsize), np.uint8)
+            if self.endian == '<':
+                padded[:, -self.width:] = raw
+            else:
+                padded[:, :self.width] = raw
+            samples = padded.view(self.dtype)
+        return samples.reshape((count,) + self.shape[1:])
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
 
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _scale(signal, dtype=None, out=None):
+    """
+    Scale integer samples read by scipy.io.wavfile to floats in [-1, +1)
+
+    Integers are converted to `dtype` (default: float64), or written into
+    `out`, and scaled in place, so no other temporary arrays are made.
+    Floats are only converted if `dtype` or `out` is given.
+    """
+    offset = 0
+    full_scale = None
+    # PCM:
+    if signal.dtype.kind == 'u' and signal.dtype.itemsize == 1:
+        # 8-bit and under are unsigned
+        offset, full_scale = 128, 2**7
+    elif signal.dtype.kind == 'i':  # int8, int16, int32, int64
+        if signal.dtype.itemsize == 1:
+            # Signed 8-bit doesn't occur in WAV files, but does in raw PCM
+            full_scale = 2**7
+        elif signal.dtype.itemsize == 2:
+            # 9-bit and higher will be stored in 16-bit and are signed
+            full_scale = 2**15
+        elif signal.dtype.itemsize == 4:
+            # 32-bit is signed
+            # 24-bit are loaded as LJ 32-bit, so this gets scaled
+            # correctly, assuming the fixed point convention described in
+            # https://github.com/scipy/scipy/pull/12507#issue-652818718
+            # (and exactly, even in float32, which has 24 significant bits)
+            full_scale = 2**31
+        elif signal.dtype.itemsize == 8:
+            # 64-bit is rare but theoretically possible
+            full_scale = 2**63
+    # Float:
+    elif signal.dtype.kind == 'f':  # float32, float64
+        pass
+    else:
+        raise Exception("Don't know how to handle file format "
+                        f"{signal.dtype}")
+
+    if out is None:
+        if dtype is None:
+            dtype = np.float64 if signal.dtype.kind in 'iu' else signal.dtype
+        out = signal.astype(dtype, copy=False)
+    else:
+        out[...] = signal
+    if offset:
+        out -= offset
+    if full_scale is not None:
+        out /= full_scale
+    return out
+
+
+class MappedSignal:
+    """
+    Samples of a WAV file, scaled to floats only when they are accessed
+
+    Indexing returns a scaled array of just the selected samples, so reading
+    a short time window of a large file only touches and converts that part
+    of it.  Since samples are interleaved on disk, reading one channel still
+    pages in the whole data chunk, but only that channel is converted and
+    kept in memory.
+
+    Float files are returned as copy-on-write views of the memory map,
+    without any conversion, unless another `dtype` is requested.  Use
+    ``np.asarray()`` to convert the whole thing at once.
+    """
+
+    def __init__(self, raw, dtype=None):
+        self.raw = raw
+        self._dtype = dtype
+
+    @property
+    def shape(self):
+        return self.raw.shape
+
+    @property
+    def ndim(self):
+        return self.raw.ndim
+
+    @property
+    def dtype(self):
+        if self._dtype is not None:
+            return np.dtype(self._dtype)
+        return self.raw.dtype if self.raw.dtype.kind == 'f' else np.dtype(float)
+
+    def __len__(self):
+        return len(self.raw)
+
+    def __getitem__(self, key):
+        return _scale(self.raw[key], self._dtype)
+
+    def __array__(self, dtype=None, copy=None):
+        return np.asarray(self[...], dtype=dtype)
+
+
+def load(filename, mmap=False, dtype=None, channels=None):
+    """
+    Load a sound file and return its samples and properties
+
+    Parameters
+    ----------
+    filename : str
+        Path of the sound file to load.
+    mmap : bool, optional
+        If True, memory-map the file using scipy.io.wavfile, whichever
+        backend is installed, and return the samples as a `MappedSignal`,
+        which reads and scales them lazily.  Only works for WAV files.
+        Formats that SciPy can't memory-map (such as 24-bit) are read into
+        memory, but are still scaled lazily (default: False).
+    dtype : dtype, optional
+        Floating-point type of the samples, such as np.float32, which takes
+        half the memory of the default np.float64.  Integer samples are
+        converted to it directly, with no float64 intermediate.  By default,
+        float files read by scipy.io.wavfile keep their own type.
+    channels : int or sequence of int, optional
+        Index of the channel to load, or a list of them.  Only those are
+        decoded, each into its own contiguous column, so 'signal' is 1-D for
+        a single index, or a Fortran-ordered array of shape (samples,
+        len(channels)) for a list, whose columns can be analyzed without
+        copying.  `mmap` is then ignored, but the scipy.io.wavfile backend
+        reads from a memory map where possible (default: all channels,
+        interleaved as in the file).
+
+    Returns
+    -------
+    soundfile : dict
+        'signal' holds the samples, scaled to floats in [-1, +1), 1-D for
+        mono files and of shape (samples, channels) otherwise.  'fs' is the
+        sampling rate, 'channels' the number of channels in the file,
+        'samples' the number of samples per channel, and 'format' a
+        description of the file format.
+    """
+    if channels is not None:
+        return _load_channels(filename, channels, dtype)
 
-def load(filename):
     soundfile = {}
-    if wav_loader == 'python-soundfile':
+    if mmap:
+        with stage('load.read'):
+            soundfile['fs'], raw = _read_wav(filename)
+        soundfile['signal'] = MappedSignal(raw, dtype)
+        soundfile['channels'] = 1 if raw.ndim == 1 else raw.shape[1]
+        soundfile['samples'] = raw.shape[0]
+        soundfile['format'] = str(raw.dtype)
+    elif _loader() == 'python-soundfile':
         sf = SoundFile(filename)
-        soundfile['signal'] = sf.read()
+        with stage('load.read'):
+            soundfile['signal'] = sf.read(dtype=_soundfile_dtype(dtype))
         soundfile['channels'] = sf.channels
         soundfile['fs'] = sf.samplerate
         soundfile['samples'] = len(sf)
         soundfile['format'] = f"{sf.format_info} {sf.subtype_info}"
         sf.close()
     elif wav_loader == 'scipy.io.wavfile':
-        soundfile['fs'], soundfile['signal'] = read(filename)
+        with stage('load.read'):
+            soundfile['fs'], soundfile['signal'] = read(filename)
         try:
             soundfile['channels'] = soundfile['signal'].shape[1]
         except IndexError:
@@ -34,44 +379,375 @@ def load(filename):
         soundfile['format'] = str(soundfile['signal'].dtype)
 
         # Scale common formats
-        signal = soundfile['signal']
-        # PCM:
-        if signal.dtype.kind == 'u' and signal.dtype.itemsize == 1:
-            # 8-bit and under are unsigned
-            signal = (signal.astype(float) - 128) / (2**7)
-        elif signal.dtype.kind == 'i':  # int16, int32, int64
-            if signal.dtype.itemsize == 2:
-                # 9-bit and higher will be stored in 16-bit and are signed
-                signal = signal.astype(float) / (2**15)
-            elif signal.dtype.itemsize == 4:
-                # 32-bit is signed
-                # 24-bit are loaded as LJ 32-bit, so this gets scaled
-                # correctly, assuming the fixed point convention described in
-                # https://github.com/scipy/scipy/pull/12507#issue-652818718
-                signal = signal.astype(float) / (2**31)
-            elif signal.dtype.itemsize == 8:
-                # 64-bit is rare but theoretically possible
-                signal = signal.astype(float) / (2**63)
-        # Float:
-        elif signal.dtype.kind == 'f':  # float32, float64
-            pass
-        else:
-            raise Exception("Don't know how to handle file format "
-                            f"{soundfile['format']}")
-        soundfile['signal'] = signal
+        with stage('load.scale', soundfile['signal']):
+            soundfile['signal'] = _scale(soundfile['signal'], dtype)
+    else:
+        raise Exception("wav_loader has failed")
+
+    return soundfile
+
+
+def _channel_list(channels, count):
+    """
+    Return the indices selected by `channels`, as for load(), as a list
+    """
+    if channels is None:
+        return list(range(count))
+    if np.ndim(channels) == 0:
+        channels = [channels]
+    selected = []
+    for channel in channels:
+        channel = operator.index(channel)
+        if not -count <= channel < count:
+            raise IndexError(f'Channel {channel} is out of range for a file '
+                             f'with {count} channels')
+        if channel % count in selected:
+            raise ValueError(f'Channel {channel} is selected more than once')
+        selected.append(channel % count)
+    return selected
+
+
+def _load_channels(filename, channels, dtype):
+    """
+    load() only the given channels, each into a contiguous column
+
+    If `channels` is None, all of them are loaded, as a 2-D array.
+    """
+    soundfile = {}
+    if _loader() == 'python-soundfile':
+        with SoundFile(filename) as sf:
+            soundfile['channels'] = sf.channels
+            soundfile['fs'] = sf.samplerate
+            soundfile['samples'] = len(sf)
+            soundfile['format'] = f"{sf.format_info} {sf.subtype_info}"
+            selected = _channel_list(channels, sf.channels)
+            signal = np.empty((len(sf), len(selected)),
+                              _soundfile_dtype(dtype), order='F')
+            # libsndfile only decodes whole frames, so read a block of them
+            # at a time and keep the channels wanted
+            start = 0
+            with stage('load.read'):
+                for block in sf.blocks(CHANNEL_BLOCKSIZE,
+                                       dtype=signal.dtype.name,
+                                       always_2d=True):
+                    stop = start + len(block)
+                    for column, channel in enumerate(selected):
+                        signal[start:stop, column] = block[:, channel]
+                    start = stop
+            signal = signal[:start]  # In case the file ended early
+    elif wav_loader == 'scipy.io.wavfile':
+        with stage('load.read'):
+            soundfile['fs'], raw = _read_wav(filename)
+        if raw.ndim == 1:
+            raw = raw[:, np.newaxis]
+        soundfile['channels'] = raw.shape[1]
+        soundfile['samples'] = raw.shape[0]
+        soundfile['format'] = str(raw.dtype)
+        selected = _channel_list(channels, raw.shape[1])
+        if dtype is None:
+            dtype = np.float64 if raw.dtype.kind in 'iu' else raw.dtype
+        signal = np.empty((len(raw), len(selected)), dtype, order='F')
+        with stage('load.scale', signal):
+            for column, channel in enumerate(selected):
+                _scale(raw[:, channel], out=signal[:, column])
     else:
         raise Exception("wav_loader has failed")
 
+    if channels is not None and np.ndim(channels) == 0:
+        signal = signal[:, 0]
+    soundfile['signal'] = signal
     return soundfile
 
 
-def analyze_channels(filename, function):
+def _soundfile_dtype(dtype):
+    """
+    Name of a float type, as SoundFile expects, float64 by default
+    """
+    return 'float64' if dtype is None else np.dtype(dtype).name
+
+
+def info(filename):
+    """
+    Return the same properties as load(), without the 'signal' itself
+
+    Useful for finding out the sampling rate and number of channels of a file
+    before streaming it with blocks().
+    """
+    soundfile = {}
+    if _loader() == 'python-soundfile':
+        with SoundFile(filename) as sf:
+            soundfile['channels'] = sf.channels
+            soundfile['fs'] = sf.samplerate
+            soundfile['samples'] = len(sf)
+            soundfile['format'] = f"{sf.format_info} {sf.subtype_info}"
+    elif wav_loader == 'scipy.io.wavfile':
+        with _open_wav(filename) as (soundfile['fs'], signal):
+            soundfile['channels'] = 1 if signal.ndim == 1 else signal.shape[1]
+            soundfile['samples'] = signal.shape[0]
+            soundfile['format'] = str(signal.dtype)
+    else:
+        raise Exception("wav_loader has failed")
+
+    return soundfile
+
+
+def blocks(filename, blocksize, overlap=0, dtype=None):
+    """
+    Yield successive blocks of samples from a sound file, scaled to floats
+
+    Only one block is decoded at a time, so memory use is bounded by
+    `blocksize`, no matter how long the file is.
+
+    Parameters
+    ----------
+    filename : str
+        Path of the sound file to read.
+    blocksize : int
+        Number of samples (frames) per block.  The last block may be shorter.
+    overlap : int, optional
+        Number of samples each block shares with the previous one
+        (default: 0).
+    dtype : dtype, optional
+        Floating-point type of the samples, as for load().
+
+    Yields
+    ------
+    block : ndarray
+        Samples, with the same shape convention as load(): 1-D for mono
+        files, 2-D of shape (samples, channels) otherwise.
+
+    Notes
+    -----
+    With the scipy.io.wavfile backend, the file is memory-mapped.  Formats
+    that SciPy can't memory-map (such as 24-bit) are read from the file one
+    block at a time instead.
+    """
+    if not 0 <= overlap < blocksize:
+        raise ValueError('overlap must be non-negative and less than '
+                         'blocksize')
+
+    if _loader() == 'python-soundfile':
+        with SoundFile(filename) as sf:
+            yield from sf.blocks(blocksize, overlap,
+                                 dtype=_soundfile_dtype(dtype))
+    elif wav_loader == 'scipy.io.wavfile':
+        with _open_wav(filename) as (fs, signal):
+            for start in range(0, len(signal), blocksize - overlap):
+                if start and start + overlap >= len(signal):
+                    # Nothing new left, just the overlap with previous block
+                    break
+                yield _scale(signal[start:start + blocksize], dtype)
+    else:
+        raise Exception("wav_loader has failed")
+
+
+_END = object()
+
+
+def _put(q, item, stopped):
+    """
+    Put an item in a queue, unless its reader has stopped reading it
+    """
+    while not stopped.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            pass
+
+
+def _analyze_streams(signal_blocks, function, fs, tasks):
+    """
+    Run an analyzer on several channels of the same blocks, in a single pass
+
+    For each of `tasks`, a (column, heading) tuple, ``function(iterator,
+    fs)`` is called with an iterator of contiguous 1-D blocks of that column.
+    Every call runs in its own thread, fed through a short queue, so each
+    block is only decoded once, and is freed once all of the calls have used
+    it.
+
+    The headings are printed in order, each once the function before it has
+    returned and its own iterator is exhausted (or it has returned early), so
+    the output of functions that only print after reading all of their
+    blocks is in the same order as if they had run one after another.
+    """
+    count = len(tasks)
+    queues = [queue.Queue(maxsize=2) for _ in range(count)]
+    returned = [threading.Event() for _ in range(count)]
+    finished = [threading.Event() for _ in range(count)]
+    announced = [False] * count
+    errors = [None] * count
+
+    def announce(n):
+        if not announced[n]:
+            if n:
+                finished[n - 1].wait()
+            print(tasks[n][1])
+            announced[n] = True
+
+    def channel(n):
+        while True:
+            block = queues[n].get()
+            if block is _END:
+                break
+            yield block
+        announce(n)
+
+    def run(n):
+        try:
+            function(channel(n), fs)
+        except BaseException as e:
+            errors[n] = e
+        finally:
+            returned[n].set()
+            try:
+                announce(n)
+            finally:
+                finished[n].set()
+
+    threads = [threading.Thread(target=run, args=(n,), daemon=True)
+               for n in range(count)]
+    for thread in threads:
+        thread.start()
+    try:
+        for block in signal_blocks:
+            for (column, _), q, stopped in zip(tasks, queues, returned):
+                _put(q, np.ascontiguousarray(block[:, column]), stopped)
+    finally:
+        for q, stopped in zip(queues, returned):
+            _put(q, _END, stopped)
+        for thread in threads:
+            thread.join()
+
+    for error in errors:
+        if error is not None:
+            raise error
+
+
+def _split_group(chunk, group):
+    """
+    Split a group of channels into those that are identical within a chunk
+    """
+    if len(group) == 1:
+        return [group]
+    subgroups = []
+    for ch_no in group:
+        for subgroup in subgroups:
+            if np.array_equal(chunk[:, subgroup[0]], chunk[:, ch_no]):
+                subgroup.append(ch_no)
+                break
+        else:
+            subgroups.append([ch_no])
+    return subgroups
+
+
+def _refine_groups(groups, block):
+    """
+    Split groups of identical channels that differ within a block of samples
+
+    The block is compared a chunk of COMPARE_BLOCKSIZE samples at a time, so
+    it stops as soon as every channel is known to be different from the
+    others, and never makes large temporary arrays.
+    """
+    for start in range(0, len(block), COMPARE_BLOCKSIZE):
+        if all(len(group) == 1 for group in groups):
+            break
+        chunk = block[start:start + COMPARE_BLOCKSIZE]
+        groups = [subgroup for group in groups
+                  for subgroup in _split_group(chunk, group)]
+    return groups
+
+
+def channel_groups(signal_blocks, channels):
+    """
+    Group the channels of a signal that are identical to each other
+
+    The channels are compared a chunk of samples at a time, and no more
+    blocks are read once every channel is known to be different from the
+    others, so files with no identical channels are usually only read a
+    little way.
+
+    Parameters
+    ----------
+    signal_blocks : iterable of ndarray
+        Successive blocks of samples, of shape (samples, channels), such as
+        from blocks(), or a list of one whole signal.
+    channels : int or sequence of int
+        Number of channels, or the indices of the ones to compare.
+
+    Returns
+    -------
+    groups : list of list of int
+        Indices of each set of identical channels, in the order of their
+        first channel in `channels`.  Channels that are different from all
+        the others are in groups of their own.
+
+    Examples
+    --------
+    >>> channel_groups(blocks('dual mono.wav', 65536), 2)
+    [[0, 1]]
+    """
+    columns = list(range(channels) if np.ndim(channels) == 0 else channels)
+    groups = [columns]
+    if len(columns) > 1:
+        for block in signal_blocks:
+            groups = _refine_groups(groups, block)
+            if all(len(group) == 1 for group in groups):
+                break
+    return sorted(groups, key=lambda group: columns.index(group[0]))
+
+
+def analyze_channels(filename, function, blocksize=None, mmap=False,
+                     dtype=None, channels=None):
     """
     Given a filename, run the given analyzer function on each channel of the
     file
+
+    Each channel is decoded into its own contiguous array, as by load() with
+    `channels`.  If `mmap` is True, the file is memory-mapped instead, and
+    only the channels that are analyzed are scaled to floats, one at a time.
+    See load(), also for `dtype`.
+
+    If `channels` is given, only the channels with those indices are decoded
+    and analyzed.  Channels that are identical to each other, such as the two
+    of a dual-mono file, are only analyzed once.
+
+    If `blocksize` is given, the file is streamed instead of being loaded all
+    at once, and `function` is passed an iterator of 1-D blocks of up to
+    `blocksize` samples for each channel, instead of the whole channel as one
+    array, so memory use stays bounded for files larger than RAM.  The file
+    is then read only once for all of the channels, which are analyzed at the
+    same time, in separate threads, so `function` should only print once it
+    has read all of its blocks, for its output to follow its heading.
     """
-    soundfile = load(filename)
-    signal = soundfile['signal']
+    if blocksize is None:
+        if mmap:
+            soundfile = load(filename, mmap=True, dtype=dtype)
+        else:
+            soundfile = _load_channels(filename, channels, dtype)
+        signal = soundfile['signal']
+        selected = _channel_list(channels, soundfile['channels'])
+        # Column of the signal holding each channel
+        if mmap:
+            columns = {ch_no: ch_no for ch_no in selected}
+        else:
+            columns = {ch_no: n for n, ch_no in enumerate(selected)}
+
+        def channel(ch_no):
+            return signal if signal.ndim == 1 else signal[:, columns[ch_no]]
+
+        def identical_groups():
+            ch_nos = {column: ch_no for ch_no, column in columns.items()}
+            groups = channel_groups([signal], [columns[ch_no]
+                                               for ch_no in selected])
+            return [[ch_nos[column] for column in group] for group in groups]
+    else:
+        soundfile = info(filename)
+        selected = _channel_list(channels, soundfile['channels'])
+
+        def identical_groups():
+            return channel_groups(blocks(filename, blocksize), selected)
+
     sample_rate = soundfile['fs']
     channels = soundfile['channels']
 
@@ -79,22 +755,36 @@ def analyze_channels(filename, function):
 
     if channels == 1:
         # Monaural
-        function(signal, sample_rate)
-    elif channels == 2:
-        # Stereo
-        if np.array_equal(signal[:, 0], signal[:, 1]):
-            print('-- Left and Right channels are identical --')
-            function(signal[:, 0], sample_rate)
+        if blocksize is None:
+            function(channel(0), sample_rate)
         else:
-            print('-- Left channel --')
-            function(signal[:, 0], sample_rate)
-            print('-- Right channel --')
-            function(signal[:, 1], sample_rate)
+            function(blocks(filename, blocksize, dtype=dtype), sample_rate)
+        return
+
+    def heading(group):
+        if len(group) > 1:
+            if channels == 2:
+                return '-- Left and Right channels are identical --'
+            names = ', '.join(str(ch_no + 1) for ch_no in group)
+            return f'-- Channels {names} are identical --'
+        elif channels == 2:
+            # Stereo
+            return f'-- {("Left", "Right")[group[0]]} channel --'
+        else:
+            # Multi-channel
+            return f'-- Channel {group[0] + 1} --'
+
+    # Identical channels are only analyzed once
+    groups = identical_groups()
+    if blocksize is None:
+        for group in groups:
+            print(heading(group))
+            function(channel(group[0]), sample_rate)
     else:
-        # Multi-channel
-        for ch_no, channel in enumerate(signal.transpose()):
-            print(f'-- Channel {ch_no + 1} --')
-            function(channel, sample_rate)
+        # Decode each block once, for all of the channels
+        _analyze_streams(blocks(filename, blocksize, dtype=dtype), function,
+                         sample_rate, [(group[0], heading(group))
+                                       for group in groups])
 
 
 # Copied from matplotlib.mlab:
@@ -148,6 +838,28 @@ def parabolic(f, x):
     return (xv, yv)
 
 
+def parabolic_batch(f, x):
+    """
+    Vectorized version of parabolic() for many vectors at once.
+
+    f is an array of vectors along its last axis, and x is an integer array
+    of indices into them, of shape f.shape[:-1].
+
+    Returns (vx, vy), arrays of the coordinates of the vertex of the parabola
+    through each point x and its two neighbors.
+    """
+    x = np.asarray(x)
+    if x.dtype.kind not in 'iu':
+        raise ValueError('x must be an integer sample index')
+    x = x[..., np.newaxis]
+    left, center, right = (np.take_along_axis(f, x + offset, axis=-1)[..., 0]
+                           for offset in (-1, 0, +1))
+    x = x[..., 0]
+    xv = 1/2. * (left - right) / (left - 2 * center + right) + x
+    yv = center - 1/4. * (left - right) * (xv - x)
+    return (xv, yv)
+
+
 def parabolic_polyfit(f, x, n):
     """
     Use the built-in polyfit() function to find the peak of a parabola
@@ -0,0 +1,209 @@
+"""
+Analyze many sound files in parallel, using a pool of worker processes
+"""
+
+import multiprocessing
+import os
+import signal as os_signal
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from waveform_analysis._common import info, load
+
+BatchResult = namedtuple('BatchResult', ['filename', 'channel', 'value',
+                                         'error'])
+BatchResult.__doc__ = """\
+Result of analyzing one file, or one channel of a file
+
+filename : str
+    Path of the file.
+channel : int or None
+    Index of the channel analyzed, or None if the whole file was analyzed.
+value : object
+    What the analyzer function returned, or None if it failed.
+error : str or None
+    Description of the exception raised, if it failed.
+"""
+
+
+# States of each job, shared with the worker processes, so the jobs that were
+# running when a worker died can be found
+_QUEUED, _RUNNING, _DONE = 0, 1, 2
+
+# State of each job, in a worker process
+_states = None
+
+
+class _Timeout(BaseException):
+    # Not an Exception, so the analyzer function can't catch it
+    pass
+
+
+def _alarm(signum, frame):
+    raise _Timeout
+
+
+def _init_worker(states):
+    global _states
+    _states = states
+
+
+def _run(job):
+    """
+    Run one job in a worker process, capturing any error
+    """
+    index, function, filename, channel, timeout = job
+    if _states is not None:
+        _states[index] = _RUNNING
+    # The alarm can go off at any moment until it's cancelled, even while
+    # another exception is being handled, so catch it around everything
+    try:
+        outcome = _run_with_alarm(function, filename, channel, timeout)
+    except _Timeout:
+        outcome = None, f'Timed out after {timeout} s'
+    if _states is not None:
+        _states[index] = _DONE
+    return outcome
+
+
+def _run_with_alarm(function, filename, channel, timeout):
+    try:
+        if timeout is not None:
+            os_signal.signal(os_signal.SIGALRM, _alarm)
+            os_signal.setitimer(os_signal.ITIMER_REAL, timeout)
+        # Decode only the channel needed, into a contiguous array
+        soundfile = load(filename, channels=channel)
+        return function(soundfile['signal'], soundfile['fs']), None
+    except Exception as e:
+        return None, f'{type(e).__name__}: {e}'
+    finally:
+        if timeout is not None:
+            os_signal.setitimer(os_signal.ITIMER_REAL, 0)
+
+
+def _run_chunk(jobs):
+    return [_run(job) for job in jobs]
+
+
+def _run_alone(job):
+    """
+    Run one job in a new worker process, reporting it if the process dies
+    """
+    with ProcessPoolExecutor(max_workers=1) as executor:
+        try:
+            return executor.submit(_run, job).result()
+        except BrokenProcessPool as e:
+            return None, f'{type(e).__name__}: {e}'
+
+
+def _run_all(jobs, workers):
+    """
+    Run jobs on a pool of worker processes, returning the outcome of each
+
+    If a worker process dies (from a segfault, or being killed for using too
+    much memory, for instance), the pool is broken, and all its jobs fail.
+    The jobs that were running then are run again one at a time, to find
+    which of them killed it, and the pool is restarted for the rest.
+    """
+    outcomes = [None] * len(jobs)
+    todo = list(range(len(jobs)))
+    while todo:
+        states = multiprocessing.Array('b', len(jobs), lock=False)
+        # Send jobs in chunks, to reduce overhead for many small files
+        chunksize = max(1, len(todo) // (4 * workers))
+        chunks = [todo[n:n + chunksize]
+                  for n in range(0, len(todo), chunksize)]
+        failed = []
+        with ProcessPoolExecutor(max_workers=workers,
+                                 initializer=_init_worker,
+                                 initargs=(states,)) as executor:
+            futures = [executor.submit(_run_chunk,
+                                       [(n, *jobs[n]) for n in chunk])
+                       for chunk in chunks]
+            for chunk, future in zip(chunks, futures):
+                try:
+                    for n, outcome in zip(chunk, future.result()):
+                        outcomes[n] = outcome
+                except BrokenProcessPool:
+                    failed += chunk
+
+        crashed = [n for n in failed if states[n] == _RUNNING]
+        if not crashed:
+            # Died between jobs, so try them all one at a time
+            crashed = failed
+        for n in crashed:
+            outcomes[n] = _run_alone((n, *jobs[n]))
+        todo = [n for n in failed if n not in crashed]
+    return outcomes
+
+
+def analyze_files(files, function, *, per_channel=False, workers=None,
+                  timeout=None):
+    """
+    Run an analyzer function on many sound files, in parallel
+
+    Parameters
+    ----------
+    files : iterable of str
+        Paths of the files to analyze.
+    function : callable
+        Called as ``function(signal, fs)``, like for analyze_channels().  It
+        runs in another process, so it must be picklable, such as a function
+        defined at the top level of a module, or a functools.partial() of
+        one.
+    per_channel : bool, optional
+        If True, each channel of each file is a separate job, and `function`
+        gets a 1-D signal.  Otherwise, it gets each whole file, with the
+        same shape as from load() (default: False).
+    workers : int, optional
+        Number of worker processes (default: number of CPUs).
+    timeout : float, optional
+        Maximum time in seconds for each job, after which it is abandoned
+        and reported as an error.  Only supported on POSIX systems
+        (default: None, no limit).
+
+    Returns
+    -------
+    results : list of BatchResult
+        One per file, or per channel of each file, in the order given.
+        Failed jobs are reported in the results instead of raising, even if
+        they crash the worker process.
+
+    Examples
+    --------
+    >>> from glob import glob
+    >>> from waveform_analysis import THD
+    >>> for result in analyze_files(glob('captures/*.wav'), THD,
+    ...                             per_channel=True):
+    ...     print(result.filename, result.channel, result.value)
+    """
+    if timeout is not None and not hasattr(os_signal, 'setitimer'):
+        raise NotImplementedError('timeout requires POSIX interval timers')
+
+    jobs = []
+    results = []
+    for filename in files:
+        if per_channel:
+            try:
+                channels = info(filename)['channels']
+            except Exception as e:
+                results.append(BatchResult(filename, None, None,
+                                           f'{type(e).__name__}: {e}'))
+                continue
+            for channel in range(channels):
+                jobs.append((function, filename, channel, timeout))
+                results.append(BatchResult(filename, channel, None, None))
+        else:
+            jobs.append((function, filename, None, timeout))
+            results.append(BatchResult(filename, None, None, None))
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    outcomes = iter(_run_all(jobs, workers))
+    for n, result in enumerate(results):
+        if result.error is None:
+            value, error = next(outcomes)
+            results[n] = result._replace(value=value, error=error)
+
+    return results
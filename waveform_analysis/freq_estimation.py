@@ -1,34 +1,52 @@
 #!/usr/bin/env python
 
-from numpy import argmax, asarray, copy, diff, log, mean
-from numpy.fft import rfft
-from scipy.signal import correlate, decimate
-from scipy.signal.windows import kaiser
+from functools import lru_cache
 
-from waveform_analysis._common import find, parabolic
+from numpy import (arange, argmax, array, asarray, ceil, clip, concatenate,
+                   diff, dtype as as_dtype, empty, errstate, float64, full,
+                   inf, isfinite, log, maximum, mean, minimum, nan, newaxis,
+                   searchsorted, take_along_axis, where)
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy.fft import irfft, next_fast_len, rfft
+from scipy.signal import get_window
 
+from waveform_analysis._common import find, parabolic, parabolic_batch
+from waveform_analysis.profiling import stage
 
-def freq_from_crossings(signal, fs, interp='linear'):
-    """
-    Estimate frequency by counting zero crossings
 
-    Works well for long low-noise sines, square, triangle, etc.
+def _rising_crossings(signal, interp, hysteresis=0, armed=False):
+    """
+    Find the positions of rising-edge zero crossings in a signal
 
-    Pros: Fast, accurate (increasing with signal length).
+    With hysteresis, a crossing is ignored unless the signal dipped below
+    -hysteresis since the previous crossing (or, for the first crossing, since
+    before the signal if `armed`), so noise riding on a slow crossing doesn't
+    count it many times.
 
-    Cons: Doesn't work if there are multiple zero crossings per cycle,
-    low-frequency baseline shift, noise, inharmonicity, etc.
+    Returns the crossings and whether the signal dipped after the last one.
     """
-    signal = asarray(signal) + 0.0
-
     # Find all indices right before a rising-edge zero crossing
     indices = find((signal[1:] >= 0) & (signal[:-1] < 0))
 
+    if hysteresis:
+        # Most recent dip at or before each crossing, or -1 if none
+        lows = concatenate(([-1], find(signal < -hysteresis)))
+        last_low = lows[searchsorted(lows, indices, side='right') - 1]
+        previous = concatenate(([-1], indices[:-1]))
+        keep = last_low > previous
+        if len(keep):
+            keep[0] |= armed
+        if len(indices):
+            armed = lows[-1] > indices[-1]
+        else:
+            armed = armed or len(lows) > 1
+        indices = indices[keep]
+
     if interp == 'linear':
         # More accurate, using linear interpolation to find intersample
         # zero-crossings (Measures 1000.000129 Hz for 1000 Hz, for instance)
-        crossings = [i - signal[i] / (signal[i+1] - signal[i])
-                     for i in indices]
+        crossings = indices - signal[indices] / (signal[indices + 1] -
+                                                 signal[indices])
     elif interp == 'none' or interp is None:
         # Naive (Measures 1000.185 Hz for 1000 Hz, for instance)
         crossings = indices
@@ -38,10 +56,96 @@ def freq_from_crossings(signal, fs, interp='linear'):
         # TODO: Some other interpolation based on neighboring points might be
         # better.  Spline, cubic, whatever  Can pass it a function?
 
+    return crossings, armed
+
+
+def freq_from_crossings(signal, fs, interp='linear', hysteresis=0,
+                        dtype=float64):
+    """
+    Estimate frequency by counting zero crossings
+
+    Works well for long low-noise sines, square, triangle, etc.
+
+    Pros: Fast, accurate (increasing with signal length).
+
+    Cons: Doesn't work if there are multiple zero crossings per cycle,
+    low-frequency baseline shift, noise, inharmonicity, etc.
+
+    A `hysteresis` larger than the noise amplitude makes it usable on
+    slightly noisy signals: a crossing only counts if the signal went below
+    -hysteresis since the previous one.
+
+    `dtype` is the floating-point type to compute in, such as float32 to
+    halve memory use (default: float64).
+    """
+    signal = asarray(signal, dtype)
+
+    with stage('freq_from_crossings.find', signal):
+        crossings, armed = _rising_crossings(signal, interp, hysteresis)
+
     return fs / mean(diff(crossings))
 
 
-def freq_from_fft(signal, fs):
+def freq_from_crossings_blocks(blocks, fs, interp='linear', hysteresis=0):
+    """
+    Estimate frequency by counting zero crossings, in a signal that arrives
+    in blocks
+
+    Same as freq_from_crossings(), but takes an iterable of consecutive 1-D
+    blocks of the signal, such as from analyze_channels() with a
+    `blocksize`, and only keeps the first and last crossing and the count
+    between blocks, so memory use is bounded by the block size.
+    """
+    if interp not in {'linear', 'none', None}:
+        raise ValueError('Interpolation method not understood')
+
+    first = last = None
+    count = 0
+    armed = False
+    previous = []  # Last sample of previous block, for crossings between
+    position = 0  # Index of the first sample of the current block
+    for block in blocks:
+        block = concatenate((previous, asarray(block) + 0.0))
+        crossings, armed = _rising_crossings(block, interp, hysteresis,
+                                             armed)
+        if len(crossings):
+            # Positions in the whole signal
+            crossings = crossings + (position - len(previous))
+            if first is None:
+                first = crossings[0]
+            last = crossings[-1]
+            count += len(crossings)
+        position += len(block) - len(previous)
+        previous = block[-1:]
+
+    # Mean period, the same as mean(diff(crossings))
+    return fs * (count - 1) / (last - first) if count > 1 else nan
+
+
+# Number of windows, by type and length, kept for reuse
+WINDOW_CACHE_SIZE = 16
+
+
+def _window(window, N, dtype=float64):
+    """
+    Return the (symmetric) window of length N from get_window(), of type
+    dtype
+
+    Synthesizing a Kaiser window evaluates a Bessel function at every point,
+    so windows are cached by specification, length and type, and returned
+    read-only, since they're shared.
+    """
+    return _cached_window(window, N, as_dtype(dtype))
+
+
+@lru_cache(maxsize=WINDOW_CACHE_SIZE)
+def _cached_window(window, N, dtype):
+    w = get_window(window, N, fftbins=False).astype(dtype, copy=False)
+    w.flags.writeable = False
+    return w
+
+
+def freq_from_fft(signal, fs, window=('kaiser', 100), dtype=float64):
     """
     Estimate frequency from peak of FFT
 
@@ -53,24 +157,61 @@ def freq_from_fft(signal, fs):
 
     Cons: Doesn't find the right value if harmonics are stronger than
     fundamental, which is common.
+
+    `window` is a window specification for scipy.signal.get_window(), such
+    as ('kaiser', 38) or 'hann'.  `dtype` is the floating-point type to
+    compute in, such as float32 to halve memory use and traffic, at some
+    cost in accuracy (default: float64).
     """
-    signal = asarray(signal)
+    signal = asarray(signal, dtype)
 
     N = len(signal)
 
     # Compute Fourier transform of windowed signal
-    windowed = signal * kaiser(N, 100)
-    f = rfft(windowed)
+    with stage('freq_from_fft.window', signal):
+        windowed = signal * _window(window, N, dtype)
+    with stage('freq_from_fft.rfft', windowed):
+        f = rfft(windowed)
 
     # Find the peak and interpolate to get a more accurate peak
-    i_peak = argmax(abs(f))  # Just use this value for less-accurate result
-    i_interp = parabolic(log(abs(f)), i_peak)[0]
+    with stage('freq_from_fft.peak_search', f):
+        i_peak = argmax(abs(f))  # Just use this value for less-accurate result
+        i_interp = parabolic(log(abs(f)), i_peak)[0]
 
     # Convert to equivalent frequency
     return fs * i_interp / N  # Hz
 
 
-def freq_from_autocorr(signal, fs):
+def _lag_range(N, fs, fmin, fmax):
+    """
+    Range of autocorrelation lags (periods) to search for fundamentals
+    between fmin and fmax
+    """
+    min_lag = 0 if fmax is None else int(fs / fmax)
+    if fmin is None:
+        max_lag = N - 1
+    else:
+        max_lag = min(int(ceil(fs / fmin)), N - 2)
+    return min_lag, max_lag
+
+
+def _autocorr(signal, max_lag):
+    """
+    Autocorrelation along the last axis for lags 0 to max_lag + 1, with DC
+    offset removed
+    """
+    N = signal.shape[-1]
+
+    # Calculate autocorrelation from the power spectrum (Wiener-Khinchin),
+    # for non-negative lags only.  Zero-padding to at least N + max_lag
+    # keeps the circular correlation from wrapping around into those lags.
+    signal = signal - mean(signal, axis=-1, keepdims=True)  # Remove DC
+    n = next_fast_len(N + max_lag + 1, real=True)
+    f = rfft(signal, n, axis=-1)
+    return irfft(f.real**2 + f.imag**2, n, axis=-1)[..., :min(max_lag + 2, N)]
+
+
+def freq_from_autocorr(signal, fs, fmin=None, fmax=None, dtype=float64):
     """
     Estimate frequency using autocorrelation
 
@@ -80,64 +221,298 @@ def freq_from_autocorr(signal, fs):
     Cons: Not as accurate, doesn't find fundamental for inharmonic things like
     musical instruments, this implementation has trouble with finding the true
     peak
+
+    `fmin` and `fmax` limit the search to fundamentals in that range (Hz),
+    and only the lags needed for it are computed, which is faster for long
+    signals.  `dtype` is the floating-point type to compute in, as for
+    freq_from_fft().
     """
-    signal = asarray(signal) + 0.0
+    signal = asarray(signal, dtype)
 
-    # Calculate autocorrelation, and throw away the negative lags
-    signal -= mean(signal)  # Remove DC offset
-    corr = correlate(signal, signal, mode='full')
-    corr = corr[len(corr)//2:]
+    # Calculate autocorrelation, only for the lags needed
+    min_lag, max_lag = _lag_range(len(signal), fs, fmin, fmax)
+    with stage('freq_from_autocorr.autocorr', signal):
+        corr = _autocorr(signal, max_lag)
 
-    # Find the first valley in the autocorrelation
-    d = diff(corr)
-    start = find(d > 0)[0]
+    with stage('freq_from_autocorr.peak_search', corr):
+        # Find the first valley in the autocorrelation
+        d = diff(corr[min_lag:])
+        start = find(d > 0)[0] + min_lag
 
-    # Find the next peak after the low point (other than 0 lag).  This bit is
-    # not reliable for long signals, due to the desired peak occurring between
-    # samples, and other peaks appearing higher.
-    i_peak = argmax(corr[start:]) + start
-    i_interp = parabolic(corr, i_peak)[0]
+        # Find the next peak after the low point (other than 0 lag).  This
+        # bit is not reliable for long signals, due to the desired peak
+        # occurring between samples, and other peaks appearing higher.
+        i_peak = argmax(corr[start:max_lag + 1]) + start
+        i_interp = parabolic(corr, i_peak)[0]
 
     return fs / i_interp
 
 
-def freq_from_hps(signal, fs):
+# Most harmonics summed by the harmonic product spectrum
+HPS_HARMONICS = 8
+
+
+def _hps(X, fs, N, fmin=None, fmax=None):
+    """
+    Harmonic product spectrum of log spectra X (along the last axis) of
+    N-point FFTs, and the bin of its peak between fmin and fmax
+
+    Sums the spectra downsampled by each harmonic number, by taking every
+    h-th bin, for all harmonics in one indexing operation.  Uses as many
+    harmonics of fmax as fit below Nyquist, up to HPS_HARMONICS.
+    """
+    nyquist = X.shape[-1] - 1  # Bin
+    if fmax is None:
+        harmonics = HPS_HARMONICS
+        max_bin = nyquist // harmonics
+    else:
+        max_bin = max(1, min(int(ceil(fmax * N / fs)), nyquist - 1))
+        harmonics = max(1, min(nyquist // max_bin, HPS_HARMONICS))
+    min_bin = 1 if fmin is None else max(1, int(fmin * N / fs))
+
+    # Bins h*k of each harmonic h, for each fundamental bin k, plus one past
+    # the search band for interpolation (clipped to Nyquist)
+    bins = arange(max_bin + 2) * arange(1, harmonics + 1)[:, newaxis]
+    hps = X[..., minimum(bins, nyquist)].sum(axis=-2)
+
+    i_peak = argmax(hps[..., min_bin:max_bin + 1], axis=-1) + min_bin
+    return hps, i_peak
+
+
+def freq_from_hps(signal, fs, window=('kaiser', 100), fmin=None, fmax=None,
+                  dtype=float64):
     """
     Estimate frequency using harmonic product spectrum
 
     Low frequency noise piles up and overwhelms the desired peaks
 
     Doesn't work well if signal doesn't have harmonics
+
+    `window` is a window specification, as for freq_from_fft().  `fmin` and
+    `fmax` limit the search to fundamentals in that range (Hz), and more
+    harmonics are used for lower `fmax`.  `dtype` is the floating-point type
+    to compute in, as for freq_from_fft().
     """
-    signal = asarray(signal) + 0.0
+    signal = array(signal, dtype)
 
     N = len(signal)
-    signal -= mean(signal)  # Remove DC offset
+    with stage('freq_from_hps.window', signal):
+        signal -= mean(signal)  # Remove DC offset
 
-    # Compute Fourier transform of windowed signal
-    windowed = signal * kaiser(N, 100)
+        # Compute Fourier transform of windowed signal
+        windowed = signal * _window(window, N, dtype)
 
     # Get spectrum
-    X = log(abs(rfft(windowed)))
+    with stage('freq_from_hps.rfft', windowed):
+        X = log(abs(rfft(windowed)))
 
-    # Remove mean of spectrum (so sum is not increasingly offset
-    # only in overlap region)
-    X -= mean(X)
+    with stage('freq_from_hps.peak_search', X):
+        # Remove mean of spectrum (so sum is not increasingly offset
+        # only in overlap region)
+        X -= mean(X)
 
-    # Downsample sum logs of spectra instead of multiplying
-    hps = copy(X)
-    for h in range(2, 9):  # TODO: choose a smarter upper limit
-        dec = decimate(X, h, zero_phase=True)
-        hps[:len(dec)] += dec
+        # Downsample sum logs of spectra instead of multiplying
+        hps, i_peak = _hps(X, fs, N, fmin, fmax)
 
-    # Find the peak and interpolate to get a more accurate peak
-    i_peak = argmax(hps[:len(dec)])
-    i_interp = parabolic(hps, i_peak)[0]
+        # Interpolate to get a more accurate peak
+        i_interp = parabolic(hps, i_peak)[0]
 
     # Convert to equivalent frequency
     return fs * i_interp / N  # Hz
 
 
+# Number of samples of frames processed at once by track_frequency()
+TRACK_BATCH_SIZE = 2**20
+
+
+def track_frequency(signal, fs, method='fft', frame=4096, hop=None,
+                    fmin=None, fmax=None, window=('kaiser', 100),
+                    dtype=float64):
+    """
+    Estimate frequency over time, in overlapping frames
+
+    Runs the same estimate as freq_from_fft(), freq_from_autocorr(),
+    freq_from_hps() or freq_from_crossings() on each frame, but on batches
+    of frames at once, as 2-D arrays, instead of calling them per frame.
+
+    Parameters
+    ----------
+    signal : array_like
+        Input signal, 1-D.
+    fs : float
+        Sampling frequency of the signal in Hz.
+    method : {'fft', 'autocorr', 'hps', 'crossings'}, optional
+        Frequency estimator to use.
+    frame : int, optional
+        Number of samples per frame.
+    hop : int, optional
+        Number of samples between the starts of frames (default: half of
+        `frame`).
+    fmin, fmax : float, optional
+        Range of fundamentals to search (Hz), for the 'autocorr' and 'hps'
+        methods.
+    window : str or tuple, optional
+        Window specification for scipy.signal.get_window(), for the 'fft'
+        and 'hps' methods.
+    dtype : dtype, optional
+        Floating-point type to compute in, such as float32 to halve memory
+        use and traffic, at some cost in accuracy.
+
+    Returns
+    -------
+    times : ndarray
+        Time of the center of each frame, in seconds.
+    freqs : ndarray
+        Estimated frequency of each frame in Hz, NaN if none was found.
+    confidence : ndarray
+        Normalized autocorrelation of each frame at the estimated period,
+        from 0 (not periodic) to 1 (perfectly periodic).
+
+    Examples
+    --------
+    Monitor the drift of an oscillator once per second:
+
+    >>> times, freqs, confidence = track_frequency(signal, fs, frame=fs,
+    ...                                            hop=fs)
+    """
+    if method not in {'fft', 'autocorr', 'hps', 'crossings'}:
+        raise ValueError(f"Method '{method}' not understood.  Choose one "
+                         "of: fft, autocorr, hps, crossings")
+    if hop is None:
+        hop = frame // 2
+
+    n_frames = max(0, (len(signal) - frame) // hop + 1)
+    starts = arange(n_frames) * hop
+    times = (starts + frame / 2) / fs
+    freqs = empty(n_frames)
+    confidence = empty(n_frames)
+
+    # Same window for every frame
+    if method in {'fft', 'hps'}:
+        window = _window(window, frame, dtype)
+
+    # Process frames in batches, to bound memory use for long signals
+    per_batch = max(1, TRACK_BATCH_SIZE // frame)
+    for first in range(0, n_frames, per_batch):
+        last = min(first + per_batch, n_frames)
+        chunk = asarray(signal[starts[first]:starts[last - 1] + frame],
+                        dtype)
+        frames = sliding_window_view(chunk, frame)[::hop]
+
+        corr = None
+        with stage(f'track_frequency.{method}', chunk):
+            if method == 'fft':
+                batch = _track_fft(frames, fs, window)
+            elif method == 'autocorr':
+                batch, corr = _track_autocorr(frames, fs, fmin, fmax)
+            elif method == 'hps':
+                batch = _track_hps(frames, fs, window, fmin, fmax)
+            elif method == 'crossings':
+                batch = _track_crossings(chunk, fs, frame, hop, last - first)
+
+        freqs[first:last] = batch
+        with stage('track_frequency.confidence', chunk):
+            confidence[first:last] = _periodicity(frames, fs / batch, corr)
+
+    return times, freqs, confidence
+
+
+def _track_fft(frames, fs, window):
+    """
+    freq_from_fft() of each row of frames
+    """
+    N = frames.shape[-1]
+    f = abs(rfft(frames * window, axis=-1))
+    i_peak = argmax(f, axis=-1)
+    i_peak = clip(i_peak, 1, f.shape[-1] - 2)
+    with errstate(divide='ignore'):
+        i_interp = parabolic_batch(log(f), i_peak)[0]
+    return fs * i_interp / N
+
+
+def _track_autocorr(frames, fs, fmin, fmax):
+    """
+    freq_from_autocorr() of each row of frames, and their autocorrelations
+    """
+    min_lag, max_lag = _lag_range(frames.shape[-1], fs, fmin, fmax)
+    corr = _autocorr(frames, max_lag)
+
+    # Find the first valley in the autocorrelation of each frame
+    rising = diff(corr[:, min_lag:], axis=-1) > 0
+    found = rising.any(axis=-1)
+    start = argmax(rising, axis=-1) + min_lag
+
+    # Find the next peak after the low point
+    lags = arange(corr.shape[-1])
+    search = (lags >= start[:, newaxis]) & (lags <= max_lag)
+    i_peak = argmax(where(search, corr, -inf), axis=-1)
+    i_peak = clip(i_peak, 1, corr.shape[-1] - 2)
+    i_interp = parabolic_batch(corr, i_peak)[0]
+    return where(found, fs / i_interp, nan), corr
+
+
+def _track_hps(frames, fs, window, fmin, fmax):
+    """
+    freq_from_hps() of each row of frames
+    """
+    N = frames.shape[-1]
+    frames = frames - mean(frames, axis=-1, keepdims=True)  # Remove DC
+
+    with errstate(divide='ignore'):
+        X = log(abs(rfft(frames * window, axis=-1)))
+    X -= mean(X, axis=-1, keepdims=True)
+
+    hps, i_peak = _hps(X, fs, N, fmin, fmax)
+    i_interp = parabolic_batch(hps, i_peak)[0]
+    return fs * i_interp / N
+
+
+def _track_crossings(chunk, fs, frame, hop, n_frames):
+    """
+    freq_from_crossings() of each frame of a chunk of signal
+
+    Finds the crossings of the whole chunk once, then counts the ones in each
+    frame.
+    """
+    crossings, armed = _rising_crossings(chunk, 'linear')
+    if not len(crossings):
+        return full(n_frames, nan)
+
+    # Crossings between samples i and i+1 where both are in the frame
+    starts = arange(n_frames) * hop
+    lo = searchsorted(crossings, starts)
+    hi = searchsorted(crossings, starts + frame - 1)
+    count = hi - lo
+    first = crossings[minimum(lo, len(crossings) - 1)]
+    last = crossings[maximum(hi - 1, 0)]
+    with errstate(divide='ignore', invalid='ignore'):
+        return where(count > 1, fs * (count - 1) / (last - first), nan)
+
+
+def _periodicity(frames, periods, corr=None):
+    """
+    Normalized autocorrelation of each row of frames at a (fractional) lag
+
+    `corr` is their autocorrelation, if already calculated.
+    """
+    N = frames.shape[-1]
+    if corr is None:
+        corr = _autocorr(frames, N - 2)
+
+    valid = (isfinite(periods) & (periods >= 0) &
+             (periods < corr.shape[-1] - 1))
+    periods = where(valid, periods, 0)
+
+    # Linear interpolation between lags, scaled for the shrinking overlap
+    i = periods.astype(int)[:, newaxis]
+    frac = (periods - i[:, 0])
+    r = (take_along_axis(corr, i, axis=-1)[:, 0] * (1 - frac) +
+         take_along_axis(corr, i + 1, axis=-1)[:, 0] * frac)
+    with errstate(divide='ignore', invalid='ignore'):
+        r = r / corr[:, 0] * N / (N - periods)
+    return where(valid, clip(r, 0, 1), nan)
+
+
 if __name__ == '__main__':
     import pytest
     pytest.main(['../tests/test_freq_estimation.py', "--capture=sys"])
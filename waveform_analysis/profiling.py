@@ -0,0 +1,176 @@
+"""
+Opt-in profiling of the stages of an analysis
+
+The analysis functions mark their stages (reading, scaling, windowing, FFTs,
+peak search, filtering...) with stage().  Normally that does nothing, but
+inside ``with Profile() as profile:``, the wall time, size of the input
+arrays and, optionally, memory allocated by each stage are recorded::
+
+    >>> from waveform_analysis import THDN
+    >>> from waveform_analysis._common import load
+    >>> from waveform_analysis.profiling import Profile
+    >>> with Profile(memory=True) as profile:
+    ...     soundfile = load('test.wav')
+    ...     THDN(soundfile['signal'], soundfile['fs'])
+    >>> print(profile.report())
+"""
+
+import json
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+# The Profile currently recording, if any
+_active = None
+
+# Returned by stage() when not profiling
+_NOT_PROFILING = nullcontext()
+
+
+def stage(name, *arrays):
+    """
+    Context manager marking a stage of an analysis, to be profiled
+
+    Costs only a function call when no Profile is recording.
+
+    Parameters
+    ----------
+    name : str
+        Name of the stage, such as 'thd.rfft'.
+    *arrays : ndarray
+        Inputs of the stage, whose sizes are recorded.
+    """
+    if _active is None:
+        return _NOT_PROFILING
+    return _Stage(_active, name, arrays)
+
+
+class _Stage:
+    def __init__(self, profile, name, arrays):
+        self.profile = profile
+        self.name = name
+        self.nbytes = sum(getattr(array, 'nbytes', 0) for array in arrays)
+
+    def __enter__(self):
+        if self.profile.memory:
+            self.memory, self.outer_peak = tracemalloc.get_traced_memory()
+            self.inner_peak = 0
+            tracemalloc.reset_peak()
+            self.profile._stages.append(self)
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.start
+        allocated = None
+        if self.profile.memory:
+            peak = max(tracemalloc.get_traced_memory()[1], self.inner_peak)
+            allocated = peak - self.memory
+            self.profile._stages.pop()
+            # reset_peak() lost the peak before this stage, so pass on the
+            # overall peak to the enclosing stage
+            if self.profile._stages:
+                outer = self.profile._stages[-1]
+                outer.inner_peak = max(outer.inner_peak, self.outer_peak,
+                                       peak)
+        self.profile._record(self.name, elapsed, self.nbytes, allocated)
+
+
+class Profile:
+    """
+    Records the time taken by each stage of the analysis, while active
+
+    Parameters
+    ----------
+    memory : bool, optional
+        If True, also record the peak memory allocated during each stage,
+        with tracemalloc, which slows everything down, so the times are less
+        accurate.  Requires Python 3.9 or later (default: False).
+
+    Attributes
+    ----------
+    stages : dict
+        For each stage name, in the order first run, a dict of the number of
+        'calls', total 'time' in seconds, total 'bytes' of input arrays, and
+        the largest peak 'allocated' by one call in bytes (None if memory
+        isn't recorded).
+    """
+
+    def __init__(self, memory=False):
+        if memory and not hasattr(tracemalloc, 'reset_peak'):
+            raise NotImplementedError('Profiling memory requires Python 3.9 '
+                                      'or later')
+        self.memory = memory
+        self.stages = {}
+        self._stages = []
+
+    def __enter__(self):
+        global _active
+        if _active is not None:
+            raise RuntimeError('Another Profile is already recording')
+        self._started_tracing = self.memory and not tracemalloc.is_tracing()
+        if self._started_tracing:
+            tracemalloc.start()
+        _active = self
+        return self
+
+    def __exit__(self, *exc_info):
+        global _active
+        _active = None
+        if self._started_tracing:
+            tracemalloc.stop()
+
+    def _record(self, name, elapsed, nbytes, allocated):
+        record = self.stages.setdefault(name, {'calls': 0, 'time': 0.0,
+                                               'bytes': 0, 'allocated': None})
+        record['calls'] += 1
+        record['time'] += elapsed
+        record['bytes'] += nbytes
+        if allocated is not None:
+            record['allocated'] = max(record['allocated'] or 0, allocated)
+
+    def report(self):
+        """
+        Return the stages as a table, for printing
+        """
+        width = max(map(len, self.stages), default=0) + 2
+        lines = [f'{"Stage":<{width}}{"Calls":>7}{"Time (ms)":>12}'
+                 f'{"Input (MB)":>12}{"Peak (MB)":>12}']
+        for name, record in self.stages.items():
+            allocated = record['allocated']
+            allocated = '' if allocated is None else f'{allocated / 1e6:.3f}'
+            lines.append(f'{name:<{width}}{record["calls"]:>7}'
+                         f'{record["time"] * 1e3:>12.3f}'
+                         f'{record["bytes"] / 1e6:>12.3f}'
+                         f'{allocated:>12}'.rstrip())
+        return '\n'.join(lines)
+
+    def to_json(self, file):
+        """
+        Write the stages to a JSON file, as in `stages`
+        """
+        with open(file, 'w') as f:
+            json.dump(self.stages, f, indent=2)
+
+
+@contextmanager
+def profile_to(report=False, filename=None):
+    """
+    Profile the enclosed code, for the scripts' --profile options
+
+    If `report` is True, the profile is printed as a table to standard
+    error afterwards, and if `filename` is given, it's written there as
+    JSON.  If neither, nothing is profiled.
+    """
+    if not report and filename is None:
+        yield None
+        return
+    profile = Profile()
+    try:
+        with profile:
+            yield profile
+    finally:
+        if filename is not None:
+            profile.to_json(filename)
+        if report:
+            print(profile.report(), file=sys.stderr)
@@ -0,0 +1,285 @@
+"""
+Live analysis of audio as it arrives, from a sound device, a pipe, or a file
+replayed as if it were live
+
+A source is any iterable of 2-D blocks of samples, of shape
+(samples, channels), scaled to floats in [-1, +1), with `fs` and `channels`
+attributes.
+"""
+
+import sys
+import time
+
+import numpy as np
+
+from waveform_analysis._common import _scale, blocks, info
+from waveform_analysis.freq_estimation import freq_from_fft
+from waveform_analysis.results import LevelMeter
+from waveform_analysis.thd import THD
+
+# Number of samples per block read from a source
+BLOCKSIZE = 4096
+
+# Number of most recent samples used to measure frequency and THD
+WINDOW = 16384
+
+# Raw PCM sample formats that can be read from a stream
+STREAM_DTYPES = ('uint8', 'int8', 'int16', 'int32', 'int64', 'float32',
+                 'float64')
+
+
+class FileSource:
+    """
+    Replays a sound file in blocks, as if it were live input
+
+    Parameters
+    ----------
+    filename : str
+        Path of the sound file to replay.
+    blocksize : int, optional
+        Number of samples per block.
+    realtime : bool, optional
+        If True, each block is only delivered when it would have been
+        recorded, as for a sound device.  Otherwise, blocks are delivered as
+        fast as they can be read (default: False).
+    """
+
+    def __init__(self, filename, blocksize=BLOCKSIZE, realtime=False):
+        soundfile = info(filename)
+        self.filename = filename
+        self.fs = soundfile['fs']
+        self.channels = soundfile['channels']
+        self.blocksize = blocksize
+        self.realtime = realtime
+
+    def __iter__(self):
+        start = time.monotonic()
+        position = 0
+        for block in blocks(self.filename, self.blocksize):
+            if block.ndim == 1:
+                block = block[:, np.newaxis]
+            if self.realtime:
+                position += len(block)
+                delay = start + position / self.fs - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            yield block
+
+
+class StreamSource:
+    """
+    Reads raw interleaved PCM samples from a binary stream, such as a pipe
+
+    For example::
+
+        arecord -f S16_LE -r 48000 -c 2 | wave_analyzer.py --live --stdin
+            --rate 48000 --channels 2
+
+    Parameters
+    ----------
+    fs : float
+        Sampling frequency of the samples in Hz.
+    channels : int, optional
+        Number of interleaved channels.
+    dtype : str or numpy.dtype, optional
+        Format of the samples, such as 'int16', '<i4', 'uint8' or 'float32',
+        of any byte order, from STREAM_DTYPES.  Integers are scaled to floats
+        the same way as by load(), and int8 by 2**7.
+    blocksize : int, optional
+        Number of samples per block.
+    stream : binary file object, optional
+        Where to read from (default: standard input).
+    """
+
+    def __init__(self, fs, channels=1, dtype='int16', blocksize=BLOCKSIZE,
+                 stream=None):
+        self.fs = fs
+        self.channels = channels
+        self.dtype = np.dtype(dtype)
+        if self.dtype.newbyteorder('=').name not in STREAM_DTYPES:
+            raise ValueError(f'Sample format {dtype} not supported.  Choose '
+                             f'from: {", ".join(STREAM_DTYPES)}')
+        self.blocksize = blocksize
+        self.stream = sys.stdin.buffer if stream is None else stream
+
+    def __iter__(self):
+        frame_size = self.dtype.itemsize * self.channels
+        while True:
+            data = self.stream.read(self.blocksize * frame_size)
+            # Ignore an incomplete frame at the end of the stream
+            samples = len(data) // frame_size
+            if not samples:
+                return
+            block = np.frombuffer(data[:samples * frame_size], self.dtype)
+            yield _scale(block.reshape(samples, self.channels))
+
+
+class DeviceSource:
+    """
+    Records blocks from a sound device input
+
+    Requires the sounddevice package.
+
+    Parameters
+    ----------
+    fs : float
+        Sampling frequency in Hz.
+    channels : int, optional
+        Number of channels to record.
+    blocksize : int, optional
+        Number of samples per block.
+    device : int or str, optional
+        Input device, as understood by sounddevice (default: the default
+        input device).
+
+    Attributes
+    ----------
+    overflows : int
+        Number of blocks for which input was lost, because the previous
+        blocks weren't processed in time.
+    """
+
+    def __init__(self, fs, channels=1, blocksize=BLOCKSIZE, device=None):
+        try:
+            import sounddevice
+        except ImportError:
+            raise ImportError('Recording from a sound device requires the '
+                              'sounddevice package')
+        self._sounddevice = sounddevice
+        self.fs = fs
+        self.channels = channels
+        self.blocksize = blocksize
+        self.device = device
+        self.overflows = 0
+
+    def __iter__(self):
+        with self._sounddevice.InputStream(samplerate=self.fs,
+                                           channels=self.channels,
+                                           blocksize=self.blocksize,
+                                           device=self.device,
+                                           dtype='float32') as stream:
+            while True:
+                block, overflowed = stream.read(self.blocksize)
+                if overflowed:
+                    self.overflows += 1
+                yield block
+
+
+def _or_nan(measure, signal, fs):
+    """
+    Measure one channel, or return NaN if its spectral peak is at the edge of
+    the spectrum, as for noise or very short signals
+    """
+    try:
+        return measure(signal, fs)
+    except IndexError:
+        return np.nan
+
+
+class LiveAnalyzer:
+    """
+    Updates measurements of a live signal with each block that arrives
+
+    The DC offset and levels are measured over everything since the start,
+    with a LevelMeter.  Frequency and THD are measured on the most recent
+    `window` samples, and are NaN until a quarter of the window has arrived.
+    Once the window is full, they're only updated after another quarter of
+    it has arrived, so the work per block is bounded and doesn't grow with
+    time.  Measuring frequency and THD takes a few
+    milliseconds, so blocks should be longer than that to keep up with live
+    input.
+
+    Parameters
+    ----------
+    fs : float
+        Sampling frequency in Hz.
+    channels : int
+        Number of channels.
+    window : int, optional
+        Number of most recent samples used to measure frequency and THD.
+
+    Attributes
+    ----------
+    blocks : int
+        Number of blocks processed.
+    overruns : int
+        Number of blocks that took longer to process than to record, so that
+        live input would fall behind.
+    """
+
+    def __init__(self, fs, channels, window=WINDOW):
+        self.fs = fs
+        self.channels = channels
+        self.window = window
+        self.meter = LevelMeter(fs)
+        self.reset()
+
+    def process(self, block):
+        """
+        Measure the next block of the signal
+
+        Parameters
+        ----------
+        block : array_like
+            Next samples, of shape (samples, channels).
+
+        Returns
+        -------
+        readings : dict
+            'dc_offset', 'peak', 'rms', 'rms_a' and 'rms_468' as from
+            levels(), and 'frequency' and 'thd', each an array with one
+            value per channel.
+        """
+        start = time.perf_counter()
+        block = np.asarray(block, dtype=float).reshape(len(block),
+                                                       self.channels)
+
+        self.meter.process(block)
+
+        # Keep the most recent samples
+        n = min(len(block), self.window)
+        if n:
+            self.history[:-n] = self.history[n:]
+            self.history[-n:] = block[-n:]
+        self.filled = min(self.filled + len(block), self.window)
+        self.pending += len(block)
+
+        # Too few samples to measure frequency and THD at the start
+        if (self.filled >= self.window // 4 and
+                (self.filled < self.window or
+                 self.pending >= self.window // 4)):
+            self.pending = 0
+            recent = self.history[-self.filled:]
+            with np.errstate(all='ignore'):
+                self.frequency = np.array([
+                    _or_nan(freq_from_fft, recent[:, channel], self.fs)
+                    for channel in range(self.channels)])
+                try:
+                    self.thd = THD(recent, self.fs, axis=0)
+                except IndexError:
+                    self.thd = np.array([
+                        _or_nan(THD, recent[:, channel], self.fs)
+                        for channel in range(self.channels)])
+
+        readings = self.meter.results()
+        readings['frequency'] = self.frequency
+        readings['thd'] = self.thd
+
+        self.blocks += 1
+        if time.perf_counter() - start > len(block) / self.fs:
+            self.overruns += 1
+        return readings
+
+    def reset(self):
+        """
+        Forget the measurements, to start measuring a new signal
+        """
+        self.meter.reset()
+        self.history = np.zeros((self.window, self.channels))
+        self.filled = 0
+        self.pending = 0
+        self.frequency = np.full(self.channels, np.nan)
+        self.thd = np.full(self.channels, np.nan)
+        self.blocks = 0
+        self.overruns = 0
+
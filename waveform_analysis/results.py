@@ -0,0 +1,396 @@
+"""
+Measurements of sound files as compact result records, and bulk exporters
+for them, so results can be collected without parsing printed output
+"""
+
+import csv
+import json
+
+import numpy as np
+
+from waveform_analysis._common import load
+from waveform_analysis.freq_estimation import freq_from_fft
+from waveform_analysis.thd import THD, THDN
+from waveform_analysis.weighting_filters import (AWeightFilter,
+                                                 ITU_R_468_WeightFilter)
+
+# Number of samples measured at a time by levels()
+BLOCKSIZE = 2**16
+
+# Measurements that can be requested from measure(), and the fields of
+# ChannelResult that each one fills in
+METRICS = {
+    'frequency': ('frequency',),
+    'thd': ('thd',),
+    'thdn': ('thdn',),
+    'levels': ('dc_offset', 'peak', 'rms', 'rms_a', 'rms_468'),
+}
+
+
+def levels(signal, fs, blocksize=BLOCKSIZE):
+    """
+    Measure the DC offset and the levels of a signal
+
+    The signal is processed by a LevelMeter in blocks, so no full-size
+    temporary arrays are made, and a memory-mapped signal is only read once.
+
+    Parameters
+    ----------
+    signal : array_like
+        Input signal to analyze, 1-D, or 2-D of shape (samples, channels).
+    fs : float
+        Sampling frequency of the signal in Hz.
+    blocksize : int, optional
+        Number of samples processed at a time.
+
+    Returns
+    -------
+    levels : dict
+        'dc_offset' is the mean of the signal.  'peak' (highest absolute
+        sample value), 'rms', 'rms_a' (A-weighted RMS) and 'rms_468'
+        (ITU-R 468-weighted RMS) are measured after removing the DC offset.
+        Values are arrays with one element per channel for 2-D signals.
+    """
+    meter = LevelMeter(fs)
+    for start in range(0, len(signal), blocksize):
+        meter.process(signal[start:start + blocksize])
+    return meter.results()
+
+
+class LevelMeter:
+    """
+    Measures the DC offset and the levels of a signal in a single pass,
+    block by block
+
+    All the measurements of levels() are accumulated from each block as it
+    arrives, so memory use is bounded by the block size, and a file can be
+    measured while streaming it with blocks().
+
+    Parameters
+    ----------
+    fs : float
+        Sampling frequency of the signal in Hz.
+
+    Notes
+    -----
+    The DC offset is removed before measuring levels, but isn't known until
+    the end.  The mean and RMS are merged from each block's statistics
+    (Chan et al.), and the peak is found from the extreme values.  The
+    weighted signal with the DC offset removed is the weighted signal minus
+    the offset times the filter's step response, so its energy is
+    reconstructed at the end from the energy of the weighted signal, its
+    correlation with the step response, and the step response's energy.
+    The step response is only tracked until it has decayed.
+    """
+
+    # Stop tracking a weighting filter's step response once it has decayed
+    # below this fraction of its peak
+    STEP_TOLERANCE = 1e-12
+
+    def __init__(self, fs):
+        self.fs = fs
+        self.reset()
+
+    def process(self, block):
+        """
+        Measure the next block of the signal
+
+        Parameters
+        ----------
+        block : array_like
+            Next samples of the signal, 1-D, or 2-D of shape
+            (samples, channels).  Every block must have the same number of
+            channels.
+        """
+        block = np.asarray(block, dtype=float)
+        n = len(block)
+        if n == 0:
+            return
+
+        if self.offset is None:
+            # Measure relative to the first block's mean, to avoid losing
+            # precision to a large DC offset
+            self.offset = np.mean(block, axis=0)
+            self.mean = np.zeros_like(self.offset)
+            self.m2 = np.zeros_like(self.offset)
+            self.max = np.full_like(self.offset, -np.inf)
+            self.min = np.full_like(self.offset, np.inf)
+        block = block - self.offset
+
+        block_mean = np.mean(block, axis=0)
+        block_m2 = np.sum((block - block_mean)**2, axis=0)
+        delta = block_mean - self.mean
+        total = self.count + n
+        self.mean = self.mean + delta * n / total
+        self.m2 = self.m2 + block_m2 + delta**2 * self.count * n / total
+        self.count = total
+
+        self.max = np.maximum(self.max, np.max(block, axis=0))
+        self.min = np.minimum(self.min, np.min(block, axis=0))
+
+        for weighted in self.weighted.values():
+            weighted.process(block, self.STEP_TOLERANCE)
+
+    def results(self):
+        """
+        Return the measurements of the signal so far
+
+        Returns
+        -------
+        levels : dict
+            Same as from levels().
+        """
+        if not self.count:
+            raise ValueError('No samples have been measured')
+        mean = self.mean
+        results = {
+            'dc_offset': self.offset + mean,
+            'peak': np.maximum(self.max - mean, mean - self.min),
+            'rms': np.sqrt(self.m2 / self.count),
+        }
+        for name, weighted in self.weighted.items():
+            energy = weighted.energy(mean)
+            results[name] = np.sqrt(np.maximum(energy, 0) / self.count)
+        return results
+
+    def reset(self):
+        """
+        Forget the measurements, to start measuring a new signal
+        """
+        self.count = 0
+        self.offset = None
+        self.mean = None
+        self.m2 = None
+        self.max = None
+        self.min = None
+        self.weighted = {
+            'rms_a': _WeightedEnergy(AWeightFilter(self.fs),
+                                     AWeightFilter(self.fs)),
+            'rms_468': _WeightedEnergy(ITU_R_468_WeightFilter(self.fs),
+                                       ITU_R_468_WeightFilter(self.fs)),
+        }
+
+
+class _WeightedEnergy:
+    """
+    Energy of a weighted signal, correctable afterwards for removing an
+    offset from the signal before weighting it
+    """
+
+    def __init__(self, weighting, step):
+        self.weighting = weighting
+        self.step = step  # Same filter, for its step response
+        self.signal_energy = 0
+        self.cross = 0
+        self.step_energy = 0
+        self.step_peak = 0
+
+    def process(self, block, tolerance):
+        weighted = self.weighting.process(block)
+        self.signal_energy = self.signal_energy + np.sum(weighted**2, axis=0)
+        if self.step is not None:
+            response = self.step.process(np.ones(len(block)))
+            self.cross = self.cross + response @ weighted
+            self.step_energy += response @ response
+            peak = np.max(np.abs(response))
+            self.step_peak = max(self.step_peak, peak)
+            if peak < tolerance * self.step_peak:
+                self.step = None
+
+    def energy(self, offset):
+        """
+        Energy of the weighting of (signal - offset)
+        """
+        return (self.signal_energy - 2 * offset * self.cross +
+                offset**2 * self.step_energy)
+
+
+def measure(signal, fs, metrics=('frequency', 'thd', 'thdn')):
+    """
+    Make the requested measurements of a 1-D signal
+
+    Parameters
+    ----------
+    signal : array_like
+        Input signal to analyze.
+    fs : float
+        Sampling frequency of the signal in Hz.
+    metrics : iterable of str, optional
+        Names of measurements to make, from `METRICS` (default: frequency,
+        THD and THD+N).
+
+    Returns
+    -------
+    measurements : dict
+        Values of the ChannelResult fields filled in by the metrics, plus
+        'fs' and 'samples'.
+    """
+    results = {'fs': fs, 'samples': len(signal)}
+    for metric in metrics:
+        if metric == 'frequency':
+            results['frequency'] = freq_from_fft(signal, fs)
+        elif metric == 'thd':
+            results['thd'] = THD(signal, fs)
+        elif metric == 'thdn':
+            results['thdn'] = THDN(signal, fs)
+        elif metric == 'levels':
+            results.update(levels(signal, fs))
+        else:
+            raise ValueError(f"Metric '{metric}' not understood.  Choose "
+                             f"from: {', '.join(METRICS)}")
+    return results
+
+
+class ChannelResult:
+    """
+    Measurements of one channel of a sound file
+
+    Uses slots, so millions of them are cheap to keep in memory.  Fields
+    that weren't measured are None.
+    """
+
+    __slots__ = ('filename', 'channel', 'fs', 'samples', 'frequency', 'thd',
+                 'thdn', 'dc_offset', 'peak', 'rms', 'rms_a', 'rms_468',
+                 'error')
+
+    def __init__(self, filename, channel, **fields):
+        self.filename = filename
+        self.channel = channel
+        for field in self.__slots__[2:]:
+            setattr(self, field, fields.pop(field, None))
+        if fields:
+            raise TypeError(f'Unknown fields: {", ".join(fields)}')
+
+    def __repr__(self):
+        fields = ', '.join(f'{field}={value!r}' for field, value
+                           in self.as_dict().items() if value is not None)
+        return f'{type(self).__name__}({fields})'
+
+    def __eq__(self, other):
+        if not isinstance(other, ChannelResult):
+            return NotImplemented
+        return self.as_dict() == other.as_dict()
+
+    def as_dict(self):
+        """
+        Return the fields as a dict of plain Python values
+        """
+        return {field: _plain(getattr(self, field))
+                for field in self.__slots__}
+
+
+def _plain(value):
+    """
+    Convert NumPy scalars to Python scalars, for exporting
+    """
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def analyze_file(filename, metrics=('frequency', 'thd', 'thdn')):
+    """
+    Make the requested measurements of each channel of a sound file
+
+    Parameters
+    ----------
+    filename : str
+        Path of the sound file to analyze.
+    metrics : iterable of str, optional
+        Names of measurements to make, from `METRICS` (default: frequency,
+        THD and THD+N).
+
+    Returns
+    -------
+    results : list of ChannelResult
+        One per channel of the file.
+    """
+    soundfile = load(filename)
+    signal = soundfile['signal']
+    if signal.ndim == 1:
+        signal = signal[:, np.newaxis]
+    return [ChannelResult(filename, channel,
+                          **measure(signal[:, channel], soundfile['fs'],
+                                    metrics))
+            for channel in range(signal.shape[1])]
+
+
+def from_batch(batch_results):
+    """
+    Convert the output of batch.analyze_files() to ChannelResults
+
+    The analyzer function given to analyze_files() must have been measure()
+    (with functools.partial() to choose metrics), with per_channel=True.
+    Failed jobs become ChannelResults with only the `error` field filled.
+    """
+    return [ChannelResult(result.filename, result.channel,
+                          **(result.value or {}), error=result.error)
+            for result in batch_results]
+
+
+def _open(file, mode):
+    """
+    Open a path, or pass through an already-open file object
+    """
+    if hasattr(file, 'write'):
+        return _NoClose(file)
+    return open(file, mode, newline='', encoding='utf-8')
+
+
+class _NoClose:
+    def __init__(self, file):
+        self.file = file
+
+    def __enter__(self):
+        return self.file
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+def to_jsonl(results, file):
+    """
+    Write ChannelResults to a JSON Lines file, one object per line
+
+    `file` is a path or a text file object.
+    """
+    with _open(file, 'w') as f:
+        for result in results:
+            f.write(json.dumps(result.as_dict()) + '\n')
+
+
+def to_csv(results, file):
+    """
+    Write ChannelResults to a CSV file, with a header row of field names
+
+    `file` is a path or a text file object.  Missing values are empty.
+    """
+    with _open(file, 'w') as f:
+        writer = csv.writer(f)
+        writer.writerow(ChannelResult.__slots__)
+        for result in results:
+            writer.writerow(['' if value is None else value
+                             for value in result.as_dict().values()])
+
+
+def to_npz(results, file):
+    """
+    Write ChannelResults to a NumPy .npz file, with one array per field
+
+    `file` is a path or a binary file object.  Numeric fields are float
+    arrays with NaN for missing values, except 'channel', 'fs' and
+    'samples', which are integer arrays with -1 for missing values.
+    Load with ``np.load(file)``.
+    """
+    results = list(results)
+    columns = {}
+    for field in ChannelResult.__slots__:
+        values = [getattr(result, field) for result in results]
+        if field in {'filename', 'error'}:
+            columns[field] = np.array(['' if value is None else value
+                                       for value in values], dtype=str)
+        elif field in {'channel', 'fs', 'samples'}:
+            columns[field] = np.array([-1 if value is None else value
+                                       for value in values], dtype=np.int64)
+        else:
+            columns[field] = np.array([np.nan if value is None else value
+                                       for value in values], dtype=float)
+    np.savez(file, **columns)
@@ -0,0 +1,319 @@
+"""
+Analysis server, which keeps the library and its caches loaded between jobs
+
+Starting a new interpreter for every measurement repays the NumPy and SciPy
+imports and the filter designs each time.  Instead, a long-running server
+accepts jobs over a Unix socket or a localhost TCP port, runs them on a pool
+of worker processes that stay warm between jobs, and streams the results back.
+
+Protocol
+--------
+Requests and responses are JSON objects, one per line (JSON Lines).  A
+request names the files to analyze, and optionally the metrics to measure
+(from results.METRICS, default frequency, THD and THD+N) and an `id`, which is
+copied to every line of the response::
+
+    {"id": 1, "files": ["a.wav", "b.wav"], "metrics": ["thd", "levels"]}
+
+Each file's ChannelResults are sent as soon as the file is done, in order of
+completion, one line per channel, with the fields of ChannelResult::
+
+    {"id": 1, "filename": "b.wav", "channel": 0, "fs": 48000, ...}
+
+Files that can't be analyzed get one line with only `error` filled.  A final
+line marks the end of the response::
+
+    {"id": 1, "done": true}
+
+An invalid request gets ``{"id": ..., "error": "...", "done": true}``.  A
+line longer than LINE_LIMIT bytes gets one with an `id` of null, and no more
+requests are read from that connection.
+Several requests can be sent on one connection, without waiting for the
+previous ones to finish.
+"""
+
+import asyncio
+import json
+import multiprocessing
+import socket as socket_module
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from waveform_analysis.results import METRICS, ChannelResult, analyze_file
+
+DEFAULT_METRICS = ('frequency', 'thd', 'thdn')
+
+# Longest request line accepted, in bytes.  asyncio's default of 64 KiB is
+# only enough for a few hundred long paths.
+LINE_LIMIT = 2**24
+
+
+def _analyze(filename, metrics):
+    """
+    Analyze one file in a worker process, capturing any error
+    """
+    try:
+        results = analyze_file(filename, metrics)
+    except Exception as e:
+        results = [ChannelResult(filename, None,
+                                 error=f'{type(e).__name__}: {e}')]
+    return [result.as_dict() for result in results]
+
+
+def _parse(request):
+    """
+    Return the files and metrics of a request, or raise ValueError
+    """
+    files = request.get('files')
+    if (not isinstance(files, list) or
+            not all(isinstance(filename, str) for filename in files)):
+        raise ValueError("'files' must be a list of paths")
+
+    metrics = request.get('metrics', list(DEFAULT_METRICS))
+    if (not isinstance(metrics, list) or
+            not all(isinstance(metric, str) and metric in METRICS
+                    for metric in metrics)):
+        raise ValueError(f"Metrics not understood: {metrics}.  Choose from: "
+                         f"{', '.join(METRICS)}")
+    return files, tuple(metrics)
+
+
+class _Workers:
+    """
+    The pool of worker processes, shared by all connections to a server
+
+    If a worker process dies (from a segfault, or being killed for using too
+    much memory, for instance), the pool can't be used anymore, so it's
+    replaced with a new one of the same size.
+    """
+
+    def __init__(self, pool, size=None):
+        self.pool = pool
+        self.size = size
+
+    def replace(self, broken):
+        # Many requests see the same pool break, but only replace it once
+        if self.pool is broken:
+            self.pool = worker_pool(self.size)
+            broken.shutdown(wait=False)
+
+
+class _Connection:
+    """
+    Handles the requests from one client
+    """
+
+    def __init__(self, workers, reader, writer):
+        self.workers = workers
+        self.reader = reader
+        self.writer = writer
+        self.lock = asyncio.Lock()
+
+    async def send(self, response):
+        async with self.lock:
+            self.writer.write(json.dumps(response).encode() + b'\n')
+            await self.writer.drain()
+
+    async def handle(self):
+        jobs = set()
+        try:
+            while True:
+                try:
+                    line = await self.reader.readline()
+                except ValueError:
+                    # Longer than LINE_LIMIT.  The rest of it can't be told
+                    # apart from the next request, so stop reading.
+                    await self.send({'id': None, 'done': True,
+                                     'error': 'Invalid request: longer than '
+                                              f'{LINE_LIMIT} bytes'})
+                    break
+                if not line:
+                    break
+                if line.strip():
+                    # Run requests concurrently, as they arrive
+                    job = asyncio.ensure_future(self._request(line))
+                    jobs.add(job)
+                    job.add_done_callback(jobs.discard)
+            if jobs:
+                await asyncio.wait(jobs)
+        except ConnectionError:
+            pass
+        finally:
+            for job in jobs:
+                job.cancel()
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def _request(self, line):
+        try:
+            await self.request(line)
+        except ConnectionError:
+            pass  # Client went away
+
+    async def request(self, line):
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError('Request must be a JSON object')
+        except ValueError as e:
+            await self.send({'id': None, 'error': f'Invalid request: {e}',
+                             'done': True})
+            return
+        request_id = request.get('id')
+
+        try:
+            files, metrics = _parse(request)
+        except ValueError as e:
+            await self.send({'id': request_id, 'error': str(e),
+                             'done': True})
+            return
+
+        loop = asyncio.get_running_loop()
+        pool = self.workers.pool
+        futures = [loop.run_in_executor(pool, _analyze, filename, metrics)
+                   for filename in files]
+        try:
+            for future in asyncio.as_completed(futures):
+                for result in await future:
+                    await self.send({'id': request_id, **result})
+        except ConnectionError:
+            raise
+        except Exception as e:
+            # The pool failed, not the analysis, which catches its own errors
+            if isinstance(e, BrokenProcessPool):
+                self.workers.replace(pool)
+            for future in futures:
+                future.cancel()
+            await asyncio.gather(*futures, return_exceptions=True)
+            await self.send({'id': request_id,
+                             'error': f'{type(e).__name__}: {e}',
+                             'done': True})
+            return
+        await self.send({'id': request_id, 'done': True})
+
+
+async def start_server(pool, socket=None, host='127.0.0.1', port=None,
+                       workers=None):
+    """
+    Start serving analysis jobs, run on a pool of workers
+
+    Parameters
+    ----------
+    pool : concurrent.futures.Executor
+        Where to run the analysis, normally from worker_pool().
+    socket : str, optional
+        Path of a Unix socket to listen on.
+    host : str, optional
+        Address to listen on, if `socket` isn't given (default: localhost).
+    port : int, optional
+        TCP port to listen on, if `socket` isn't given.  0 picks a free one.
+    workers : int, optional
+        Number of worker processes in `pool` (default: number of CPUs).
+
+    Returns
+    -------
+    server : asyncio.Server
+        The running server.  Its address is in ``server.sockets``.
+
+    Notes
+    -----
+    If a worker process dies, the requests it was working on get an error,
+    and `pool` is shut down and replaced by a new worker_pool() of `workers`
+    processes, which is shut down when the program exits.
+
+    Requests longer than LINE_LIMIT bytes get an error, and the connection
+    is closed once the requests before them are done.
+    """
+    return await _start_server(_Workers(pool, workers), socket, host, port)
+
+
+async def _start_server(workers, socket, host, port):
+    async def handle(reader, writer):
+        await _Connection(workers, reader, writer).handle()
+
+    if socket is not None:
+        return await asyncio.start_unix_server(handle, path=socket,
+                                               limit=LINE_LIMIT)
+    if port is None:
+        raise ValueError('Either a socket path or a port is required')
+    return await asyncio.start_server(handle, host, port, limit=LINE_LIMIT)
+
+
+def worker_pool(workers=None):
+    """
+    Make a pool of worker processes for start_server()
+
+    Workers are started by a fork server where available, not forked from
+    the server itself, which would leave copies of the open connections in
+    them, so closed connections wouldn't be seen by clients.
+
+    Parameters
+    ----------
+    workers : int, optional
+        Number of worker processes (default: number of CPUs).
+    """
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('forkserver')
+    else:
+        context = multiprocessing.get_context('spawn')
+    return ProcessPoolExecutor(max_workers=workers, mp_context=context)
+
+
+async def serve(socket=None, host='127.0.0.1', port=None, workers=None):
+    """
+    Serve analysis jobs until cancelled
+
+    Parameters are the same as for start_server().  `workers` is the number
+    of worker processes (default: number of CPUs).
+    """
+    workers = _Workers(worker_pool(workers), workers)
+    try:
+        server = await _start_server(workers, socket, host, port)
+        async with server:
+            await server.serve_forever()
+    finally:
+        workers.pool.shutdown()
+
+
+def submit(files, metrics=DEFAULT_METRICS, *, socket=None, host='127.0.0.1',
+           port=None):
+    """
+    Send a job to a running server, and yield its results as they arrive
+
+    Parameters
+    ----------
+    files : iterable of str
+        Paths of the files to analyze, as seen by the server.
+    metrics : iterable of str, optional
+        Names of measurements to make, from results.METRICS.
+    socket : str, optional
+        Path of the server's Unix socket.
+    host, port : optional
+        Address of the server, if `socket` isn't given.
+
+    Yields
+    ------
+    result : ChannelResult
+        Results of each channel of each file, in order of completion.
+    """
+    if socket is not None:
+        connection = socket_module.socket(socket_module.AF_UNIX)
+        connection.connect(socket)
+    else:
+        connection = socket_module.create_connection((host, port))
+
+    with connection, connection.makefile('rb') as stream:
+        request = {'files': list(files), 'metrics': list(metrics)}
+        connection.sendall(json.dumps(request).encode() + b'\n')
+        for line in stream:
+            response = json.loads(line)
+            response.pop('id')
+            if response.pop('done', False):
+                if 'error' in response:
+                    raise ValueError(response['error'])
+                return
+            yield ChannelResult(**response)
+    raise ConnectionError('Server closed the connection before finishing')
@@ -1,10 +1,17 @@
+import functools
+
 import numpy as np
-from numpy import argmax, concatenate, log, mean, zeros
-from scipy.fft import irfft, next_fast_len, rfft
+from numpy import argmax, log, mean
+from scipy.fft import irfft, next_fast_len, rfft, rfftfreq
+from scipy.signal import freqz_zpk
 from scipy.signal.windows import general_cosine
 
-from waveform_analysis._common import parabolic, rms_flat
-from waveform_analysis.weighting_filters.ABC_weighting import A_weight
+from waveform_analysis._common import parabolic_batch
+from waveform_analysis.profiling import stage
+from waveform_analysis.weighting_filters.ABC_weighting import (A_weight,
+                                                               A_weighting)
+from waveform_analysis.weighting_filters.ITU_R_468_weighting import (
+    ITU_R_468_weight, ITU_R_468_weighting)
 
 # This requires accurately measuring frequency component amplitudes, so use a
 # flat-top window (https://holometer.fnal.gov/GH_FFT.pdf)
@@ -39,30 +46,146 @@ flattops = {
                 0.000624544650, 0.000019808998, 0.000000132974],
 }
 
+# Number of windows of different types and lengths remembered by _flattop()
+WINDOW_CACHE_SIZE = 16
+
+
+def _flattop(name, N, dtype=np.float64):
+    """
+    Return the flat-top window called `name` in `flattops`, of length N and
+    type dtype
+
+    Synthesizing a many-term cosine sum costs about as much as the FFT, so
+    windows are cached by name, length and type, and returned read-only.
+    """
+    if name not in flattops:
+        raise ValueError(f"Window '{name}' not understood.  Choose one of: "
+                         f"{', '.join(flattops)}")
+    return _cached_flattop(name, N, np.dtype(dtype))
+
+
+@functools.lru_cache(maxsize=WINDOW_CACHE_SIZE)
+def _cached_flattop(name, N, dtype):
+    window = general_cosine(N, flattops[name]).astype(dtype, copy=False)
+    window.flags.writeable = False
+    return window
+
+
+@functools.lru_cache(maxsize=WINDOW_CACHE_SIZE)
+def _weighting_power(weight, fs, N):
+    """
+    Return the power response of a digital weighting filter at the bins of
+    an rfft of length N, cached and read-only
+    """
+    if weight == 'A':
+        z, p, k = A_weighting(fs, output='zpk')
+    elif weight == '468':
+        z, p, k = ITU_R_468_weighting(fs, output='zpk')
+    w, h = freqz_zpk(z, p, k, worN=rfftfreq(N, 1/fs), fs=fs)
+    power = abs(h)**2
+    power.flags.writeable = False
+    return power
+
+
+# Bins on either side of each expected harmonic to search for its peak
+HARMONIC_SEARCH = 2
+
+
+def _take_bins(f, bins):
+    """
+    Return f[..., bins] for each vector of f, with zeros for bins outside it
 
-def THDN(signal, fs, *, freq=None, weight=None):
+    `bins` has the shape of f without the last axis, plus any number of
+    extra axes.
+    """
+    flat = bins.reshape(bins.shape[:f.ndim - 1] + (-1,))
+    inside = (0 <= flat) & (flat < f.shape[-1])
+    values = np.take_along_axis(f, np.clip(flat, 0, f.shape[-1] - 1), axis=-1)
+    return (values * inside).reshape(bins.shape)
+
+
+def _harmonic_amplitudes(f, true_i, harmonics, estimate, window, N):
+    """
+    Measure the amplitude of each harmonic in a magnitude spectrum f of a
+    signal of length N, windowed with `window`, with fundamental at
+    fractional bin true_i.
+
+    Each harmonic's peak is searched for within HARMONIC_SEARCH bins of where
+    it is expected, all at once.  Then its amplitude is estimated by
+    parabolic interpolation of the peak, or from the total power in the
+    window's main lobe around it (estimate='sum').  Both are in units of the
+    peak of an on-bin sinusoid, so they can be compared with plain bin
+    magnitudes.
+    """
+    search = np.arange(-HARMONIC_SEARCH, HARMONIC_SEARCH + 1)
+    expected = np.rint(true_i[..., np.newaxis] * harmonics).astype(int)
+    values = _take_bins(f, expected[..., np.newaxis] + search)
+    offset = argmax(values, axis=-1)
+
+    if estimate == 'parabolic':
+        # Keep the neighbors of the peak inside the searched bins
+        offset = np.clip(offset, 1, len(search) - 2)
+        return parabolic_batch(values, offset)[1]
+    elif estimate == 'sum':
+        # A cosine-sum window with K terms has a main lobe ±K bins wide
+        width = len(flattops[window])
+        lobe = np.arange(-width + 1, width)
+        peak = expected + search[offset]
+        power = np.sum(_take_bins(f, peak[..., np.newaxis] + lobe)**2,
+                       axis=-1)
+        # Sum of squared bins vs squared peak bin of a sinusoid, by Parseval
+        w = _flattop(window, N)
+        return np.sqrt(power * np.sum(w)**2 / (N * np.sum(w**2)))
+    else:
+        raise ValueError('Amplitude estimate not understood.')
+
+
+def THDN(signal, fs, *, freq=None, weight=None, window='HFT248D',
+         method='time', axis=-1, dtype=np.float64):
     """
     Calculate the Total Harmonic Distortion + Noise (THD+N) of a signal.
 
     Parameters
     ----------
     signal : array_like
-        Input signal to analyze.
+        Input signal to analyze.  If multidimensional, each 1-D slice along
+        `axis` is analyzed separately, in one vectorized pass.
     fs : float
         Sampling frequency of the signal in Hz, used for A-weighting.
-    freq : float, optional
-        Fundamental frequency in Hz. If None, it will be detected automatically
-        from the signal's spectrum (default: None).
-    weight : {'A', None}, optional
+    freq : float or array_like, optional
+        Fundamental frequency in Hz, or one per signal. If None, it will be
+        detected automatically from each signal's spectrum (default: None).
+    weight : {'A', '468', None}, optional
         Weighting type for the noise measurement:
 
         - 'A' : Apply A-weighting to the residual noise.
+        - '468' : Apply ITU-R 468 weighting to the residual noise.
         - None : No weighting applied (default).
+    window : str, optional
+        Name of the flat-top window in `flattops` to use
+        (default: 'HFT248D').
+    method : {'time', 'spectral'}, optional
+        How to measure the residual noise:
+
+        - 'time' : Transform it back to the time domain, filter it with the
+          weighting filter, and measure its RMS (default).
+        - 'spectral' : Sum the power of the remaining frequency bins
+          directly (Parseval's theorem), multiplied by the weighting filter's
+          power response.  This skips the inverse FFT and filtering, and
+          ignores the filter's start-up transient.
+    axis : int, optional
+        Axis of `signal` along which time runs (default: -1).
+    dtype : dtype, optional
+        Floating-point type to compute in.  np.float32 halves the memory use
+        and traffic, and still resolves distortion and noise down to about
+        -140 dB (default: np.float64).
 
     Returns
     -------
-    thdn : float
-        The THD+N of the input signal as a dimensionless ratio.
+    thdn : float or ndarray
+        The THD+N of the input signal as a dimensionless ratio.  For
+        multidimensional input, an array of the shape of `signal` without
+        `axis`.
 
     Notes
     -----
@@ -94,72 +217,97 @@ def THDN(signal, fs, *, freq=None, weight=None):
     THD+N ratio: 10.0%
     """
     # Get rid of DC and window the signal
-    signal = np.asarray(signal) + 0.0  # Float-like array
-    # TODO: Do this in the frequency domain, and take any skirts with it?
-    signal -= mean(signal)
+    with stage('thdn.window', signal):
+        signal = np.moveaxis(np.array(signal, dtype), axis, -1)
+        # TODO: Do this in the frequency domain, and take any skirts with it?
+        signal -= mean(signal, axis=-1, keepdims=True)
 
-    window = general_cosine(len(signal), flattops['HFT248D'])
-    windowed = signal * window
-    del signal
+        windowed = signal * _flattop(window, signal.shape[-1], dtype)
+        del signal
 
     # Zero pad to nearest power of two
-    new_len = next_fast_len(len(windowed))
-    windowed = concatenate((windowed, zeros(new_len - len(windowed))))
+    new_len = next_fast_len(windowed.shape[-1])
 
     # Measure the total signal before filtering but after windowing
-    total_rms = rms_flat(windowed)
+    # (Zero padding adds nothing to the sum, but counts in the mean)
+    total_rms = np.sqrt(np.sum(windowed**2, axis=-1) / new_len)
 
     # Find the peak of the frequency spectrum (fundamental frequency)
-    f = rfft(windowed)
-    if freq is None:
-        i = argmax(abs(f))
-        true_i = parabolic(log(abs(f)), i)[0]
-    else:
-        # Calculate the bin index for the given frequency
-        true_i = freq * len(windowed) / fs
-        i = int(round(true_i))
+    with stage('thdn.rfft', windowed):
+        f = rfft(windowed, new_len)
+    del windowed
+    with stage('thdn.peak_search', f):
+        if freq is None:
+            i = argmax(abs(f), axis=-1)
+            # Bins far from the peak can be 0, especially in float32
+            with np.errstate(divide='ignore'):
+                true_i = parabolic_batch(log(abs(f)), i)[0]
+        else:
+            # Calculate the bin index for the given frequency
+            true_i = np.broadcast_to(np.asarray(freq) * new_len / fs,
+                                     f.shape[:-1])
 
     # Filter out fundamental by throwing away values ±10%
-    lowermin = int(true_i * 0.9)
-    uppermin = int(true_i * 1.1)
-    f[lowermin: uppermin] = 0
-    # TODO: Zeroing FFT bins is bad
+    with stage('thdn.notch', f):
+        lowermin = (true_i * 0.9).astype(int)[..., np.newaxis]
+        uppermin = (true_i * 1.1).astype(int)[..., np.newaxis]
+        bins = np.arange(f.shape[-1])
+        f[(lowermin <= bins) & (bins < uppermin)] = 0
+        # TODO: Zeroing FFT bins is bad
+
+    if weight not in {None, 'A', '468'}:
+        raise ValueError('Weighting not understood')
+
+    if method == 'spectral':
+        # Mean square of the noise from its spectrum.  Bins other than DC
+        # and Nyquist stand for both positive and negative frequencies.
+        with stage('thdn.spectral_noise', f):
+            power = abs(f)**2
+            if weight is not None:
+                power *= _weighting_power(weight, fs, new_len)
+            power[..., 1:(new_len + 1) // 2] *= 2
+            return np.sqrt(np.sum(power, axis=-1) / new_len**2) / total_rms
+    elif method != 'time':
+        raise ValueError(f"'{method}' is not a valid method.")
 
     # Transform noise back into the time domain and measure it
-    noise = irfft(f)
-    # TODO: RMS and A-weighting in frequency domain?  Parseval?
-
-    if weight is None:
-        pass
-    elif weight == 'A':
-        # Apply A-weighting to residual noise (Not normally used for
-        # distortion, but used to measure dynamic range with -60 dBFS signal,
-        # for instance)
-        noise = A_weight(noise, fs)
-        # TODO: filtfilt? tail end of filter?
-    else:
-        raise ValueError('Weighting not understood')
+    with stage('thdn.irfft', f):
+        noise = irfft(f, new_len)
+
+    with stage('thdn.weighting', noise):
+        if weight is None:
+            pass
+        elif weight == 'A':
+            # Apply A-weighting to residual noise (Not normally used for
+            # distortion, but used to measure dynamic range with -60 dBFS
+            # signal, for instance)
+            noise = A_weight(noise, fs, dtype)
+            # TODO: filtfilt? tail end of filter?
+        elif weight == '468':
+            noise = ITU_R_468_weight(noise, fs, dtype)
 
     # TODO: Return a dict or list of frequency, THD+N?
-    return rms_flat(noise) / total_rms
+    return np.sqrt(mean(noise**2, axis=-1)) / total_rms
 
 
 thd_n = THDN
 
 
-def THD(signal, fs, *, freq=None, ref='f', verbose=False):
+def THD(signal, fs, *, freq=None, ref='f', verbose=False,
+        window='HFT248D', estimate='bin', axis=-1, dtype=np.float64):
     """
     Calculate the Total Harmonic Distortion (THD) of a signal.
 
     Parameters
     ----------
     signal : array_like
-        Input signal to analyze.
+        Input signal to analyze.  If multidimensional, each 1-D slice along
+        `axis` is analyzed separately, in one vectorized pass.
     fs : float
         Sampling frequency of the signal in Hz.
-    freq : float, optional
-        Fundamental frequency in Hz. If None, it will be detected automatically
-        from the signal's spectrum (default: None).
+    freq : float or array_like, optional
+        Fundamental frequency in Hz, or one per signal. If None, it will be
+        detected automatically from each signal's spectrum (default: None).
     ref : {'r', 'f'}, optional
         Reference type for the THD calculation:
 
@@ -167,11 +315,32 @@ def THD(signal, fs, *, freq=None, ref='f', verbose=False):
         - 'f' : Use the fundamental amplitude as reference (default).
     verbose : bool, optional
         If True, print detailed analysis information (default: False).
+    window : str, optional
+        Name of the flat-top window in `flattops` to use
+        (default: 'HFT248D').
+    estimate : {'bin', 'parabolic', 'sum'}, optional
+        How to measure the amplitude of the fundamental and harmonics:
+
+        - 'bin' : Magnitude of the FFT bin at a multiple of the
+          fundamental's bin (default).  The error grows with harmonic number
+          when the fundamental falls between bins.
+        - 'parabolic' : Find the peak near the fractional bin where each
+          harmonic is expected and interpolate its height.
+        - 'sum' : Find the peak as with 'parabolic', and measure the total
+          power in the window's main lobe around it.  The most accurate,
+          but harmonics must be spaced further apart than the main lobe
+          width (twice the number of window terms, in bins).
+    axis : int, optional
+        Axis of `signal` along which time runs (default: -1).
+    dtype : dtype, optional
+        Floating-point type to compute in, as for THDN().
 
     Returns
     -------
-    thd : float
-        The THD of the input signal as a dimensionless ratio.
+    thd : float or ndarray
+        The THD of the input signal as a dimensionless ratio.  For
+        multidimensional input, an array of the shape of `signal` without
+        `axis`.
 
     Notes
     -----
@@ -202,52 +371,69 @@ def THD(signal, fs, *, freq=None, ref='f', verbose=False):
     THD: 10.000000%
     """
     # Get rid of DC and window the signal
-    signal = np.asarray(signal) + 0.0  # Float-like array
-    # TODO: Do this in the frequency domain, and take any skirts with it?
-    signal -= mean(signal)
+    with stage('thd.window', signal):
+        signal = np.moveaxis(np.array(signal, dtype), axis, -1)
+        # TODO: Do this in the frequency domain, and take any skirts with it?
+        signal -= mean(signal, axis=-1, keepdims=True)
 
-    window = general_cosine(len(signal), flattops['HFT248D'])
-    windowed = signal * window
-    del signal
+        N = signal.shape[-1]
+        windowed = signal * _flattop(window, N, dtype)
+        del signal
 
     # Find the peak of the frequency spectrum (fundamental frequency)
-    f = rfft(windowed)
-    if freq is None:
-        i = argmax(abs(f))
-        true_i = parabolic(log(abs(f)), i)[0]
-        frequency = fs * (true_i / len(windowed))
-    else:
-        frequency = freq
-        true_i = frequency * len(windowed) / fs
-        i = int(round(true_i))
-
-    if verbose:
-        print(f'Frequency: {frequency:f} Hz')
-        print(f'fundamental amplitude: {abs(f[i]):.3f}')
-
-    # Find the values for the harmonics.  Includes harmonic peaks
-    # only, by definition
-    # TODO: Should peak-find near each one, not just assume that fundamental
-    # was perfectly estimated.
-    num_harmonics = int((fs/2)/frequency)
-    harmonic_amplitudes = []
-    for h in range(2, num_harmonics + 1):
-        freq = frequency * h
-        ampl = abs(f[i * h])
-        harmonic_amplitudes.append(ampl)
-        if verbose:
-            print(f'Harmonic {h} at {freq:.3f} Hz: {ampl:.3f}')
-
-    THD = np.sqrt(sum(h**2 for h in harmonic_amplitudes))
+    with stage('thd.rfft', windowed):
+        f = abs(rfft(windowed))
+    del windowed
+    with stage('thd.peak_search', f):
+        if freq is None:
+            i = argmax(f, axis=-1)
+            # Bins far from the peak can be 0, especially in float32
+            with np.errstate(divide='ignore'):
+                true_i = parabolic_batch(log(f), i)[0]
+            frequency = fs * (true_i / N)
+        else:
+            frequency = np.broadcast_to(freq, f.shape[:-1])
+            true_i = frequency * N / fs
+            i = np.round(true_i).astype(int)
+
+    with stage('thd.harmonics', f):
+        # Find the values for the harmonics.  Includes harmonic peaks
+        # only, by definition
+        num_harmonics = ((fs/2)/frequency).astype(int)
+        h = np.arange(2, np.max(num_harmonics, initial=1) + 1)
+        if estimate == 'bin':
+            fundamental = np.take_along_axis(f, i[..., np.newaxis],
+                                             axis=-1)[..., 0]
+            harmonic_bins = i[..., np.newaxis] * h
+            valid = ((h <= num_harmonics[..., np.newaxis]) &
+                     (harmonic_bins < f.shape[-1]))
+            harmonic_amplitudes = np.take_along_axis(
+                f, np.where(valid, harmonic_bins, 0), axis=-1) * valid
+        else:
+            amplitudes = _harmonic_amplitudes(f, np.asarray(true_i),
+                                              np.arange(1, len(h) + 2),
+                                              estimate, window, N)
+            fundamental = amplitudes[..., 0]
+            valid = h <= num_harmonics[..., np.newaxis]
+            harmonic_amplitudes = amplitudes[..., 1:] * valid
+
+    THD = np.sqrt(np.sum(harmonic_amplitudes**2, axis=-1))
     if ref.lower() == 'f':
-        THD /= abs(f[i])
+        THD /= fundamental
     elif ref.lower() == 'r':
-        THD /= np.sqrt(abs(f[i])**2 + THD**2)
+        THD /= np.sqrt(fundamental**2 + THD**2)
     else:
         raise ValueError('Reference argument not understood.')
 
     if verbose:
-        print(f'\nTHD: {THD * 100:f}%')
+        for n in np.ndindex(THD.shape):
+            print(f'Frequency: {frequency[n]:f} Hz')
+            print(f'fundamental amplitude: {fundamental[n]:.3f}')
+            for harmonic, ampl in zip(h[valid[n]],
+                                      harmonic_amplitudes[n][valid[n]]):
+                print(f'Harmonic {harmonic} at {frequency[n] * harmonic:.3f} '
+                      f'Hz: {ampl:.3f}')
+            print(f'\nTHD: {THD[n] * 100:f}%')
     return THD
 
 
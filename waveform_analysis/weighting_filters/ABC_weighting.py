@@ -20,16 +20,21 @@ precision (type 1) sound level meter."
 
 import numpy as np
 from numpy import log10, pi
-from scipy.signal import bilinear_zpk, freqs, sosfilt, zpk2sos, zpk2tf
+from scipy.signal import bilinear_zpk, freqs, zpk2sos, zpk2tf
 
-__all__ = ['ABC_weighting', 'A_weighting', 'A_weight']
+from ..profiling import stage
+from ._filter_design import _memoize, _sosfilt, _StreamingFilter
 
+__all__ = ['ABC_weighting', 'A_weighting', 'A_weight', 'AWeightFilter']
 
+
+@_memoize
 def ABC_weighting(curve='A'):
     """
     Design of an analog weighting filter with A, B, or C curve.
 
-    Returns zeros, poles, gain of the filter.
+    Returns zeros, poles, gain of the filter.  Designs are cached (see
+    `filter_cache_info()`).
 
     Examples
     --------
@@ -100,6 +105,7 @@ def ABC_weighting(curve='A'):
     return np.array(z), np.array(p), k
 
 
+@_memoize
 def A_weighting(fs, output='ba'):
     """
     Design of a digital A-weighting filter.
@@ -109,6 +115,9 @@ def A_weighting(fs, output='ba'):
     Warning: fs should normally be higher than 20 kHz. For example,
     fs = 48000 yields a class 1-compliant filter.
 
+    Designs are cached by sampling frequency and output type (see
+    `filter_cache_info()`), so repeated calls are cheap.
+
     Parameters
     ----------
     fs : float
@@ -150,7 +159,7 @@ def A_weighting(fs, output='ba'):
         raise ValueError(f"'{output}' is not a valid output form.")
 
 
-def A_weight(signal, fs):
+def A_weight(signal, fs, dtype=np.float64):
     """
     Return the given signal after passing through a digital A-weighting filter
 
@@ -158,14 +167,49 @@ def A_weight(signal, fs):
         Input signal, with time as dimension
     fs : float
         Sampling frequency
+    dtype : dtype, optional
+        Floating-point type of the output, such as np.float32 to halve
+        memory use (default: np.float64)
     """
     # TODO: Upsample signal high enough that filter response meets Type 0
     # limits.  A passes if fs >= 260 kHz, but not at typical audio sample
     # rates. So upsample 48 kHz by 6 times to get an accurate measurement?
     # TODO: Also this could just be a measurement function that doesn't
     # save the whole filtered waveform.
-    sos = A_weighting(fs, output='sos')
-    return sosfilt(sos, signal)
+    with stage('A_weight.design'):
+        sos = A_weighting(fs, output='sos')
+    with stage('A_weight.filter', signal):
+        return _sosfilt(sos, signal, dtype)
+
+
+class AWeightFilter(_StreamingFilter):
+    """
+    Digital A-weighting filter that can process a signal in blocks
+
+    The filter is designed once, and its state is carried from one call of
+    `process()` to the next, so there are no transients at block edges, and
+    filtering a signal block by block gives the same result as `A_weight()`
+    on the whole thing.
+
+    Parameters
+    ----------
+    fs : float
+        Sampling frequency
+
+    Examples
+    --------
+    A-weighted level of a long stereo file, without loading it all at once:
+
+    >>> from waveform_analysis._common import blocks, info
+    >>> a_filter = AWeightFilter(info('long file.wav')['fs'])
+    >>> total = 0
+    >>> for block in blocks('long file.wav', 65536):
+    ...     total += np.sum(a_filter.process(block)**2, axis=0)
+    """
+
+    def __init__(self, fs):
+        super().__init__(A_weighting(fs, output='sos'))
+        self.fs = fs
 
 
 def _derive_coefficients():
@@ -10,11 +10,17 @@ http://www.beis.de/Elektronik/AudioMeasure/WeightingFilters.html#CCIR
 https://en.wikipedia.org/wiki/ITU-R_468_noise_weighting
 """
 
+import math
+
+import numpy as np
 from numpy import pi
-from scipy.signal import bilinear_zpk, freqs, sosfilt, zpk2sos, zpk2tf
+from scipy.signal import bilinear_zpk, freqs, zpk2sos, zpk2tf
+
+from ..profiling import stage
+from ._filter_design import _memoize, _sosfilt, _StreamingFilter
 
 __all__ = ['ITU_R_468_weighting_analog', 'ITU_R_468_weighting',
-           'ITU_R_468_weight']
+           'ITU_R_468_weight', 'ITU_R_468_WeightFilter', 'QuasiPeakDetector']
 
 
 def ITU_R_468_weighting_analog():
@@ -39,14 +45,21 @@ def ITU_R_468_weighting_analog():
     return z, p, k
 
 
+@_memoize
 def ITU_R_468_weighting(fs, output='ba'):
     """
     Return ITU-R 468 digital weighting filter transfer function
 
+    Designs are cached by sampling frequency and output type (see
+    `filter_cache_info()`), so repeated calls are cheap.
+
     Parameters
     ----------
     fs : float
         Sampling frequency
+    output : {'ba', 'zpk', 'sos'}, optional
+        Type of output:  numerator/denominator ('ba'), pole-zero ('zpk'), or
+        second-order sections ('sos'). Default is 'ba'.
 
     Examples
     --------
@@ -78,7 +91,7 @@ def ITU_R_468_weighting(fs, output='ba'):
         raise ValueError(f"'{output}' is not a valid output form.")
 
 
-def ITU_R_468_weight(signal, fs):
+def ITU_R_468_weight(signal, fs, dtype=np.float64):
     """
     Return the given signal after passing through an 468-weighting filter
 
@@ -86,10 +99,147 @@ def ITU_R_468_weight(signal, fs):
         Input signal
     fs : float
         Sampling frequency
+    dtype : dtype, optional
+        Floating-point type of the output, such as np.float32 to halve
+        memory use (default: np.float64)
+    """
+
+    with stage('ITU_R_468_weight.design'):
+        sos = ITU_R_468_weighting(fs, output='sos')
+    with stage('ITU_R_468_weight.filter', signal):
+        return _sosfilt(sos, signal, dtype)
+
+
+class ITU_R_468_WeightFilter(_StreamingFilter):
+    """
+    Digital ITU-R 468 weighting filter that can process a signal in blocks
+
+    The filter is designed once, and its state is carried from one call of
+    `process()` to the next, so filtering a signal block by block gives the
+    same result as `ITU_R_468_weight()` on the whole thing.  2-D blocks of
+    shape (samples, channels) filter each channel independently.
+
+    Parameters
+    ----------
+    fs : float
+        Sampling frequency
+    """
+
+    def __init__(self, fs):
+        super().__init__(ITU_R_468_weighting(fs, output='sos'))
+        self.fs = fs
+
+
+class QuasiPeakDetector:
+    """
+    ITU-R 468 quasi-peak rectifier and meter ballistics
+
+    The signal is full-wave rectified and passed through two cascaded peak
+    detectors, each with a fast attack and a slower exponential decay.  The
+    state of both is carried from one call of `process()` to the next, so
+    arbitrarily long signals can be metered in blocks.
+
+    Tone bursts read within the tolerances of the standard at 44.1 kHz and
+    above.  At lower sampling rates, a sine wave has few samples per cycle,
+    so its reading is a little high (about 2.5% for 1 kHz at 8 kHz).
+
+    Parameters
+    ----------
+    fs : float
+        Sampling frequency
+
+    Attributes
+    ----------
+    peak : float or ndarray or None
+        Highest reading so far, for each channel of 2-D blocks.
+
+    Examples
+    --------
+    468-weighted quasi-peak noise reading of a long file:
+
+    >>> from waveform_analysis._common import blocks, info
+    >>> fs = info('noise floor.wav')['fs']
+    >>> weighting = ITU_R_468_WeightFilter(fs)
+    >>> detector = QuasiPeakDetector(fs)
+    >>> for block in blocks('noise floor.wav', 65536):
+    ...     detector.process(weighting.process(block))
+    >>> print(20*np.log10(detector.peak))
     """
 
-    sos = ITU_R_468_weighting(fs, output='sos')
-    return sosfilt(sos, signal)
+    # Attack and decay time constants of the two stages, in seconds, fitted
+    # to the tone burst readings of Rec. ITU-R BS.468-4 Table 2
+    attack1 = 0.0035
+    decay1 = 0.30
+    attack2 = 0.052
+    decay2 = 1.5
+
+    # Calibrates the reading so a steady sine wave reads its peak amplitude
+    gain = 1.062
+
+    def __init__(self, fs):
+        self.fs = fs
+        self.reset()
+
+    def process(self, block):
+        """
+        Return the meter reading for each sample of the next block
+
+        Parameters
+        ----------
+        block : array_like
+            Next samples of the (already weighted) signal, with time as the
+            first dimension.  2-D blocks of shape (samples, channels) are
+            metered independently.
+
+        Returns
+        -------
+        reading : ndarray
+            Quasi-peak reading after each sample, of the same shape.
+        """
+        block = np.asarray(block, dtype=float)
+        rectified = np.abs(block).reshape(len(block), -1)
+        if self.state is None:
+            self.state = np.zeros((2, rectified.shape[1]))
+
+        # Exact step responses of the exponential charge and decay, so the
+        # ballistics don't depend on the sampling rate
+        a1 = -math.expm1(-1 / (self.attack1 * self.fs))
+        d1 = math.exp(-1 / (self.decay1 * self.fs))
+        a2 = -math.expm1(-1 / (self.attack2 * self.fs))
+        d2 = math.exp(-1 / (self.decay2 * self.fs))
+
+        reading = np.empty_like(rectified)
+        for channel in range(rectified.shape[1]):
+            # Inherently sequential, so use Python floats, which are much
+            # faster than indexing NumPy arrays one sample at a time
+            z1, z2 = self.state[:, channel].tolist()
+            out = []
+            for x in rectified[:, channel].tolist():
+                if x > z1:
+                    z1 += a1 * (x - z1)
+                else:
+                    z1 *= d1
+                if z1 > z2:
+                    z2 += a2 * (z1 - z2)
+                else:
+                    z2 *= d2
+                out.append(z2)
+            reading[:, channel] = out
+            self.state[:, channel] = z1, z2
+
+        reading *= self.gain
+        if len(reading):
+            highest = reading.max(axis=0).reshape(block.shape[1:])
+            self.peak = (highest if self.peak is None else
+                         np.maximum(self.peak, highest))
+        return reading.reshape(block.shape)
+
+    def reset(self):
+        """
+        Return the meter to zero, to start measuring a new signal
+        """
+        self.state = None
+        self.peak = None
 
 
 if __name__ == '__main__':
@@ -1,2 +1,3 @@
 from .ABC_weighting import *
 from .ITU_R_468_weighting import *
+from ._filter_design import clear_filter_cache, filter_cache_info
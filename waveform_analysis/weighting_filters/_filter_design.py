@@ -1,3 +1,99 @@
+import functools
+import inspect
+
+import numpy as np
+from scipy.signal import sosfilt
+
+from ..profiling import stage
+
+# Number of designs remembered by each filter design function
+CACHE_SIZE = 64
+
+# Number of samples filtered at a time by _sosfilt() into less precise types
+FILTER_BLOCKSIZE = 2**16
+
+_caches = {}
+
+
+def _read_only(design):
+    """
+    Make the arrays of a filter design read-only, so the cached copy can't be
+    modified
+    """
+    if isinstance(design, np.ndarray):
+        design.flags.writeable = False
+    elif isinstance(design, tuple):
+        for part in design:
+            _read_only(part)
+    return design
+
+
+def _copy(design):
+    """
+    Copy the arrays of a cached filter design
+    """
+    if isinstance(design, np.ndarray):
+        return design.copy()
+    elif isinstance(design, tuple):
+        return tuple(_copy(part) for part in design)
+    return design
+
+
+def _memoize(design):
+    """
+    Decorator to remember the results of a filter design function
+
+    Results are keyed by the function's arguments (curve, sampling frequency,
+    output form, ...) with defaults filled in, and kept read-only in a
+    bounded, thread-safe LRU cache.  Callers get copies, since SciPy's
+    filtering functions don't accept read-only coefficients, and copying a
+    few coefficients is far cheaper than designing the filter again.
+    """
+    signature = inspect.signature(design)
+
+    @functools.lru_cache(maxsize=CACHE_SIZE)
+    def cached(*args):
+        return _read_only(design(*args))
+
+    @functools.wraps(design)
+    def wrapper(*args, **kwargs):
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        return _copy(cached(*bound.args))
+
+    _caches[design.__name__] = cached
+    return wrapper
+
+
+def filter_cache_info():
+    """
+    Return hit/miss statistics of the cache of designed weighting filters
+
+    Returns
+    -------
+    info : dict
+        For each filter design function name, a named tuple of
+        (hits, misses, maxsize, currsize), like functools.lru_cache's
+        cache_info().
+
+    Examples
+    --------
+    >>> sos = A_weighting(48000, 'sos')
+    >>> sos = A_weighting(48000, 'sos')
+    >>> filter_cache_info()['A_weighting']
+    CacheInfo(hits=1, misses=1, maxsize=64, currsize=1)
+    """
+    return {name: cached.cache_info() for name, cached in _caches.items()}
+
+
+def clear_filter_cache():
+    """
+    Forget all cached weighting filter designs and reset their statistics
+    """
+    for cached in _caches.values():
+        cached.cache_clear()
+
+
 def _relative_degree(z, p):
     """
     Return relative degree of transfer function from zeros and poles
@@ -8,3 +104,66 @@ def _relative_degree(z, p):
                          "Must have at least as many poles as zeros.")
     else:
         return degree
+
+
+def _sosfilt(sos, signal, dtype=np.float64):
+    """
+    Filter a signal along its last axis with sosfilt(), returning `dtype`
+
+    The filter always runs in float64, since the coefficients of sections
+    with poles near DC lose too much precision in float32.  For other types,
+    the signal is filtered in blocks into the output, carrying the filter
+    state, so no full-size float64 array is made.
+    """
+    dtype = np.dtype(dtype)
+    if dtype == np.float64:
+        return sosfilt(sos, signal)
+    signal = np.asarray(signal)
+    out = np.empty(signal.shape, dtype)
+    zi = np.zeros((len(sos),) + signal.shape[:-1] + (2,))
+    for start in range(0, signal.shape[-1], FILTER_BLOCKSIZE):
+        block = np.s_[..., start:start + FILTER_BLOCKSIZE]
+        out[block], zi = sosfilt(sos, signal[block], zi=zi)
+    return out
+
+
+class _StreamingFilter:
+    """
+    Digital filter in second-order sections that carries its state from one
+    block of a signal to the next, so a long signal can be filtered in pieces
+    with the same result as filtering it all at once.
+    """
+
+    def __init__(self, sos):
+        self.sos = sos
+        self.zi = None
+
+    def process(self, block):
+        """
+        Filter the next block of the signal
+
+        Parameters
+        ----------
+        block : array_like
+            Next samples of the signal, with time as the first dimension.
+            2-D blocks of shape (samples, channels) filter each channel
+            independently.  Every block must have the same number of
+            channels.
+
+        Returns
+        -------
+        out : ndarray
+            Filtered block, of the same shape.
+        """
+        block = np.asarray(block)
+        if self.zi is None:
+            self.zi = np.zeros((len(self.sos), 2) + block.shape[1:])
+        with stage(f'{type(self).__name__}.process', block):
+            out, self.zi = sosfilt(self.sos, block, axis=0, zi=self.zi)
+        return out
+
+    def reset(self):
+        """
+        Forget the filter state, to start filtering a new signal
+        """
+        self.zi = None